@@ -1,7 +1,18 @@
+import time
+from typing import Callable, Optional
+
 import psutil
 
+from config import COLLECTORS, COLLECTOR_INTERVALS, TOP_PROCESSES, OVERHEAD_BUDGET
+from instrumentation import register_callback
+from stats import CounterRate
+
 # Initialize CPU measurement (first call returns 0)
 psutil.cpu_percent()
+psutil.cpu_percent(percpu=True)
+
+# (name, labels, value) triples reported alongside the fixed metrics.
+Series = tuple[str, dict, float]
 
 
 def collect_metrics() -> dict:
@@ -17,3 +28,208 @@ def collect_metrics() -> dict:
         "network_in": net.bytes_recv,
         "network_out": net.bytes_sent,
     }
+
+
+class Collector:
+    def __init__(self, name: str, fn: Callable[[float], list], interval: float):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.next_run = 0.0
+        self.runs = 0
+        self.seconds = 0.0
+
+
+class CollectorRegistry:
+    """Runs optional collectors, each on its own interval, and tracks their cost.
+
+    Every run also reports its own duration as `agent.collector.seconds`,
+    so the backend sees what each collector costs. When the combined cost
+    exceeds `budget` (a fraction of one CPU) a warning is printed.
+    """
+
+    def __init__(self, budget: float):
+        self.collectors: dict[str, Collector] = {}
+        self.budget = budget
+        self.started = time.monotonic()
+        self.seconds = 0.0
+        self._over_budget = False
+
+    def register(self, name: str, interval: float):
+        def decorator(fn: Callable[[float], list]):
+            self.collectors[name] = Collector(name, fn, COLLECTOR_INTERVALS.get(name, interval))
+            return fn
+        return decorator
+
+    def timed(self, name: str, started: float) -> Series:
+        elapsed = time.perf_counter() - started
+        self.seconds += elapsed
+        return ("agent.collector.seconds", {"collector": name}, elapsed)
+
+    def collect(self, now: float) -> list[Series]:
+        series = []
+        for collector in self.collectors.values():
+            if collector.name not in COLLECTORS or now < collector.next_run:
+                continue
+            collector.next_run = now + collector.interval
+
+            started = time.perf_counter()
+            try:
+                series.extend(collector.fn(now))
+            except Exception as e:
+                print(f"Collector {collector.name} failed: {e}")
+            collector.runs += 1
+            series.append(self.timed(collector.name, started))
+            collector.seconds += series[-1][2]
+
+        self._check_budget(now)
+        return series
+
+    def overhead(self, now: float) -> float:
+        return self.seconds / max(now - self.started, 1e-9)
+
+    def _check_budget(self, now: float):
+        over = now - self.started > 60 and self.overhead(now) > self.budget
+        if over and not self._over_budget:
+            costs = {c.name: round(c.seconds / max(c.runs, 1) * 1000, 2) for c in self.collectors.values()}
+            print(f"Collector overhead {self.overhead(now):.1%} exceeds budget {self.budget:.1%}; ms/run: {costs}")
+        self._over_budget = over
+
+
+registry = CollectorRegistry(OVERHEAD_BUDGET)
+register_callback(
+    "nazar_agent_collector_runs_total",
+    "Optional collector runs",
+    lambda: {(c.name,): c.runs for c in registry.collectors.values()},
+    kind="counter",
+    labelnames=("collector",),
+)
+register_callback(
+    "nazar_agent_collector_seconds_total",
+    "Time spent in each optional collector",
+    lambda: {(c.name,): c.seconds for c in registry.collectors.values()},
+    kind="counter",
+    labelnames=("collector",),
+)
+register_callback(
+    "nazar_agent_collector_overhead_ratio",
+    "Collector time as a fraction of one CPU since start",
+    lambda: registry.overhead(time.monotonic()),
+)
+_counters: dict[tuple, CounterRate] = {}
+
+
+def _rate(name: str, labels: dict, value: int, now: float, seen: set) -> Optional[float]:
+    """Per-second rate of a counter since the collector's previous run."""
+    key = (name, *labels.values())
+    seen.add(key)
+    counter = _counters.setdefault(key, CounterRate())
+    counter.reset()
+    counter.add(value, now)
+    return counter.rate
+
+
+def _forget_unseen(prefix: str, seen: set):
+    """Drop `prefix` counters of devices or NICs that were not seen this pass."""
+    for key in [key for key in _counters if key[0].startswith(prefix) and key not in seen]:
+        del _counters[key]
+
+
+def _skip_device(name: str) -> bool:
+    return name.startswith(("loop", "ram", "zram")) or name == "lo"
+
+
+@registry.register("per_core_cpu", interval=1)
+def per_core_cpu(now: float) -> list[Series]:
+    return [
+        ("cpu.core.percent", {"core": str(core)}, value)
+        for core, value in enumerate(psutil.cpu_percent(percpu=True))
+    ]
+
+
+@registry.register("load", interval=5)
+def load_average(now: float) -> list[Series]:
+    load1, load5, load15 = psutil.getloadavg()
+    return [
+        ("load.1m", {}, load1),
+        ("load.5m", {}, load5),
+        ("load.15m", {}, load15),
+    ]
+
+
+@registry.register("disk_io", interval=5)
+def disk_io(now: float) -> list[Series]:
+    series = []
+    seen = set()
+    for device, counters in (psutil.disk_io_counters(perdisk=True) or {}).items():
+        if _skip_device(device):
+            continue
+        labels = {"device": device}
+        for name, value in (
+            ("disk.read_iops", counters.read_count),
+            ("disk.write_iops", counters.write_count),
+            ("disk.read_bytes_rate", counters.read_bytes),
+            ("disk.write_bytes_rate", counters.write_bytes),
+        ):
+            rate = _rate(name, labels, value, now, seen)
+            if rate is not None:
+                series.append((name, labels, rate))
+    _forget_unseen("disk.", seen)
+    return series
+
+
+@registry.register("net_io", interval=5)
+def net_io(now: float) -> list[Series]:
+    series = []
+    seen = set()
+    for nic, counters in psutil.net_io_counters(pernic=True).items():
+        if _skip_device(nic):
+            continue
+        labels = {"interface": nic}
+        for name, value in (
+            ("net.in_bytes_rate", counters.bytes_recv),
+            ("net.out_bytes_rate", counters.bytes_sent),
+            ("net.in_packets_rate", counters.packets_recv),
+            ("net.out_packets_rate", counters.packets_sent),
+            ("net.errors_rate", counters.errin + counters.errout),
+        ):
+            rate = _rate(name, labels, value, now, seen)
+            if rate is not None:
+                series.append((name, labels, rate))
+    _forget_unseen("net.", seen)
+    return series
+
+
+@registry.register("processes", interval=30)
+def top_processes(now: float) -> list[Series]:
+    # process_iter caches Process objects, so cpu_percent is measured
+    # against the previous run of this collector.
+    processes = []
+    for proc in psutil.process_iter(["pid", "name", "cpu_percent", "memory_info"]):
+        info = proc.info
+        if info["memory_info"] is None or info["cpu_percent"] is None:
+            continue
+        processes.append(info)
+
+    top = {}
+    for key in (lambda p: p["cpu_percent"], lambda p: p["memory_info"].rss):
+        for info in sorted(processes, key=key, reverse=True)[:TOP_PROCESSES]:
+            top[info["pid"]] = info
+
+    series = []
+    for info in top.values():
+        labels = {"pid": str(info["pid"]), "name": info["name"] or ""}
+        series.append(("process.cpu_percent", labels, info["cpu_percent"]))
+        series.append(("process.rss_bytes", labels, float(info["memory_info"].rss)))
+    return series
+
+
+def collect_all() -> dict:
+    """Fixed metrics plus any optional collector series that are due."""
+    now = time.monotonic()
+    started = time.perf_counter()
+    sample = collect_metrics()
+    series = [registry.timed("system", started)]
+    series.extend(registry.collect(now))
+    sample["series"] = series
+    return sample
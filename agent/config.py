@@ -6,4 +6,26 @@ load_dotenv()
 
 API_URL = os.getenv("NAZAR_API_URL", "http://localhost:8000")
 HOSTNAME = os.getenv("NAZAR_HOSTNAME", socket.gethostname())
-INTERVAL = int(os.getenv("NAZAR_INTERVAL", "10"))
\ No newline at end of file
+INTERVAL = int(os.getenv("NAZAR_INTERVAL", "10"))
+SAMPLE_PERIOD = float(os.getenv("NAZAR_SAMPLE_PERIOD", "1"))
+REPORT_QUEUE_SIZE = int(os.getenv("NAZAR_REPORT_QUEUE_SIZE", "60"))
+SPOOL_PATH = os.getenv("NAZAR_SPOOL_PATH", "nazar-spool.db")
+SPOOL_MAX_ROWS = int(os.getenv("NAZAR_SPOOL_MAX_ROWS", "8640"))
+BATCH_SIZE = int(os.getenv("NAZAR_BATCH_SIZE", "500"))
+DRAIN_RATE = float(os.getenv("NAZAR_DRAIN_RATE", "50"))
+MAX_BACKOFF = float(os.getenv("NAZAR_MAX_BACKOFF", "300"))
+WIRE_FORMAT = os.getenv("NAZAR_WIRE_FORMAT", "json")  # json | msgpack
+METRICS_PORT = int(os.getenv("NAZAR_METRICS_PORT", "0"))  # 0 disables /internal/metrics
+
+# Optional collectors and per-collector interval overrides ("processes=60,disk_io=10")
+COLLECTORS = set(filter(None, os.getenv(
+    "NAZAR_COLLECTORS", "per_core_cpu,load,disk_io,net_io,processes"
+).split(",")))
+COLLECTOR_INTERVALS = {
+    name.strip(): float(seconds)
+    for name, _, seconds in (
+        item.partition("=") for item in os.getenv("NAZAR_COLLECTOR_INTERVALS", "").split(",") if item
+    )
+}
+TOP_PROCESSES = int(os.getenv("NAZAR_TOP_PROCESSES", "5"))
+OVERHEAD_BUDGET = float(os.getenv("NAZAR_OVERHEAD_BUDGET", "0.02"))
@@ -0,0 +1,45 @@
+"""Prometheus-style metrics for the agent; see metrics_core.
+
+Only the /internal/metrics endpoint is specific to the agent: it has no
+event loop, so the endpoint is served from a thread.
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from metrics_core import (  # noqa: F401
+    CONTENT_TYPE,
+    DEFAULT_BUCKETS,
+    Counter,
+    Gauge,
+    Histogram,
+    register_callback,
+    render,
+)
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """Serve GET /internal/metrics on `port` from a daemon thread (0 disables)."""
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] == "/internal/metrics":
+                status, body = 200, render().encode()
+            else:
+                status, body = 404, b"not found\n"
+            self.send_response(status)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Serving /internal/metrics on port {port}")
+    return server
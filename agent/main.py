@@ -1,73 +1,101 @@
-import time
-import httpx
-
-from config import API_URL, HOSTNAME, INTERVAL
-from collector import collect_metrics
-
-
-def aggregate(samples: list) -> dict:
-    """Aggregate multiple 1-second samples into min/max/avg."""
-    keys = ["cpu_percent", "memory_percent", "disk_percent"]
-    result = {}
-
-    for key in keys:
-        values = [s[key] for s in samples if s[key] is not None]
-        if values:
-            prefix = key.split("_")[0]  # cpu, memory, disk
-            result[key] = sum(values) / len(values)
-            result[f"{prefix}_min"] = min(values)
-            result[f"{prefix}_max"] = max(values)
-
-    # Use latest network counters
-    result["network_in"] = samples[-1]["network_in"]
-    result["network_out"] = samples[-1]["network_out"]
-
-    return result
-
-
-def send_metrics(metrics: dict):
-    payload = {"host": HOSTNAME, **metrics}
-
-    try:
-        response = httpx.post(f"{API_URL}/metrics", json=payload, timeout=10)
-        response.raise_for_status()
-        cpu = metrics.get("cpu_percent", 0)
-        cpu_max = metrics.get("cpu_max", cpu)
-        mem = metrics.get("memory_percent", 0)
-        mem_max = metrics.get("memory_max", mem)
-        print(
-            f"Sent: cpu={cpu:.1f}% (max={cpu_max:.1f}%) "
-            f"mem={mem:.1f}% (max={mem_max:.1f}%)"
-        )
-    except httpx.RequestError as e:
-        print(f"Failed to send metrics: {e}")
-    except httpx.HTTPStatusError as e:
-        print(f"Server error: {e.response.status_code}")
+import queue
+from datetime import datetime, timezone
+
+from config import (
+    API_URL,
+    HOSTNAME,
+    INTERVAL,
+    SAMPLE_PERIOD,
+    REPORT_QUEUE_SIZE,
+    SPOOL_PATH,
+    SPOOL_MAX_ROWS,
+    BATCH_SIZE,
+    DRAIN_RATE,
+    MAX_BACKOFF,
+    WIRE_FORMAT,
+    METRICS_PORT,
+)
+from collector import collect_all
+from instrumentation import register_callback, start_metrics_server
+from sampler import Sampler
+from spool import Spool
+from uploader import Uploader
+
+
+def report(metrics: dict) -> dict:
+    # Timestamped here so spooled reports keep their collection time.
+    return {
+        "host": HOSTNAME,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        **metrics,
+    }
+
+
+def log_report(metrics: dict):
+    cpu = metrics.get("cpu_percent", 0)
+    cpu_max = metrics.get("cpu_max", cpu)
+    mem = metrics.get("memory_percent", 0)
+    mem_max = metrics.get("memory_max", mem)
+    print(
+        f"Collected: cpu={cpu:.1f}% (max={cpu_max:.1f}%) "
+        f"mem={mem:.1f}% (max={mem_max:.1f}%)"
+    )
 
 
 def main():
     print(f"Nazar Agent starting...")
     print(f"  API: {API_URL}")
     print(f"  Host: {HOSTNAME}")
-    print(f"  Interval: {INTERVAL}s (sampling every 1s)")
+    print(f"  Interval: {INTERVAL}s (sampling every {SAMPLE_PERIOD:g}s)")
+    print(f"  Spool: {SPOOL_PATH} (max {SPOOL_MAX_ROWS} reports)")
+    print(f"  Wire format: {WIRE_FORMAT}")
     print()
 
-    samples = []
-
+    spool = Spool(SPOOL_PATH, SPOOL_MAX_ROWS)
+    uploader = Uploader(API_URL, spool, BATCH_SIZE, DRAIN_RATE, MAX_BACKOFF, WIRE_FORMAT)
+    reports = queue.Queue(maxsize=REPORT_QUEUE_SIZE)
+    sampler = Sampler(
+        collect_all,
+        report,
+        period=SAMPLE_PERIOD,
+        window_ticks=max(1, round(INTERVAL / SAMPLE_PERIOD)),
+        reports=reports,
+    )
+    sampler.start()
+    skew = (0, 0)
+
+    register_callback(
+        "nazar_agent_sampler_total",
+        "Sampler ticks taken, missed, late, and reports dropped",
+        lambda: {(name,): value for name, value in sampler.stats().items()},
+        kind="counter",
+        labelnames=("event",),
+    )
+    register_callback("nazar_agent_spool_reports", "Reports waiting in the spool", spool.__len__)
+    register_callback("nazar_agent_spool_dropped_total", "Reports trimmed from a full spool", lambda: spool.dropped, kind="counter")
+    register_callback("nazar_agent_report_queue", "Reports waiting for the sender", reports.qsize)
+    start_metrics_server(METRICS_PORT)
+
+    # The sender runs here so slow uploads never delay sampling.
     while True:
         try:
-            sample = collect_metrics()
-            samples.append(sample)
-
-            if len(samples) >= INTERVAL:
-                metrics = aggregate(samples)
-                send_metrics(metrics)
-                samples = []
+            try:
+                metrics = reports.get(timeout=0.5)
+                spool.push(metrics)
+                log_report(metrics)
+            except queue.Empty:
+                pass
+
+            sent = uploader.step()
+            if sent > 1:
+                print(f"Uploaded {sent} spooled reports ({len(spool)} left)")
+
+            if (sampler.missed_ticks, sampler.late_ticks) != skew:
+                skew = (sampler.missed_ticks, sampler.late_ticks)
+                print(f"Sampler: {sampler.stats()}")
         except Exception as e:
             print(f"Error: {e}")
 
-        time.sleep(1)
-
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,234 @@
+"""Minimal Prometheus-style counters, gauges and histograms.
+
+Metrics are module-level objects created once. Hot paths should bind
+label values up front (`STAGE = HISTOGRAM.labels("decode")`) so an update
+costs a lock, a bisect and an addition. Values that already live somewhere
+else (queue sizes, cache stats) are exposed with `register_callback` and
+read only when scraped.
+
+Standard library only and free of package-relative imports: the agent
+ships a verbatim copy as agent/metrics_core.py. Edit backend/shared/
+metrics_core.py and copy it over; backend/tests checks the two match.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Union
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+CallbackValue = Union[float, dict[tuple, float]]
+
+_metrics: dict[str, "_Metric"] = {}
+
+
+class _Child:
+    def __init__(self):
+        self._lock = threading.Lock()
+
+
+class _CounterChild(_Child):
+    def __init__(self):
+        super().__init__()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+
+class _Timer:
+    __slots__ = ("_child", "_started")
+
+    def __init__(self, child: "_HistogramChild"):
+        self._child = child
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._started)
+
+
+class _HistogramChild(_Child):
+    def __init__(self, buckets: tuple[float, ...]):
+        super().__init__()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        if name in _metrics:
+            raise ValueError(f"Duplicate metric: {name}")
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._children: dict[tuple, _Child] = {}
+        self._lock = threading.Lock()
+        _metrics[name] = self
+
+    def labels(self, *values) -> _Child:
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self) -> _Child:
+        raise NotImplementedError
+
+    def _unlabelled(self):
+        return self.labels()
+
+    def render(self) -> list[str]:
+        if not self.labelnames:
+            # Report an unlabelled metric as zero before its first update.
+            self._unlabelled()
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in list(self._children.items()):
+            lines.extend(self._render_child(_labels(self.labelnames, key), child))
+        return lines
+
+    def _render_child(self, labels: str, child) -> list[str]:
+        return [f"{self.name}{{{labels}}} {_number(child.value)}" if labels else f"{self.name} {_number(child.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._unlabelled().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._unlabelled().set(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._unlabelled().observe(value)
+
+    def time(self) -> _Timer:
+        return self._unlabelled().time()
+
+    def _render_child(self, labels: str, child: _HistogramChild) -> list[str]:
+        with child._lock:
+            counts = list(child.counts)
+            total = child.sum
+        prefix = f"{labels}," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), counts):
+            cumulative += count
+            le = bound if bound == "+Inf" else _number(bound)
+            lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{self.name}_sum{suffix} {_number(total)}")
+        lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class _Callback(_Metric):
+    def __init__(self, name: str, help: str, kind: str, labelnames: tuple[str, ...], fn: Callable[[], CallbackValue]):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def render(self) -> list[str]:
+        try:
+            value = self.fn()
+        except Exception as e:
+            return [f"# {self.name} unavailable: {e}"]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for key, number in items:
+            labels = _labels(self.labelnames, key if isinstance(key, tuple) else (key,))
+            lines.append(f"{self.name}{{{labels}}} {_number(number)}" if labels else f"{self.name} {_number(number)}")
+        return lines
+
+
+def register_callback(
+    name: str,
+    help: str,
+    fn: Callable[[], CallbackValue],
+    kind: str = "gauge",
+    labelnames: tuple[str, ...] = (),
+):
+    """Expose a value computed at scrape time: a number, or {label values: number}."""
+    _Callback(name, help, kind, labelnames, fn)
+
+
+def render() -> str:
+    lines = []
+    for metric in list(_metrics.values()):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    value = float(value)
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
@@ -0,0 +1,114 @@
+import queue
+import threading
+import time
+from typing import Callable
+
+from instrumentation import Histogram
+from stats import WindowAggregator
+
+COLLECT_SECONDS = Histogram("nazar_agent_collect_seconds", "Time to take one sample, all collectors included")
+LAG_SECONDS = Histogram(
+    "nazar_agent_tick_lag_seconds",
+    "How far behind its grid slot each tick started, stalls over skipped ticks included",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+
+
+class Sampler(threading.Thread):
+    """Samples on a fixed monotonic-clock grid and hands off window reports.
+
+    Tick n is due at start + n * period instead of one period after the
+    previous sample finished, so collection time never accumulates as
+    drift. A tick that runs more than `late_after` seconds behind schedule
+    counts as late; ticks skipped outright after a stall count as missed.
+    Reports go onto a bounded queue and the oldest one is dropped when the
+    sender falls behind.
+    """
+
+    def __init__(
+        self,
+        collect: Callable[[], dict],
+        make_report: Callable[[dict], dict],
+        period: float,
+        window_ticks: int,
+        reports: queue.Queue,
+        late_after: float = 0.1,
+    ):
+        super().__init__(name="sampler", daemon=True)
+        self.collect = collect
+        self.make_report = make_report
+        self.aggregator = WindowAggregator()
+        self.period = period
+        self.window_ticks = window_ticks
+        self.reports = reports
+        self.late_after = late_after
+        self.ticks = 0
+        self.missed_ticks = 0
+        self.late_ticks = 0
+        self.dropped_reports = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        start = time.monotonic()
+        tick = 0
+
+        while True:
+            delay = start + tick * self.period - time.monotonic()
+            if delay > 0 and self._stop_event.wait(delay):
+                return
+            if self._stop_event.is_set():
+                return
+
+            lag = time.monotonic() - (start + tick * self.period)
+            if lag >= self.period:
+                skipped = int(lag // self.period)
+                self.missed_ticks += skipped
+                if (tick + skipped) // self.window_ticks != tick // self.window_ticks:
+                    # The window closed during the stall; report what it has.
+                    self._emit()
+                tick += skipped
+            elif lag > self.late_after:
+                self.late_ticks += 1
+            LAG_SECONDS.observe(max(0.0, lag))
+
+            try:
+                with COLLECT_SECONDS.time():
+                    sample = self.collect()
+                self.aggregator.add(sample, time.monotonic())
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+            tick += 1
+            self.ticks += 1
+
+            if tick % self.window_ticks == 0:
+                self._emit()
+
+    def _emit(self):
+        if not self.aggregator.samples:
+            return
+        try:
+            report = self.make_report(self.aggregator.flush())
+        except Exception as e:
+            print(f"Error aggregating metrics: {e}")
+            return
+
+        try:
+            self.reports.put_nowait(report)
+        except queue.Full:
+            try:
+                self.reports.get_nowait()
+                self.dropped_reports += 1
+            except queue.Empty:
+                pass
+            self.reports.put_nowait(report)
+
+    def stats(self) -> dict:
+        return {
+            "ticks": self.ticks,
+            "missed_ticks": self.missed_ticks,
+            "late_ticks": self.late_ticks,
+            "dropped_reports": self.dropped_reports,
+        }
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,56 @@
+import json
+import sqlite3
+import threading
+
+
+class Spool:
+    """Disk-backed FIFO of metric reports awaiting upload.
+
+    Reports survive agent restarts and API outages. Once `max_rows` are
+    queued the oldest ones are discarded, so the file never grows without
+    bound during a long outage.
+    """
+
+    def __init__(self, path: str, max_rows: int):
+        self.max_rows = max_rows
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL)"
+        )
+
+    def push(self, report: dict):
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO spool (payload) VALUES (?)", (json.dumps(report),)
+            )
+            trimmed = self._db.execute(
+                "DELETE FROM spool WHERE id <= ?", (cursor.lastrowid - self.max_rows,)
+            )
+            self.dropped += trimmed.rowcount
+
+    def peek(self, limit: int) -> tuple[int, list[dict]]:
+        """Return the id of the last report and up to `limit` oldest reports."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, payload FROM spool ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        if not rows:
+            return 0, []
+        return rows[-1][0], [json.loads(payload) for _, payload in rows]
+
+    def ack(self, last_id: int):
+        with self._lock:
+            self._db.execute("DELETE FROM spool WHERE id <= ?", (last_id,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM spool").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,147 @@
+import math
+from typing import Optional
+
+
+class StreamingStats:
+    """Constant-memory summary of one percentage metric over a window.
+
+    Mean and variance use Welford's online update. Percentiles come from a
+    fixed-width histogram over [low, high], so memory does not depend on
+    how many samples a window holds.
+    """
+
+    def __init__(self, low: float = 0.0, high: float = 100.0, bins: int = 1000):
+        self.low = low
+        self.high = high
+        self.width = (high - low) / bins
+        self.histogram = [0] * bins
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        for i in range(len(self.histogram)):
+            self.histogram[i] = 0
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+        index = int((value - self.low) / self.width)
+        self.histogram[min(max(index, 0), len(self.histogram) - 1)] += 1
+
+    @property
+    def stddev(self) -> float:
+        return math.sqrt(self._m2 / self.count) if self.count else 0.0
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, n in enumerate(self.histogram):
+            if n and seen + n >= rank:
+                # Interpolate within the bin, then clamp to what was observed.
+                value = self.low + (index + (rank - seen) / n) * self.width
+                return min(max(value, self.min), self.max)
+            seen += n
+        return self.max
+
+
+class CounterRate:
+    """Per-second rate of a monotonically increasing byte counter.
+
+    The counter is remembered across windows so each window's rate covers
+    the whole window. A value lower than the previous one is treated as a
+    counter reset (interface flap, reboot, wraparound) and the new value is
+    counted as the bytes since the reset.
+    """
+
+    def __init__(self):
+        self.last_value: Optional[int] = None
+        self.last_time: Optional[float] = None
+        self.reset()
+
+    def reset(self):
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def add(self, value: int, now: float):
+        if self.last_value is not None:
+            delta = value - self.last_value
+            self.bytes += delta if delta >= 0 else value
+            self.seconds += now - self.last_time
+        self.last_value = value
+        self.last_time = now
+
+    @property
+    def rate(self) -> Optional[float]:
+        if self.seconds <= 0:
+            return None
+        return self.bytes / self.seconds
+
+
+class WindowAggregator:
+    """Streaming replacement for a list of samples per reporting window."""
+
+    KEYS = ["cpu_percent", "memory_percent", "disk_percent"]
+    COUNTERS = ["network_in", "network_out"]
+
+    def __init__(self):
+        self.stats = {key: StreamingStats() for key in self.KEYS}
+        self.rates = {key: CounterRate() for key in self.COUNTERS}
+        # Window mean per (name, labels) of the optional collector series.
+        self.series: dict[tuple, list] = {}
+        self.samples = 0
+
+    def add(self, sample: dict, now: float):
+        self.samples += 1
+        for key, stats in self.stats.items():
+            if sample.get(key) is not None:
+                stats.add(sample[key])
+        for key, rate in self.rates.items():
+            if sample.get(key) is not None:
+                rate.add(sample[key], now)
+        for name, labels, value in sample.get("series", ()):
+            key = (name, *sorted(labels.items()))
+            entry = self.series.setdefault(key, [name, labels, 0.0, 0])
+            entry[2] += value
+            entry[3] += 1
+
+    def flush(self) -> dict:
+        """Return the window's summary and start a new window."""
+        result = {}
+        for key, stats in self.stats.items():
+            if not stats.count:
+                continue
+            prefix = key.split("_")[0]  # cpu, memory, disk
+            result[key] = stats.mean
+            result[f"{prefix}_min"] = stats.min
+            result[f"{prefix}_max"] = stats.max
+            result[f"{prefix}_stddev"] = stats.stddev
+            for q in (50, 95, 99):
+                result[f"{prefix}_p{q}"] = stats.quantile(q / 100)
+            stats.reset()
+
+        for key, rate in self.rates.items():
+            # Raw counters are still sent for consumers of the old fields.
+            result[key] = rate.last_value
+            result[f"{key}_rate"] = rate.rate
+            rate.reset()
+
+        if self.series:
+            result["samples"] = [
+                {"name": name, "labels": labels, "value": total / count}
+                for name, labels, total, count in self.series.values()
+            ]
+            self.series = {}
+
+        self.samples = 0
+        return result
@@ -0,0 +1,18 @@
+import collector
+from collector import _forget_unseen, _rate
+
+
+def test_counters_of_vanished_devices_are_dropped(monkeypatch):
+    monkeypatch.setattr(collector, "_counters", {})
+
+    first = set()
+    for device in ("sda", "veth1"):
+        _rate("disk.read_iops", {"device": device}, 100, 0.0, first)
+    _rate("net.in_bytes_rate", {"interface": "eth0"}, 100, 0.0, set())
+
+    # veth1 is gone on the next pass; other collectors' counters are untouched.
+    second = set()
+    assert _rate("disk.read_iops", {"device": "sda"}, 150, 5.0, second) == 10.0
+    _forget_unseen("disk.", second)
+
+    assert sorted(collector._counters) == [("disk.read_iops", "sda"), ("net.in_bytes_rate", "eth0")]
@@ -0,0 +1,80 @@
+import statistics
+
+import pytest
+
+from stats import CounterRate, StreamingStats, WindowAggregator
+
+
+def test_streaming_stats_match_the_exact_values():
+    values = [(i * 37) % 1000 / 10 for i in range(1000)]  # 0.0 .. 99.9, shuffled
+    stats = StreamingStats()
+    for value in values:
+        stats.add(value)
+
+    assert stats.mean == pytest.approx(statistics.fmean(values))
+    assert stats.stddev == pytest.approx(statistics.pstdev(values))
+    assert (stats.min, stats.max) == (0.0, 99.9)
+    # Histogram bins are 0.1 wide, so percentiles land within a bin.
+    assert stats.quantile(0.5) == pytest.approx(statistics.median(values), abs=0.1)
+    assert stats.quantile(0.99) <= stats.max
+
+
+def test_streaming_stats_out_of_range_values_and_reset():
+    stats = StreamingStats()
+    stats.add(-5.0)
+    stats.add(150.0)
+
+    # min/max are exact; percentiles are bounded by the histogram's range.
+    assert (stats.min, stats.max) == (-5.0, 150.0)
+    assert stats.quantile(0.0) == 0.0
+    assert stats.quantile(1.0) == 100.0
+
+    stats.reset()
+    assert stats.count == 0
+    assert stats.quantile(0.5) is None
+    assert stats.stddev == 0.0
+
+
+def test_counter_rate_spans_windows():
+    rate = CounterRate()
+    rate.add(1000, 0.0)
+    assert rate.rate is None  # one reading is not a rate yet
+
+    rate.add(2000, 10.0)
+    assert rate.rate == 100.0
+
+    # The next window measures from the last reading of the previous one.
+    rate.reset()
+    rate.add(2500, 15.0)
+    assert rate.rate == 100.0
+
+
+def test_counter_rate_treats_a_drop_as_a_reset():
+    rate = CounterRate()
+    rate.add(2 ** 32 - 100, 0.0)
+    rate.add(400, 10.0)  # wrapped or reset: 400 bytes since
+
+    assert rate.rate == 40.0
+
+
+def test_window_aggregator_flush():
+    window = WindowAggregator()
+    for second in range(3):
+        window.add(
+            {
+                "cpu_percent": 10.0 * (second + 1),
+                "memory_percent": None,
+                "network_in": 1000 * second,
+                "series": [("load.1m", {}, float(second))],
+            },
+            float(second),
+        )
+
+    result = window.flush()
+
+    assert result["cpu_percent"] == pytest.approx(20.0)
+    assert (result["cpu_min"], result["cpu_max"]) == (10.0, 30.0)
+    assert "memory_percent" not in result
+    assert (result["network_in"], result["network_in_rate"]) == (2000, 1000.0)
+    assert result["samples"] == [{"name": "load.1m", "labels": {}, "value": 1.0}]
+    assert window.flush().get("samples") is None
@@ -0,0 +1,112 @@
+import gzip
+import random
+import time
+
+import httpx
+
+from instrumentation import Counter, Histogram
+from spool import Spool
+from wire import ENCODERS
+
+UPLOAD_SECONDS = Histogram("nazar_agent_upload_seconds", "Duration of one batch upload, encoding included")
+UPLOADS = Counter("nazar_agent_uploads_total", "Batch uploads by outcome", ("result",))
+UPLOADED_REPORTS = Counter("nazar_agent_uploaded_reports_total", "Reports accepted by the API")
+
+
+class Uploader:
+    """Ships spooled reports to the API in gzip-compressed batches.
+
+    Batches are JSON by default, or msgpack with `wire_format="msgpack"`,
+    which is smaller and much cheaper for the API to parse.
+    One keep-alive client is reused for every request. Failures back off
+    exponentially with full jitter, and a backlog is drained no faster than
+    `drain_rate` reports per second so a fleet coming back from an outage
+    does not stampede the API. A batch the API finds too large (413) is
+    retried at half the size, down to single reports; the batch size then
+    doubles back after each successful upload.
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        spool: Spool,
+        batch_size: int,
+        drain_rate: float,
+        max_backoff: float,
+        wire_format: str = "json",
+    ):
+        self.spool = spool
+        self.encode = ENCODERS[wire_format]
+        self.batch_size = batch_size
+        self.current_batch_size = batch_size
+        self.drain_rate = drain_rate
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.next_attempt = 0.0
+        self.client = httpx.Client(
+            base_url=api_url,
+            timeout=10,
+            limits=httpx.Limits(max_keepalive_connections=1, keepalive_expiry=60),
+        )
+
+    def step(self) -> int:
+        """Upload at most one batch if one is due; return the number sent."""
+        now = time.monotonic()
+        if now < self.next_attempt:
+            return 0
+
+        last_id, reports = self.spool.peek(self.current_batch_size)
+        if not reports:
+            return 0
+
+        try:
+            with UPLOAD_SECONDS.time():
+                self._post(reports)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 413 and len(reports) > 1:
+                self.current_batch_size = len(reports) // 2
+                print(f"Batch of {len(reports)} report(s) too large, retrying {self.current_batch_size} at a time")
+                return 0
+            if e.response.status_code not in (400, 413, 422):
+                return self._back_off(now, len(reports), e)
+            # Retrying a payload the API rejected would block the spool forever.
+            print(f"Dropping {len(reports)} report(s) rejected by the API: {e.response.text[:200]}")
+            UPLOADS.labels("rejected").inc()
+            self.spool.ack(last_id)
+            return 0
+        except httpx.RequestError as e:
+            return self._back_off(now, len(reports), e)
+
+        UPLOADS.labels("ok").inc()
+        UPLOADED_REPORTS.inc(len(reports))
+        self.spool.ack(last_id)
+        self.failures = 0
+        self.current_batch_size = min(self.batch_size, self.current_batch_size * 2)
+        self.next_attempt = now + len(reports) / self.drain_rate
+        return len(reports)
+
+    def _back_off(self, now: float, count: int, error: Exception) -> int:
+        UPLOADS.labels("failed").inc()
+        self.failures += 1
+        delay = random.uniform(0, min(self.max_backoff, 2 ** self.failures))
+        self.next_attempt = now + delay
+        print(f"Failed to send {count} report(s): {_describe(error)}; retrying in {delay:.1f}s")
+        return 0
+
+    def _post(self, reports: list[dict]):
+        body, content_type = self.encode(reports)
+        response = self.client.post(
+            "/metrics/batch",
+            content=gzip.compress(body, compresslevel=5),
+            headers={"Content-Type": content_type, "Content-Encoding": "gzip"},
+        )
+        response.raise_for_status()
+
+    def close(self):
+        self.client.close()
+
+
+def _describe(error: Exception) -> str:
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"server error {error.response.status_code}"
+    return str(error) or type(error).__name__
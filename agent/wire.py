@@ -0,0 +1,38 @@
+import json
+from datetime import datetime
+
+import msgpack
+
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+
+def encode_json(reports: list[dict]) -> tuple[bytes, str]:
+    return json.dumps(reports).encode(), "application/json"
+
+
+def encode_msgpack(reports: list[dict]) -> tuple[bytes, str]:
+    """Pack reports as `{"fields": [...], "rows": [[...], ...]}`.
+
+    Field names are written once per batch, timestamps use the msgpack
+    timestamp extension and samples become `[name, labels, value]` triples.
+    """
+    fields = list(dict.fromkeys(key for report in reports for key in report))
+    rows = [[report.get(key) for key in fields] for report in reports]
+    if "timestamp" in fields:
+        i = fields.index("timestamp")
+        for row in rows:
+            if isinstance(row[i], str):
+                row[i] = datetime.fromisoformat(row[i])
+    if "samples" in fields:
+        i = fields.index("samples")
+        for row in rows:
+            row[i] = [[s["name"], s["labels"], s["value"]] for s in row[i] or ()]
+
+    body = msgpack.packb({"fields": fields, "rows": rows}, datetime=True)
+    return body, MSGPACK_CONTENT_TYPE
+
+
+ENCODERS = {
+    "json": encode_json,
+    "msgpack": encode_msgpack,
+}
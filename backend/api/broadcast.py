@@ -0,0 +1,77 @@
+import asyncio
+import json
+from datetime import datetime
+from typing import Optional
+
+# What the dashboard's stream reads (frontend/src/hooks/useMetricsSSE.ts);
+# percentiles, rates and per-device samples stay out of every frame.
+STREAM_COLUMNS = (
+    "timestamp", "host",
+    "cpu_percent", "cpu_min", "cpu_max",
+    "memory_percent", "memory_min", "memory_max",
+    "disk_percent", "disk_min", "disk_max",
+    "network_in", "network_out",
+)
+
+
+class Subscriber:
+    def __init__(self, host: Optional[str], max_queue: int):
+        self.host = host
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+
+class Broadcaster:
+    """Fans freshly ingested metrics out to SSE subscribers.
+
+    Each metric is trimmed to STREAM_COLUMNS and serialized once into an SSE
+    frame, which is offered to every matching subscriber's bounded queue. A
+    subscriber whose queue is full loses that frame instead of holding up
+    the others.
+    """
+
+    def __init__(self, max_queue: int):
+        self.max_queue = max_queue
+        self._by_host: dict[Optional[str], set[Subscriber]] = {}
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._by_host.values())
+
+    def subscribe(self, host: Optional[str] = None) -> Subscriber:
+        subscriber = Subscriber(host, self.max_queue)
+        self._by_host.setdefault(host, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._by_host.get(subscriber.host)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._by_host[subscriber.host]
+
+    def publish(self, rows: list[dict]):
+        if not self._by_host:
+            return
+
+        everyone = self._by_host.get(None, ())
+        for row in rows:
+            host_subscribers = self._by_host.get(row["host"], ())
+            if not everyone and not host_subscribers:
+                continue
+
+            payload = {name: row.get(name) for name in STREAM_COLUMNS}
+            frame = f"data: {json.dumps(payload, default=_isoformat)}\n\n"
+            for subscribers in (everyone, host_subscribers):
+                for subscriber in subscribers:
+                    try:
+                        subscriber.queue.put_nowait(frame)
+                    except asyncio.QueueFull:
+                        subscriber.dropped += 1
+
+
+def _isoformat(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
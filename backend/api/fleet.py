@@ -0,0 +1,115 @@
+import heapq
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from shared import Metric, Alert
+
+SEVERITY_RANK = {"warning": 1, "critical": 2}
+
+
+class FleetState:
+    """In-memory latest row per host plus alert counts, for fleet views.
+
+    The ingest path feeds `update` with every committed row. `load_latest`
+    warms the cache with one DISTINCT ON (host) query and, run
+    periodically over a short window, also merges rows committed by other
+    API replicas. Alert counts are only ever refreshed from the database.
+    `prune` drops hosts that have stopped reporting, so decommissioned or
+    renamed hosts do not stay in the fleet views forever.
+    """
+
+    def __init__(self):
+        self.latest: dict[str, dict] = {}
+        self.alert_counts: dict[str, int] = {}
+        self.host_severity: dict[str, str] = {}
+        self.alerts_as_of: Optional[datetime] = None
+
+    def update(self, rows: list[dict]):
+        for row in rows:
+            timestamp = row["timestamp"]
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            current = self.latest.get(row["host"])
+            if current is not None and current["timestamp"] > timestamp:
+                continue
+            self.latest[row["host"]] = {
+                **{key: value for key, value in row.items() if key != "samples"},
+                "timestamp": timestamp,
+            }
+
+    def prune(self, max_age: timedelta):
+        cutoff = datetime.now(timezone.utc) - max_age
+        for host in [host for host, row in self.latest.items() if row["timestamp"] < cutoff]:
+            del self.latest[host]
+
+    async def load_latest(self, session: AsyncSession, window: timedelta):
+        result = await session.execute(
+            select(Metric.__table__)
+            .distinct(Metric.host)
+            .where(Metric.timestamp >= datetime.now(timezone.utc) - window)
+            .order_by(Metric.host, Metric.timestamp.desc())
+        )
+        self.update([dict(row) for row in result.mappings().all()])
+
+    async def load_alerts(self, session: AsyncSession):
+        counts = await session.execute(
+            select(Alert.status, func.count()).group_by(Alert.status)
+        )
+        # Served by the partial index on pending alerts.
+        pending = await session.execute(
+            select(Alert.host, Alert.severity).where(Alert.status == "pending").distinct()
+        )
+
+        host_severity: dict[str, str] = {}
+        for host, severity in pending.all():
+            if SEVERITY_RANK.get(severity, 0) > SEVERITY_RANK.get(host_severity.get(host), 0):
+                host_severity[host] = severity
+
+        self.alert_counts = dict(counts.all())
+        self.host_severity = host_severity
+        self.alerts_as_of = datetime.now(timezone.utc)
+
+    def hosts(self, hosts: Optional[list[str]] = None) -> list[dict]:
+        names = sorted(self.latest) if hosts is None else [h for h in hosts if h in self.latest]
+        return [self.latest[name] for name in names]
+
+    def summary(self, top: int, stale_after: float) -> dict:
+        now = datetime.now(timezone.utc)
+        cutoff = now - timedelta(seconds=stale_after)
+        rows = self.latest.values()
+
+        stale = sorted(
+            (row for row in rows if row["timestamp"] < cutoff),
+            key=lambda row: row["timestamp"],
+        )
+        states = {"ok": 0, "warning": 0, "critical": 0}
+        for host in self.latest:
+            states[self.host_severity.get(host, "ok")] += 1
+
+        return {
+            "hosts": {"total": len(self.latest), **states, "stale": len(stale)},
+            "alerts": self.alert_counts,
+            "alerts_as_of": self.alerts_as_of,
+            "top_cpu": _top(rows, "cpu_percent", top),
+            "top_memory": _top(rows, "memory_percent", top),
+            "stale_hosts": [
+                {
+                    "host": row["host"],
+                    "timestamp": row["timestamp"],
+                    "seconds_since": (now - row["timestamp"]).total_seconds(),
+                }
+                for row in stale
+            ],
+        }
+
+
+def _top(rows, key: str, k: int) -> list[dict]:
+    ranked = heapq.nlargest(
+        k,
+        (row for row in rows if row.get(key) is not None),
+        key=lambda row: row[key],
+    )
+    return [{"host": row["host"], key: row[key], "timestamp": row["timestamp"]} for row in ranked]
@@ -0,0 +1,170 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Callable, Optional
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from shared import Metric, MetricSample, AsyncSessionLocal, publish_metrics
+from shared.instrumentation import Histogram
+from shared.messages import as_utc
+from .schemas import MetricCreate
+
+WRITE_SECONDS = Histogram("nazar_api_write_seconds", "INSERT and commit of one batch of metric rows")
+WRITE_ROWS = Histogram(
+    "nazar_api_write_rows",
+    "Metric rows per INSERT and commit",
+    buckets=(1, 5, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+)
+
+# asyncpg caps a statement at 32767 bind parameters; stay well below it.
+MAX_INSERT_PARAMS = 30000
+
+
+def metric_row(metric: MetricCreate) -> dict:
+    """Wide metrics columns, plus the narrow series under "samples"."""
+    row = metric.model_dump()
+    row["timestamp"] = metric.timestamp or datetime.now(timezone.utc)
+    return row
+
+
+async def _insert(session: AsyncSession, model, values: list[dict], returning: tuple = ()) -> list:
+    """INSERT `values` in chunks, skipping duplicates; returns the `returning` columns of new rows."""
+    if not values:
+        return []
+    inserted = []
+    chunk_size = MAX_INSERT_PARAMS // len(values[0])
+    for i in range(0, len(values), chunk_size):
+        chunk = values[i:i + chunk_size]
+        statement = insert(model).values(chunk).on_conflict_do_nothing()
+        if returning:
+            result = await session.execute(statement.returning(*returning))
+            inserted.extend(result.all())
+        else:
+            await session.execute(statement)
+    return inserted
+
+
+async def insert_metrics(session: AsyncSession, rows: list[dict]) -> list[dict]:
+    """Write rows with one multi-row INSERT per chunk, skipping duplicates.
+
+    Returns the rows that were new, so re-sent rows are not published or
+    broadcast a second time.
+    """
+    metrics = []
+    samples = []
+    for row in rows:
+        metrics.append({key: value for key, value in row.items() if key != "samples"})
+        for sample in row.get("samples", ()):
+            samples.append({"timestamp": row["timestamp"], "host": row["host"], **sample})
+
+    inserted = await _insert(session, Metric, metrics, returning=(Metric.timestamp, Metric.host))
+    await _insert(session, MetricSample, samples)
+
+    new_keys = {(as_utc(timestamp), host) for timestamp, host in inserted}
+    new_rows = []
+    for row in rows:
+        key = (as_utc(row["timestamp"]), row["host"])
+        if key in new_keys:
+            # A key repeated within the batch was only inserted once.
+            new_keys.discard(key)
+            new_rows.append(row)
+    return new_rows
+
+
+async def write_metrics(session: AsyncSession, rows: list[dict]) -> list[dict]:
+    """Insert and commit `rows`, recording how long it took; returns the new rows."""
+    with WRITE_SECONDS.time():
+        new_rows = await insert_metrics(session, rows)
+        await session.commit()
+    WRITE_ROWS.observe(len(rows))
+    return new_rows
+
+
+class WriteBuffer:
+    """Write-behind buffer that coalesces single-metric ingests.
+
+    Rows are collected until `max_rows` are pending or `max_delay_ms` has
+    passed since the first one, then written with one INSERT, one commit and
+    one batched publish. `add` returns once the row has been committed;
+    `on_commit` then receives the rows that were new.
+    """
+
+    def __init__(
+        self,
+        max_rows: int,
+        max_delay_ms: int,
+        on_commit: Optional[Callable[[list[dict]], None]] = None,
+    ):
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self.on_commit = on_commit
+        self._rows: list[dict] = []
+        self._waiters: list[asyncio.Future] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: set[asyncio.Task] = set()
+        self._closed = False
+
+    @property
+    def pending(self) -> int:
+        """Rows waiting for the next flush."""
+        return len(self._rows)
+
+    async def add(self, row: dict):
+        if self._closed:
+            raise RuntimeError("Write buffer is closed")
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._rows.append(row)
+        self._waiters.append(waiter)
+
+        if len(self._rows) >= self.max_rows:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._start_flush)
+
+        await waiter
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._rows:
+            return
+
+        rows, waiters = self._rows, self._waiters
+        self._rows, self._waiters = [], []
+        task = asyncio.create_task(self._flush(rows, waiters))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, rows: list[dict], waiters: list[asyncio.Future]):
+        try:
+            async with AsyncSessionLocal() as session:
+                new_rows = await write_metrics(session, rows)
+        except Exception as e:
+            print(f"Failed to flush {len(rows)} metrics: {e}")
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+        if not new_rows:
+            return
+        if self.on_commit:
+            self.on_commit(new_rows)
+
+        try:
+            await publish_metrics(new_rows)
+        except Exception as e:
+            print(f"Failed to publish {len(new_rows)} metrics: {e}")
+
+    async def close(self):
+        self._closed = True
+        self._start_flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
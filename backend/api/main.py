@@ -1,15 +1,55 @@
 import asyncio
-import json
-from datetime import datetime, timezone
-from typing import Optional
-from fastapi import FastAPI, Depends, Query, HTTPException
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Literal, Optional
+from fastapi import FastAPI, Depends, Query, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
-from sqlalchemy import select
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import func, select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from shared import get_session, Metric, Alert, publish_metric, AsyncSessionLocal
-from .schemas import MetricCreate, MetricResponse, AlertResponse, AlertUpdate
+from shared import (
+    get_session,
+    AsyncSessionLocal,
+    Metric,
+    MetricSample,
+    Alert,
+    ThresholdRule,
+    publish_metrics,
+    publish_alert_event,
+)
+from shared.config import (
+    INGEST_MAX_BATCH,
+    INGEST_MAX_BODY_BYTES,
+    INGEST_BUFFER_MAX_ROWS,
+    INGEST_BUFFER_MAX_DELAY_MS,
+    STREAM_QUEUE_SIZE,
+    STREAM_KEEPALIVE_SECONDS,
+    FLEET_WARM_HOURS,
+    FLEET_REFRESH_SECONDS,
+)
+from shared.instrumentation import CONTENT_TYPE, Counter, Histogram, register_callback, render
+from shared.rabbitmq import close_connection
+from shared.rollups import rollup_table, choose_resolution
+from .broadcast import Broadcaster
+from .fleet import FleetState
+from .pagination import NEXT_CURSOR_HEADER, decode_cursor, project, json_page, json_response
+from .ingest import metric_row, write_metrics, WriteBuffer
+from .schemas import (
+    MetricCreate,
+    MetricResponse,
+    SampleResponse,
+    AlertResponse,
+    AlertUpdate,
+    AlertBulkUpdateResponse,
+    FleetSummary,
+    ThresholdRuleCreate,
+    ThresholdRuleResponse,
+)
+from .wire import MSGPACK_CONTENT_TYPES, WireError, decode_msgpack_batch
 
 app = FastAPI(
     title="Nazar API",
@@ -23,8 +63,74 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+FIELDS_HELP = "Comma-separated columns to return; the paging keys are always included"
+CURSOR_HELP = f"Value of the {NEXT_CURSOR_HEADER} header from the previous page"
+
+broadcaster = Broadcaster(STREAM_QUEUE_SIZE)
+fleet = FleetState()
+
+
+def on_commit(rows: list[dict]):
+    broadcaster.publish(rows)
+    fleet.update(rows)
+
+
+write_buffer = WriteBuffer(
+    INGEST_BUFFER_MAX_ROWS,
+    INGEST_BUFFER_MAX_DELAY_MS,
+    on_commit=on_commit,
+)
+
+
+INGEST_SECONDS = Histogram("nazar_api_ingest_seconds", "Ingest request handling time", ("endpoint",))
+INGEST_ROWS = Counter("nazar_api_ingest_rows_total", "Metric rows accepted", ("endpoint",))
+PARSE_SECONDS = Histogram("nazar_api_parse_seconds", "Time to decode and validate a batch body", ("format",))
+register_callback("nazar_api_write_buffer_rows", "Rows waiting in the write buffer", lambda: write_buffer.pending)
+register_callback("nazar_api_stream_subscribers", "Connected SSE subscribers", lambda: broadcaster.subscriber_count)
+register_callback("nazar_api_fleet_hosts", "Hosts in the latest-value cache", lambda: len(fleet.latest))
+
+
+async def refresh_fleet():
+    """Warm the fleet cache, then keep alert counts and other replicas' rows current."""
+    loaded_at = None
+    while True:
+        started = time.monotonic()
+        # Hosts silent for longer than a warm-up would look back are dropped.
+        fleet.prune(timedelta(hours=FLEET_WARM_HOURS))
+        if loaded_at is None:
+            window = timedelta(hours=FLEET_WARM_HOURS)
+        else:
+            # Only rows newer than the last successful pass, with some slack.
+            window = timedelta(seconds=started - loaded_at + FLEET_REFRESH_SECONDS)
+        try:
+            async with AsyncSessionLocal() as session:
+                await fleet.load_latest(session, window)
+                await fleet.load_alerts(session)
+            loaded_at = started
+        except Exception as e:
+            print(f"Failed to refresh fleet state: {e}")
+        await asyncio.sleep(FLEET_REFRESH_SECONDS)
+
+
+@app.on_event("startup")
+async def startup():
+    app.state.fleet_refresher = asyncio.create_task(refresh_fleet())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.fleet_refresher.cancel()
+    await write_buffer.close()
+    await close_connection()
+
+
+@app.get("/internal/metrics", include_in_schema=False)
+def internal_metrics():
+    return Response(content=render(), headers={"Content-Type": CONTENT_TYPE})
+
 
 @app.get("/health")
 def health_check():
@@ -32,68 +138,282 @@ def health_check():
 
 
 @app.post("/metrics")
-async def ingest_metric(metric: MetricCreate, session: AsyncSession = Depends(get_session)):
-    db_metric = Metric(
-        timestamp=metric.timestamp or datetime.now(timezone.utc),
-        host=metric.host,
-        cpu_percent=metric.cpu_percent,
-        cpu_min=metric.cpu_min,
-        cpu_max=metric.cpu_max,
-        memory_percent=metric.memory_percent,
-        memory_min=metric.memory_min,
-        memory_max=metric.memory_max,
-        disk_percent=metric.disk_percent,
-        disk_min=metric.disk_min,
-        disk_max=metric.disk_max,
-        network_in=metric.network_in,
-        network_out=metric.network_out,
-    )
-    session.add(db_metric)
-    await session.commit()
-    await publish_metric(db_metric.host, db_metric.timestamp.isoformat())
+async def ingest_metric(metric: MetricCreate):
+    with INGEST_SECONDS.labels("single").time():
+        await write_buffer.add(metric_row(metric))
+    INGEST_ROWS.labels("single").inc()
     return {"status": "ok"}
 
 
+_metric_list = TypeAdapter(list[MetricCreate])
+
+
+def body_too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Body exceeds {INGEST_MAX_BODY_BYTES} bytes")
+
+
+async def read_body(request: Request) -> bytes:
+    """Read the raw body, refusing it as soon as it passes INGEST_MAX_BODY_BYTES."""
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > INGEST_MAX_BODY_BYTES:
+        raise body_too_large()
+
+    # Chunked uploads have no Content-Length, so count while reading.
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > INGEST_MAX_BODY_BYTES:
+            raise body_too_large()
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def decode_body(body: bytes, content_encoding: str) -> bytes:
+    if content_encoding in ("", "identity"):
+        return body
+    if content_encoding != "gzip":
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {content_encoding}")
+
+    # Bounded inflate so a small compressed body can't expand without limit.
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decoder.decompress(body, INGEST_MAX_BODY_BYTES)
+    except zlib.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid gzip body: {e}")
+    if decoder.unconsumed_tail:
+        raise body_too_large()
+    return data
+
+
+def parse_metric_batch(body: bytes, content_type: str) -> list[dict]:
+    if content_type.startswith(MSGPACK_CONTENT_TYPES):
+        with PARSE_SECONDS.labels("msgpack").time():
+            try:
+                return decode_msgpack_batch(body)
+            except WireError as e:
+                raise HTTPException(status_code=400, detail=e.errors())
+
+    ndjson = content_type.startswith("application/x-ndjson")
+    with PARSE_SECONDS.labels("ndjson" if ndjson else "json").time():
+        try:
+            if ndjson:
+                metrics = [
+                    MetricCreate.model_validate_json(line)
+                    for line in body.splitlines()
+                    if line.strip()
+                ]
+            else:
+                metrics = _metric_list.validate_json(body)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        return [metric_row(metric) for metric in metrics]
+
+
+@app.post(
+    "/metrics/batch",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"type": "array", "items": {"$ref": "#/components/schemas/MetricCreate"}}
+                },
+                "application/x-ndjson": {"schema": {"type": "string"}},
+                "application/msgpack": {"schema": {"type": "string", "format": "binary"}},
+            },
+        }
+    },
+)
+async def ingest_metric_batch(request: Request, session: AsyncSession = Depends(get_session)):
+    with INGEST_SECONDS.labels("batch").time():
+        count = await _ingest_batch(request, session)
+    INGEST_ROWS.labels("batch").inc(count)
+    return {"status": "ok", "count": count}
+
+
+async def _ingest_batch(request: Request, session: AsyncSession) -> int:
+    body = decode_body(await read_body(request), request.headers.get("content-encoding", ""))
+    rows = parse_metric_batch(body, request.headers.get("content-type", ""))
+    if len(rows) > INGEST_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {INGEST_MAX_BATCH} metrics")
+    if not rows:
+        return 0
+
+    new_rows = await write_metrics(session, rows)
+    if new_rows:
+        # Re-sent rows are stored once, so they are not detected or streamed again.
+        on_commit(new_rows)
+        await publish_metrics(new_rows)
+    return len(rows)
+
+
 @app.get("/metrics", response_model=list[MetricResponse])
 async def get_metrics(
     host: Optional[str] = None,
     start: Optional[datetime] = None,
     end: Optional[datetime] = None,
     limit: int = Query(default=100, le=1000),
+    resolution: Literal["raw", "auto", "1m", "1h", "1d"] = "raw",
+    fields: Optional[str] = Query(default=None, description=FIELDS_HELP),
+    cursor: Optional[str] = Query(default=None, description=CURSOR_HELP),
     session: AsyncSession = Depends(get_session),
 ):
-    query = select(Metric).order_by(Metric.timestamp.desc()).limit(limit)
+    if resolution == "auto":
+        resolution = choose_resolution(start, end, limit)
+
+    if resolution == "raw":
+        source = Metric.__table__
+    else:
+        source = rollup_table(resolution)
 
+    keys = ("timestamp", "host")
+    query = (
+        select(*project(source, fields, keys))
+        .order_by(source.c.timestamp.desc(), source.c.host.desc())
+        .limit(limit)
+    )
+
+    if cursor:
+        query = query.where(tuple_(source.c.timestamp, source.c.host) < decode_cursor(cursor, str))
     if host:
-        query = query.where(Metric.host == host)
+        query = query.where(source.c.host == host)
     if start:
-        query = query.where(Metric.timestamp >= start)
+        query = query.where(source.c.timestamp >= start)
     if end:
-        query = query.where(Metric.timestamp <= end)
+        query = query.where(source.c.timestamp <= end)
+
+    result = await session.execute(query)
+    return json_page(result.mappings().all(), limit, keys)
+
+
+@app.get("/samples", response_model=list[SampleResponse])
+async def get_samples(
+    host: Optional[str] = None,
+    name: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(default=100, le=1000),
+    session: AsyncSession = Depends(get_session),
+):
+    query = select(MetricSample).order_by(MetricSample.timestamp.desc()).limit(limit)
+
+    if host:
+        query = query.where(MetricSample.host == host)
+    if name:
+        query = query.where(MetricSample.name == name)
+    if start:
+        query = query.where(MetricSample.timestamp >= start)
+    if end:
+        query = query.where(MetricSample.timestamp <= end)
 
     result = await session.execute(query)
     return result.scalars().all()
 
 
+@app.get("/hosts/latest", response_model=list[MetricResponse])
+async def get_hosts_latest(
+    host: Optional[str] = Query(default=None, description="Comma-separated hosts; all when omitted"),
+):
+    hosts = [name.strip() for name in host.split(",")] if host else None
+    return json_response(fleet.hosts(hosts))
+
+
+@app.get("/fleet/summary", response_model=FleetSummary)
+async def get_fleet_summary(
+    top: int = Query(default=5, ge=0, le=100),
+    stale_after: float = Query(default=60, gt=0, description="Seconds without a report before a host is stale"),
+):
+    return fleet.summary(top, stale_after)
+
+
 @app.get("/alerts", response_model=list[AlertResponse])
 async def get_alerts(
     host: Optional[str] = None,
     severity: Optional[str] = None,
     status: Optional[str] = None,
     limit: int = Query(default=100, le=1000),
+    fields: Optional[str] = Query(default=None, description=FIELDS_HELP),
+    cursor: Optional[str] = Query(default=None, description=CURSOR_HELP),
     session: AsyncSession = Depends(get_session),
 ):
-    query = select(Alert).order_by(Alert.timestamp.desc()).limit(limit)
+    source = Alert.__table__
+    keys = ("timestamp", "id")
+    query = (
+        select(*project(source, fields, keys))
+        .order_by(source.c.timestamp.desc(), source.c.id.desc())
+        .limit(limit)
+    )
 
+    if cursor:
+        query = query.where(tuple_(source.c.timestamp, source.c.id) < decode_cursor(cursor, int))
     if host:
-        query = query.where(Alert.host == host)
+        query = query.where(source.c.host == host)
     if severity:
-        query = query.where(Alert.severity == severity)
+        query = query.where(source.c.severity == severity)
     if status:
-        query = query.where(Alert.status == status)
+        query = query.where(source.c.status == status)
 
     result = await session.execute(query)
-    return result.scalars().all()
+    return json_page(result.mappings().all(), limit, keys)
+
+
+@app.patch("/alerts", response_model=AlertBulkUpdateResponse)
+async def update_alerts(
+    update: AlertUpdate,
+    host: Optional[str] = None,
+    metric_type: Optional[str] = None,
+    severity: Optional[str] = None,
+    status: Optional[str] = None,
+    before: Optional[datetime] = Query(default=None, description="Only alerts raised before this time"),
+    session: AsyncSession = Depends(get_session),
+):
+    """Set the status of every alert matching the filters, e.g. resolve a host's alerts."""
+    filters = []
+    if host:
+        filters.append(Alert.host == host)
+    if metric_type:
+        filters.append(Alert.metric_type == metric_type)
+    if severity:
+        filters.append(Alert.severity == severity)
+    if status:
+        filters.append(Alert.status == status)
+    if before:
+        filters.append(Alert.timestamp < before)
+    if not filters:
+        raise HTTPException(status_code=400, detail="At least one filter is required")
+
+    resolved_at = None if update.status == "pending" else func.coalesce(Alert.resolved_at, func.now())
+    result = await session.execute(
+        Alert.__table__.update()
+        .where(*filters)
+        .values(status=update.status, resolved_at=resolved_at)
+        .returning(Alert.id, Alert.host, Alert.metric_type)
+    )
+    rows = result.all()
+    await session.commit()
+
+    # Workers index alerts by (host, metric_type), so one event per key will
+    # do, but it must carry the key's state after the update: the filters
+    # may have left another alert for the key pending.
+    latest = {}
+    for alert_id, alert_host, alert_type in rows:
+        latest[(alert_host, alert_type)] = max(alert_id, latest.get((alert_host, alert_type), alert_id))
+    still_pending = {}
+    if latest:
+        result = await session.execute(
+            select(Alert.host, Alert.metric_type, func.max(Alert.id))
+            .where(tuple_(Alert.host, Alert.metric_type).in_(list(latest)))
+            .where(Alert.status == "pending")
+            .group_by(Alert.host, Alert.metric_type)
+        )
+        still_pending = {(alert_host, alert_type): alert_id for alert_host, alert_type, alert_id in result.all()}
+    for key, alert_id in latest.items():
+        if key in still_pending:
+            await publish_alert_event(still_pending[key], *key, "pending")
+        else:
+            await publish_alert_event(alert_id, *key, update.status)
+    return {"updated": len(rows)}
 
 
 @app.patch("/alerts/{alert_id}", response_model=AlertResponse)
@@ -109,46 +429,68 @@ async def update_alert(
         raise HTTPException(status_code=404, detail="Alert not found")
 
     alert.status = update.status
+    alert.resolved_at = None if update.status == "pending" else alert.resolved_at or datetime.now(timezone.utc)
     await session.commit()
     await session.refresh(alert)
+    await publish_alert_event(alert.id, alert.host, alert.metric_type, alert.status)
     return alert
 
 
+@app.get("/rules", response_model=list[ThresholdRuleResponse])
+async def get_rules(session: AsyncSession = Depends(get_session)):
+    result = await session.execute(select(ThresholdRule).order_by(ThresholdRule.id))
+    return result.scalars().all()
+
+
+@app.post("/rules", response_model=ThresholdRuleResponse, status_code=201)
+async def create_rule(rule: ThresholdRuleCreate, session: AsyncSession = Depends(get_session)):
+    row = ThresholdRule(**rule.model_dump())
+    session.add(row)
+    await session.commit()
+    await session.refresh(row)
+    return row
+
+
+@app.put("/rules/{rule_id}", response_model=ThresholdRuleResponse)
+async def update_rule(rule_id: int, rule: ThresholdRuleCreate, session: AsyncSession = Depends(get_session)):
+    row = await session.get(ThresholdRule, rule_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="Rule not found")
+
+    for name, value in rule.model_dump().items():
+        setattr(row, name, value)
+    await session.commit()
+    await session.refresh(row)
+    return row
+
+
+@app.delete("/rules/{rule_id}", status_code=204)
+async def delete_rule(rule_id: int, session: AsyncSession = Depends(get_session)):
+    row = await session.get(ThresholdRule, rule_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="Rule not found")
+
+    await session.delete(row)
+    await session.commit()
+
+
 async def metrics_stream(host: Optional[str] = None):
-    last_timestamp = None
+    subscriber = broadcaster.subscribe(host)
+    try:
+        while True:
+            try:
+                frame = await asyncio.wait_for(subscriber.queue.get(), STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
 
-    while True:
-        async with AsyncSessionLocal() as session:
-            query = select(Metric).order_by(Metric.timestamp.desc()).limit(10)
-            if host:
-                query = query.where(Metric.host == host)
-            if last_timestamp:
-                query = query.where(Metric.timestamp > last_timestamp)
-
-            result = await session.execute(query)
-            metrics = result.scalars().all()
-
-            if metrics:
-                last_timestamp = metrics[0].timestamp
-                for metric in reversed(metrics):
-                    data = {
-                        "timestamp": metric.timestamp.isoformat(),
-                        "host": metric.host,
-                        "cpu_percent": metric.cpu_percent,
-                        "cpu_min": metric.cpu_min,
-                        "cpu_max": metric.cpu_max,
-                        "memory_percent": metric.memory_percent,
-                        "memory_min": metric.memory_min,
-                        "memory_max": metric.memory_max,
-                        "disk_percent": metric.disk_percent,
-                        "disk_min": metric.disk_min,
-                        "disk_max": metric.disk_max,
-                        "network_in": metric.network_in,
-                        "network_out": metric.network_out,
-                    }
-                    yield f"data: {json.dumps(data)}\n\n"
-
-        await asyncio.sleep(1)
+            # Send everything already queued in one write.
+            frames = [frame]
+            while not subscriber.queue.empty():
+                frames.append(subscriber.queue.get_nowait())
+            yield "".join(frames)
+    finally:
+        broadcaster.unsubscribe(subscriber)
 
 
 @app.get("/stream")
@@ -0,0 +1,59 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Optional, Sequence
+
+from fastapi import HTTPException, Response
+from pydantic_core import to_json
+from sqlalchemy import ColumnElement, FromClause
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(timestamp: datetime, key: Any) -> str:
+    payload = json.dumps([timestamp.isoformat(), key], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key_type: type) -> tuple[datetime, Any]:
+    """Decode a cursor whose second key must be a `key_type` (e.g. int ids, str hosts)."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, key = json.loads(base64.urlsafe_b64decode(padded))
+        # bool is an int subclass, but never a valid key.
+        if not isinstance(key, key_type) or isinstance(key, bool):
+            raise TypeError(f"expected a {key_type.__name__} key")
+        return datetime.fromisoformat(timestamp), key
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+
+def project(source: FromClause, fields: Optional[str], keys: Sequence[str]) -> list[ColumnElement]:
+    """Columns named in a comma-separated `fields`, plus the paging keys."""
+    if not fields:
+        return list(source.c)
+
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in source.c]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown field(s): {', '.join(unknown)}")
+    return [source.c[name] for name in dict.fromkeys([*keys, *names])]
+
+
+def json_page(rows: Sequence, limit: int, keys: tuple[str, str]) -> Response:
+    """Serialize rows straight to JSON, with a cursor header when more may follow.
+
+    `rows` already come typed from the database, so they skip the
+    response_model validate-then-dump round trip, which costs several
+    times more than the encoding itself on a 1000-row page.
+    """
+    headers = {}
+    if rows and len(rows) == limit:
+        last = rows[-1]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(last[keys[0]], last[keys[1]])
+
+    return json_response([dict(row) for row in rows], headers)
+
+
+def json_response(content: Any, headers: Optional[dict] = None) -> Response:
+    return Response(content=to_json(content), media_type="application/json", headers=headers)
@@ -1,6 +1,12 @@
 from datetime import datetime
-from typing import Optional
-from pydantic import BaseModel
+from typing import Literal, Optional
+from pydantic import BaseModel, Field, model_validator
+
+
+class SampleCreate(BaseModel):
+    name: str
+    labels: dict[str, str] = {}
+    value: float
 
 
 class MetricCreate(BaseModel):
@@ -16,6 +22,21 @@ class MetricCreate(BaseModel):
     disk_max: Optional[float] = None
     network_in: Optional[int] = None
     network_out: Optional[int] = None
+    cpu_stddev: Optional[float] = None
+    cpu_p50: Optional[float] = None
+    cpu_p95: Optional[float] = None
+    cpu_p99: Optional[float] = None
+    memory_stddev: Optional[float] = None
+    memory_p50: Optional[float] = None
+    memory_p95: Optional[float] = None
+    memory_p99: Optional[float] = None
+    disk_stddev: Optional[float] = None
+    disk_p50: Optional[float] = None
+    disk_p95: Optional[float] = None
+    disk_p99: Optional[float] = None
+    network_in_rate: Optional[float] = None
+    network_out_rate: Optional[float] = None
+    samples: list[SampleCreate] = []
     timestamp: Optional[datetime] = None
 
 
@@ -33,10 +54,33 @@ class MetricResponse(BaseModel):
     disk_max: Optional[float] = None
     network_in: Optional[int] = None
     network_out: Optional[int] = None
+    cpu_stddev: Optional[float] = None
+    cpu_p50: Optional[float] = None
+    cpu_p95: Optional[float] = None
+    cpu_p99: Optional[float] = None
+    memory_stddev: Optional[float] = None
+    memory_p50: Optional[float] = None
+    memory_p95: Optional[float] = None
+    memory_p99: Optional[float] = None
+    disk_stddev: Optional[float] = None
+    disk_p50: Optional[float] = None
+    disk_p95: Optional[float] = None
+    disk_p99: Optional[float] = None
+    network_in_rate: Optional[float] = None
+    network_out_rate: Optional[float] = None
 
     class Config:
         from_attributes = True
 
+
+class SampleResponse(BaseModel):
+    timestamp: datetime
+    host: str
+    name: str
+    labels: dict[str, str]
+    value: float
+
+
 class AlertResponse(BaseModel):
     id: int
     timestamp: datetime
@@ -45,11 +89,75 @@ class AlertResponse(BaseModel):
     severity: str
     message: Optional[str] = None
     status: str
+    resolved_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
 
+class HostCounts(BaseModel):
+    total: int
+    ok: int
+    warning: int
+    critical: int
+    stale: int
+
+
+class TopHost(BaseModel):
+    host: str
+    timestamp: datetime
+    cpu_percent: Optional[float] = None
+    memory_percent: Optional[float] = None
+
+
+class StaleHost(BaseModel):
+    host: str
+    timestamp: datetime
+    seconds_since: float
+
+
+class FleetSummary(BaseModel):
+    hosts: HostCounts
+    alerts: dict[str, int]
+    alerts_as_of: Optional[datetime] = None
+    top_cpu: list[TopHost]
+    top_memory: list[TopHost]
+    stale_hosts: list[StaleHost]
+
+
 class AlertUpdate(BaseModel):
     status: str
 
+
+class AlertBulkUpdateResponse(BaseModel):
+    updated: int
+
+
+
+class ThresholdRuleCreate(BaseModel):
+    host_pattern: str = Field(default="*", max_length=255, description='Host name or glob, e.g. "db-*"')
+    metric_type: Literal["cpu_percent", "memory_percent", "disk_percent"]
+    warning: Optional[float] = None
+    critical: Optional[float] = None
+    clear: Optional[float] = None
+    for_windows: int = Field(default=1, ge=1, description="Consecutive breaching reports before firing")
+    enabled: bool = True
+
+    @model_validator(mode="after")
+    def check_levels(self):
+        levels = [level for level in (self.warning, self.critical) if level is not None]
+        if not levels:
+            raise ValueError("At least one of warning or critical is required")
+        if self.warning is not None and self.critical is not None and self.warning > self.critical:
+            raise ValueError("warning must not be above critical")
+        if self.clear is not None and self.clear > min(levels):
+            raise ValueError("clear must not be above the lowest breach level")
+        return self
+
+
+class ThresholdRuleResponse(ThresholdRuleCreate):
+    id: int
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
@@ -1,4 +1,15 @@
 from .config import DATABASE_URL, RABBITMQ_URL
 from .database import engine, AsyncSessionLocal, Base, get_session
-from .models import Metric, Alert
-from .rabbitmq import publish_metric, get_channel, QUEUE_NAME
+from .models import Metric, MetricSample, Alert, ThresholdRule
+from .rabbitmq import (
+    publish_metric,
+    publish_metrics,
+    publish_alert_event,
+    get_channel,
+    get_alerts_exchange,
+    declare_metrics_queue,
+    shard_queue_name,
+    host_shard,
+    QUEUE_NAME,
+    ALERTS_EXCHANGE,
+)
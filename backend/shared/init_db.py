@@ -1,17 +1,118 @@
 import asyncio
-from sqlalchemy import text
+from sqlalchemy import String, bindparam, text
+from sqlalchemy.dialects import postgresql
 
+from .config import METRICS_COMPRESS_AFTER, METRICS_RAW_RETENTION
 from .database import engine, Base
-from .models import Metric, Alert
+from .models import Metric, MetricSample, Alert
+from .rollups import ROLLUPS, rollup_select_sql
+
+
+def _policy_sql(sql: str, *names: str):
+    """`sql` with `names` bound as text, so env-supplied intervals are never spliced in.
+
+    The statement casts them server-side, e.g. CAST(:after AS interval).
+    """
+    return text(sql).bindparams(*(bindparam(name, type_=String) for name in names))
+
+
+async def set_compression(conn, hypertable: str, segment_by: str, compress_after: str):
+    """Enable native compression and (re)apply its policy.
+
+    Policies are dropped and re-added so a changed interval takes effect;
+    an empty interval leaves compression enabled but removes the policy.
+    """
+    result = await conn.execute(text("""
+        SELECT compression_enabled FROM timescaledb_information.hypertables
+        WHERE hypertable_name = :name
+    """), {"name": hypertable})
+    # Compression settings cannot be altered once chunks are compressed.
+    if not result.scalar():
+        await conn.execute(text(f"""
+            ALTER TABLE {hypertable} SET (
+                timescaledb.compress,
+                timescaledb.compress_segmentby = '{segment_by}',
+                timescaledb.compress_orderby = 'timestamp DESC'
+            );
+        """))
+
+    await conn.execute(_policy_sql(
+        "SELECT remove_compression_policy(CAST(:relation AS regclass), if_exists => TRUE)", "relation",
+    ), {"relation": hypertable})
+    if compress_after:
+        await conn.execute(_policy_sql(
+            "SELECT add_compression_policy(CAST(:relation AS regclass), CAST(:after AS interval))",
+            "relation", "after",
+        ), {"relation": hypertable, "after": compress_after})
+
+
+async def set_retention(conn, relation: str, drop_after: str):
+    await conn.execute(_policy_sql(
+        "SELECT remove_retention_policy(CAST(:relation AS regclass), if_exists => TRUE)", "relation",
+    ), {"relation": relation})
+    if drop_after:
+        await conn.execute(_policy_sql(
+            "SELECT add_retention_policy(CAST(:relation AS regclass), CAST(:after AS interval))",
+            "relation", "after",
+        ), {"relation": relation, "after": drop_after})
 
 
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # create_all neither adds new columns nor indexes to existing tables.
+        for column in Metric.__table__.columns:
+            if column.primary_key:
+                continue
+            column_type = column.type.compile(dialect=postgresql.dialect())
+            await conn.execute(text(
+                f"ALTER TABLE metrics ADD COLUMN IF NOT EXISTS {column.name} {column_type}"
+            ))
+        await conn.execute(text("ALTER TABLE alerts ADD COLUMN IF NOT EXISTS resolved_at TIMESTAMPTZ"))
+        # Alerts closed before resolved_at existed age out by when they were raised.
+        await conn.execute(text(
+            "UPDATE alerts SET resolved_at = timestamp WHERE status <> 'pending' AND resolved_at IS NULL"
+        ))
+
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                await conn.run_sync(index.create, checkfirst=True)
 
         await conn.execute(text("""
             SELECT create_hypertable('metrics', 'timestamp', if_not_exists => TRUE);
         """))
+        await conn.execute(text("""
+            SELECT create_hypertable('metric_samples', 'timestamp', if_not_exists => TRUE);
+        """))
+
+    # Continuous aggregates cannot be created inside a transaction block.
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for resolution, rollup in ROLLUPS.items():
+            await conn.execute(text(f"""
+                CREATE MATERIALIZED VIEW IF NOT EXISTS {rollup["view"]}
+                WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+                {rollup_select_sql(resolution)}
+                WITH NO DATA;
+            """))
+            await conn.execute(_policy_sql("""
+                SELECT add_continuous_aggregate_policy(CAST(:relation AS regclass),
+                    start_offset => CAST(:start AS interval),
+                    end_offset => CAST(:end AS interval),
+                    schedule_interval => CAST(:schedule AS interval),
+                    if_not_exists => TRUE)
+            """, "relation", "start", "end", "schedule"), {
+                "relation": rollup["view"],
+                "start": rollup["refresh_start"],
+                "end": rollup["refresh_end"],
+                "schedule": rollup["schedule"],
+            })
+            await set_retention(conn, rollup["view"], rollup["retention"])
+
+        await set_compression(conn, "metrics", "host", METRICS_COMPRESS_AFTER)
+        await set_retention(conn, "metrics", METRICS_RAW_RETENTION)
+        await set_compression(conn, "metric_samples", "host, name", METRICS_COMPRESS_AFTER)
+        await set_retention(conn, "metric_samples", METRICS_RAW_RETENTION)
 
     print("Database initialized successfully")
 
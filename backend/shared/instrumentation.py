@@ -0,0 +1,45 @@
+"""Prometheus-style metrics for the API and worker; see metrics_core.
+
+Only the /internal/metrics endpoint is specific to the backend: it is
+served from the running event loop.
+"""
+import asyncio
+from typing import Optional
+
+from .metrics_core import (  # noqa: F401
+    CONTENT_TYPE,
+    DEFAULT_BUCKETS,
+    Counter,
+    Gauge,
+    Histogram,
+    register_callback,
+    render,
+)
+
+
+async def start_metrics_server(port: int, host: str = "0.0.0.0") -> Optional[asyncio.AbstractServer]:
+    """Serve GET /internal/metrics on `port` from the running event loop (0 disables)."""
+    if not port:
+        return None
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            path = request.split(b" ", 2)[1] if request.count(b" ") >= 2 else b""
+            if path.split(b"?")[0] == b"/internal/metrics":
+                status, body = "200 OK", render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Serving /internal/metrics on port {port}")
+    return server
@@ -0,0 +1,107 @@
+import struct
+from datetime import datetime, timedelta, timezone
+
+METRICS_CONTENT_TYPE = "application/x-nazar-metrics"
+FORMAT_VERSION = 3
+
+# Column layout per format version. Adding a column means adding a version,
+# so messages already sitting in the queue remain decodable.
+FLOAT_FIELDS = {
+    2: (
+        "cpu_percent", "cpu_min", "cpu_max",
+        "memory_percent", "memory_min", "memory_max",
+        "disk_percent", "disk_min", "disk_max",
+    ),
+}
+FLOAT_FIELDS[3] = FLOAT_FIELDS[2] + (
+    "cpu_stddev", "cpu_p50", "cpu_p95", "cpu_p99",
+    "memory_stddev", "memory_p50", "memory_p95", "memory_p99",
+    "disk_stddev", "disk_p50", "disk_p95", "disk_p99",
+    "network_in_rate", "network_out_rate",
+)
+INT_FIELDS = {
+    2: ("network_in", "network_out"),
+    3: ("network_in", "network_out"),
+}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+# version, record count
+_HEADER = struct.Struct("<BI")
+
+
+def _record_struct(version: int) -> struct.Struct:
+    # timestamp (us since epoch), null bitmask, floats, ints, host length
+    return struct.Struct(f"<qI{len(FLOAT_FIELDS[version])}d{len(INT_FIELDS[version])}qH")
+
+
+_RECORDS = {version: _record_struct(version) for version in FLOAT_FIELDS}
+
+
+def as_utc(timestamp: datetime) -> datetime:
+    """Timezone-aware UTC; naive timestamps are taken to be UTC already."""
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+
+def encode_metrics(rows: list[dict], version: int = FORMAT_VERSION) -> bytes:
+    """Pack full metric rows into the fixed binary queue format."""
+    record = _RECORDS[version]
+    fields = FLOAT_FIELDS[version] + INT_FIELDS[version]
+    n_floats = len(FLOAT_FIELDS[version])
+    parts = [_HEADER.pack(version, len(rows))]
+
+    for row in rows:
+        timestamp = as_utc(row["timestamp"])
+        nulls = 0
+        values = []
+        for i, name in enumerate(fields):
+            value = row.get(name)
+            if value is None:
+                nulls |= 1 << i
+                value = 0.0 if i < n_floats else 0
+            values.append(value)
+
+        host = row["host"].encode()
+        parts.append(record.pack((timestamp - EPOCH) // MICROSECOND, nulls, *values, len(host)))
+        parts.append(host)
+
+    return b"".join(parts)
+
+
+def decode_metrics(body: bytes) -> list[dict]:
+    """Unpack a binary queue message into metric rows.
+
+    Raises ValueError for an unknown version or a truncated body.
+    """
+    try:
+        version, count = _HEADER.unpack_from(body)
+    except struct.error as e:
+        raise ValueError(f"Truncated metrics message: {e}") from e
+    record = _RECORDS.get(version)
+    if record is None:
+        raise ValueError(f"Unsupported metrics message version: {version}")
+
+    fields = FLOAT_FIELDS[version] + INT_FIELDS[version]
+    offset = _HEADER.size
+    rows = []
+
+    for _ in range(count):
+        try:
+            micros, nulls, *values, host_len = record.unpack_from(body, offset)
+        except struct.error as e:
+            raise ValueError(f"Truncated metrics message: {e}") from e
+        offset += record.size
+        if offset + host_len > len(body):
+            raise ValueError("Truncated metrics message: host name cut short")
+        host = body[offset:offset + host_len].decode()
+        offset += host_len
+
+        row = {"timestamp": EPOCH + micros * MICROSECOND, "host": host}
+        for i, name in enumerate(fields):
+            row[name] = None if nulls & (1 << i) else values[i]
+        rows.append(row)
+
+    return rows
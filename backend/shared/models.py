@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, Float, BigInteger, DateTime, Integer, Text
+from sqlalchemy import Column, String, Float, BigInteger, Boolean, DateTime, Integer, Text, Index, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 
 from .database import Base
@@ -6,6 +7,10 @@ from .database import Base
 
 class Metric(Base):
     __tablename__ = "metrics"
+    __table_args__ = (
+        # Per-host pages of GET /metrics; TimescaleDB only indexes timestamp.
+        Index("ix_metrics_host_timestamp", "host", "timestamp"),
+    )
 
     timestamp = Column(DateTime(timezone=True), primary_key=True, nullable=False)
     host = Column(String(255), primary_key=True, nullable=False)
@@ -20,10 +25,52 @@ class Metric(Base):
     disk_max = Column(Float)
     network_in = Column(BigInteger)
     network_out = Column(BigInteger)
+    cpu_stddev = Column(Float)
+    cpu_p50 = Column(Float)
+    cpu_p95 = Column(Float)
+    cpu_p99 = Column(Float)
+    memory_stddev = Column(Float)
+    memory_p50 = Column(Float)
+    memory_p95 = Column(Float)
+    memory_p99 = Column(Float)
+    disk_stddev = Column(Float)
+    disk_p50 = Column(Float)
+    disk_p95 = Column(Float)
+    disk_p99 = Column(Float)
+    network_in_rate = Column(Float)
+    network_out_rate = Column(Float)
+
+
+class MetricSample(Base):
+    """Narrow (host, timestamp, name, labels, value) rows for open-ended series
+    such as per-core CPU, per-device I/O or top processes."""
+
+    __tablename__ = "metric_samples"
+
+    timestamp = Column(DateTime(timezone=True), primary_key=True, nullable=False)
+    host = Column(String(255), primary_key=True, nullable=False)
+    name = Column(String(255), primary_key=True, nullable=False)
+    labels = Column(JSONB, primary_key=True, nullable=False, server_default=text("'{}'::jsonb"))
+    value = Column(Float, nullable=False)
 
 
 class Alert(Base):
     __tablename__ = "alerts"
+    __table_args__ = (
+        # Backs the worker's open-alert lookup when its in-memory index is cold.
+        Index(
+            "ix_alerts_pending",
+            "host",
+            "metric_type",
+            postgresql_where=text("status = 'pending'"),
+        ),
+        # Keyset pagination of GET /alerts, ordered by (timestamp, id).
+        Index("ix_alerts_timestamp", "timestamp", "id"),
+        Index("ix_alerts_host_status_timestamp", "host", "status", "timestamp", "id"),
+        Index("ix_alerts_severity_timestamp", "severity", "timestamp", "id"),
+        # Age-out of closed alerts.
+        Index("ix_alerts_resolved_at", "resolved_at", postgresql_where=text("status <> 'pending'")),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     timestamp = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
@@ -32,3 +79,26 @@ class Alert(Base):
     severity = Column(String(20), nullable=False)
     message = Column(Text)
     status = Column(String(20), nullable=False, default="pending")
+    # Set when the alert leaves "pending", automatically or by hand.
+    resolved_at = Column(DateTime(timezone=True))
+
+
+class ThresholdRule(Base):
+    """Per-host threshold overrides; the worker reloads them without a restart.
+
+    `host_pattern` is a host name or a glob such as "db-*". `clear` is the
+    level the value must drop to before a firing rule resets, and the rule
+    only fires after `for_windows` consecutive breaching rows.
+    """
+
+    __tablename__ = "threshold_rules"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    host_pattern = Column(String(255), nullable=False, default="*")
+    metric_type = Column(String(50), nullable=False)
+    warning = Column(Float)
+    critical = Column(Float)
+    clear = Column(Float)
+    for_windows = Column(Integer, nullable=False, default=1)
+    enabled = Column(Boolean, nullable=False, default=True)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
@@ -1,16 +1,44 @@
 import json
+import zlib
 from typing import Optional
-from aio_pika import connect_robust, Message
-from aio_pika.abc import AbstractRobustConnection, AbstractChannel
+from aio_pika import connect_robust, Message, ExchangeType
+from aio_pika.abc import AbstractRobustConnection, AbstractChannel, AbstractExchange, AbstractQueue
 
-from .config import RABBITMQ_URL
+from .config import RABBITMQ_URL, QUEUE_MESSAGE_FORMAT, METRICS_SHARDS
+from .instrumentation import Counter, Histogram
+from .messages import METRICS_CONTENT_TYPE, encode_metrics
 
 QUEUE_NAME = "metrics"
+ALERTS_EXCHANGE = "alerts"
+
+PUBLISH_SECONDS = Histogram("nazar_queue_publish_seconds", "Time to publish one batch of metric rows")
+PUBLISHED_ROWS = Counter("nazar_queue_published_rows_total", "Metric rows published to the metrics queue(s)")
 
 _connection: Optional[AbstractRobustConnection] = None
 _channel: Optional[AbstractChannel] = None
 
 
+def host_shard(host: str) -> int:
+    # crc32 rather than hash(), which is salted per process.
+    return zlib.crc32(host.encode()) % METRICS_SHARDS
+
+
+def shard_queue_name(shard: int) -> str:
+    return QUEUE_NAME if METRICS_SHARDS == 1 else f"{QUEUE_NAME}.{shard}"
+
+
+async def declare_metrics_queue(channel: AbstractChannel, shard: int) -> AbstractQueue:
+    if METRICS_SHARDS == 1:
+        return await channel.declare_queue(QUEUE_NAME, durable=True)
+    # A single active consumer per shard keeps its hosts in order even if
+    # two workers are (mis)configured to consume the same shard.
+    return await channel.declare_queue(
+        shard_queue_name(shard),
+        durable=True,
+        arguments={"x-single-active-consumer": True},
+    )
+
+
 async def get_channel() -> AbstractChannel:
     global _connection, _channel
 
@@ -19,7 +47,8 @@ async def get_channel() -> AbstractChannel:
 
     if _channel is None or _channel.is_closed:
         _channel = await _connection.channel()
-        await _channel.declare_queue(QUEUE_NAME, durable=True)
+        for shard in range(METRICS_SHARDS):
+            await declare_metrics_queue(_channel, shard)
 
     return _channel
 
@@ -30,7 +59,61 @@ async def publish_metric(host: str, timestamp: str):
         body=json.dumps({"host": host, "timestamp": timestamp}).encode(),
         content_type="application/json",
     )
-    await channel.default_exchange.publish(message, routing_key=QUEUE_NAME)
+    await channel.default_exchange.publish(message, routing_key=shard_queue_name(host_shard(host)))
+
+
+async def publish_metrics(rows: list[dict]):
+    """Publish rows as one message per shard, preserving their order."""
+    shards: dict[int, list[dict]] = {}
+    for row in rows:
+        shards.setdefault(host_shard(row["host"]), []).append(row)
+
+    with PUBLISH_SECONDS.time():
+        channel = await get_channel()
+        for shard, shard_rows in shards.items():
+            await channel.default_exchange.publish(
+                _metrics_message(shard_rows),
+                routing_key=shard_queue_name(shard),
+            )
+    PUBLISHED_ROWS.inc(len(rows))
+
+
+def _metrics_message(rows: list[dict]) -> Message:
+    if QUEUE_MESSAGE_FORMAT >= 2:
+        return Message(
+            body=encode_metrics(rows, QUEUE_MESSAGE_FORMAT),
+            content_type=METRICS_CONTENT_TYPE,
+        )
+    # Key-only format for workers that predate full payloads.
+    return Message(
+        body=json.dumps({
+            "metrics": [
+                {"host": row["host"], "timestamp": row["timestamp"].isoformat()}
+                for row in rows
+            ]
+        }).encode(),
+        content_type="application/json",
+    )
+
+
+async def get_alerts_exchange(channel: AbstractChannel) -> AbstractExchange:
+    return await channel.declare_exchange(ALERTS_EXCHANGE, ExchangeType.FANOUT, durable=True)
+
+
+async def publish_alert_event(alert_id: int, host: str, metric_type: str, status: str):
+    """Broadcast an alert status change so workers can update their caches."""
+    channel = await get_channel()
+    exchange = await get_alerts_exchange(channel)
+    message = Message(
+        body=json.dumps({
+            "id": alert_id,
+            "host": host,
+            "metric_type": metric_type,
+            "status": status,
+        }).encode(),
+        content_type="application/json",
+    )
+    await exchange.publish(message, routing_key="")
 
 
 async def close_connection():
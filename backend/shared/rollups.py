@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import table, column
+from sqlalchemy.sql import TableClause
+
+from .config import METRICS_1M_RETENTION, METRICS_1H_RETENTION, METRICS_1D_RETENTION
+from .messages import as_utc
+from .models import Metric
+
+# Columns the rollup views carry. Views are not altered in place, so
+# metrics columns added later are only available at raw resolution.
+ROLLUP_COLUMNS = [
+    "timestamp", "host",
+    "cpu_percent", "cpu_min", "cpu_max",
+    "memory_percent", "memory_min", "memory_max",
+    "disk_percent", "disk_min", "disk_max",
+    "network_in", "network_out",
+]
+
+# Agents report one row per 10 s window by default.
+RAW_INTERVAL = timedelta(seconds=10)
+
+# TimescaleDB continuous aggregates over `metrics`, finest first.
+ROLLUPS = {
+    "1m": {
+        "view": "metrics_1m",
+        "bucket": timedelta(minutes=1),
+        "refresh_start": "2 hours",
+        "refresh_end": "1 minute",
+        "schedule": "1 minute",
+        "retention": METRICS_1M_RETENTION,
+    },
+    "1h": {
+        "view": "metrics_1h",
+        "bucket": timedelta(hours=1),
+        "refresh_start": "3 days",
+        "refresh_end": "1 hour",
+        "schedule": "30 minutes",
+        "retention": METRICS_1H_RETENTION,
+    },
+    "1d": {
+        "view": "metrics_1d",
+        "bucket": timedelta(days=1),
+        "refresh_start": "7 days",
+        "refresh_end": "1 day",
+        "schedule": "1 hour",
+        "retention": METRICS_1D_RETENTION,
+    },
+}
+
+
+def rollup_table(resolution: str) -> TableClause:
+    """Lightweight table construct for a rollup view; it shares the metrics columns."""
+    return table(
+        ROLLUPS[resolution]["view"],
+        *(column(name, Metric.__table__.c[name].type) for name in ROLLUP_COLUMNS),
+    )
+
+
+def rollup_select_sql(resolution: str) -> str:
+    """Aggregate query behind a rollup view.
+
+    Averages stay averages, `*_min`/`*_max` keep their min/max meaning
+    (falling back to the average for agents that send no min/max), and the
+    cumulative network counters keep their latest value.
+    """
+    bucket = ROLLUPS[resolution]["bucket"]
+    columns = []
+    for prefix in ("cpu", "memory", "disk"):
+        columns += [
+            f"avg({prefix}_percent) AS {prefix}_percent",
+            f"min(coalesce({prefix}_min, {prefix}_percent)) AS {prefix}_min",
+            f"max(coalesce({prefix}_max, {prefix}_percent)) AS {prefix}_max",
+        ]
+    columns += ["max(network_in) AS network_in", "max(network_out) AS network_out"]
+
+    bucket_expr = f"time_bucket(INTERVAL '{int(bucket.total_seconds())} seconds', timestamp)"
+    return (
+        f"SELECT {bucket_expr} AS timestamp, host, "
+        + ", ".join(columns)
+        + f" FROM metrics GROUP BY {bucket_expr}, host"
+    )
+
+
+def choose_resolution(start: Optional[datetime], end: Optional[datetime], points: int) -> str:
+    """Pick the finest resolution that covers start..end in at most `points` rows.
+
+    Without a start the range is unbounded, so raw rows are returned.
+    """
+    if start is None:
+        return "raw"
+    span = (as_utc(end) if end else datetime.now(timezone.utc)) - as_utc(start)
+    if span / RAW_INTERVAL <= points:
+        return "raw"
+    for resolution, rollup in ROLLUPS.items():
+        if span / rollup["bucket"] <= points:
+            return resolution
+    return list(ROLLUPS)[-1]
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from worker import main
+
+
+class FakeMessage:
+    def __init__(self, body: bytes, redelivered: bool = False):
+        self.body = body
+        self.redelivered = redelivered
+        self.outcome = None
+
+    async def ack(self, multiple: bool = False):
+        self.outcome = "ack-multiple" if multiple else "ack"
+
+    async def nack(self, requeue: bool = True):
+        self.outcome = "requeue" if requeue else "drop"
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    """Replace process_batch; a message fails as its body says."""
+    seen = []
+
+    async def process_batch(messages):
+        seen.append([message.body for message in messages])
+        for message in messages:
+            if message.body == b"bad":
+                raise ValueError("malformed")
+            if message.body == b"db-down":
+                raise ConnectionRefusedError("database unavailable")
+
+    monkeypatch.setattr(main, "process_batch", process_batch)
+    return seen
+
+
+def consume(consumer: main.BatchConsumer, messages: list[FakeMessage]):
+    async def run():
+        for message in messages:
+            await consumer(message)
+        await consumer.close()
+
+    asyncio.run(run())
+
+
+def test_batch_is_acked_together(batches):
+    messages = [FakeMessage(b"a"), FakeMessage(b"b")]
+    consume(main.BatchConsumer(max_messages=2, max_wait_ms=1000), messages)
+
+    assert batches == [[b"a", b"b"]]
+    assert [message.outcome for message in messages] == [None, "ack-multiple"]
+
+
+def test_failed_batch_drops_only_the_bad_message(batches):
+    messages = [FakeMessage(b"a"), FakeMessage(b"bad"), FakeMessage(b"c")]
+    consume(main.BatchConsumer(max_messages=3, max_wait_ms=1000), messages)
+
+    assert batches == [[b"a", b"bad", b"c"], [b"a"], [b"bad"], [b"c"]]
+    assert [message.outcome for message in messages] == ["ack", "drop", "ack"]
+
+
+def test_transient_failure_is_requeued_once(batches):
+    first, again = FakeMessage(b"db-down"), FakeMessage(b"db-down", redelivered=True)
+    consume(main.BatchConsumer(max_messages=2, max_wait_ms=1000), [first, again])
+
+    assert (first.outcome, again.outcome) == ("requeue", "drop")
+
+
+def test_close_flushes_pending_messages(batches):
+    messages = [FakeMessage(b"a")]
+    consume(main.BatchConsumer(max_messages=10, max_wait_ms=60000), messages)
+
+    assert batches == [[b"a"]]
+    assert messages[0].outcome == "ack-multiple"
@@ -0,0 +1,47 @@
+import json
+from datetime import datetime, timezone
+
+from api.broadcast import STREAM_COLUMNS, Broadcaster
+
+
+def row(host: str) -> dict:
+    return {
+        "timestamp": datetime(2026, 1, 1, tzinfo=timezone.utc),
+        "host": host,
+        "cpu_percent": 12.5,
+        "cpu_p99": 40.0,
+        "samples": [{"name": "disk_read_bytes", "labels": {"device": "sda"}, "value": 1.0}],
+    }
+
+
+def frames(subscriber) -> list[dict]:
+    received = []
+    while not subscriber.queue.empty():
+        received.append(json.loads(subscriber.queue.get_nowait().removeprefix("data: ")))
+    return received
+
+
+def test_frames_carry_only_dashboard_columns():
+    broadcaster = Broadcaster(max_queue=10)
+    subscriber = broadcaster.subscribe()
+    broadcaster.publish([row("web-1")])
+
+    [frame] = frames(subscriber)
+    assert set(frame) == set(STREAM_COLUMNS)
+    assert frame["cpu_percent"] == 12.5
+    assert frame["timestamp"] == "2026-01-01T00:00:00+00:00"
+
+
+def test_host_filter_and_full_queue():
+    broadcaster = Broadcaster(max_queue=1)
+    web1 = broadcaster.subscribe("web-1")
+    everyone = broadcaster.subscribe()
+    broadcaster.publish([row("web-1"), row("web-2")])
+
+    assert [frame["host"] for frame in frames(web1)] == ["web-1"]
+    assert [frame["host"] for frame in frames(everyone)] == ["web-1"]
+    assert everyone.dropped == 1
+
+    assert broadcaster.subscriber_count == 2
+    broadcaster.unsubscribe(web1)
+    assert broadcaster.subscriber_count == 1
@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta, timezone
+
+from api.fleet import FleetState
+
+
+def test_prune_drops_hosts_that_stopped_reporting():
+    now = datetime.now(timezone.utc)
+    fleet = FleetState()
+    fleet.update([
+        {"host": "web-1", "timestamp": now, "cpu_percent": 10.0},
+        {"host": "old-1", "timestamp": now - timedelta(days=2), "cpu_percent": 90.0},
+    ])
+
+    fleet.prune(timedelta(hours=24))
+
+    assert [row["host"] for row in fleet.hosts()] == ["web-1"]
+    assert fleet.summary(top=5, stale_after=60)["hosts"]["total"] == 1
+
+
+def test_update_keeps_the_newest_row_without_samples():
+    now = datetime.now(timezone.utc)
+    fleet = FleetState()
+    fleet.update([{"host": "web-1", "timestamp": now, "cpu_percent": 10.0, "samples": [{}]}])
+    fleet.update([{"host": "web-1", "timestamp": now - timedelta(seconds=10), "cpu_percent": 50.0}])
+
+    [row] = fleet.hosts()
+    assert row["cpu_percent"] == 10.0
+    assert "samples" not in row
@@ -0,0 +1,205 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from api import ingest
+from api.ingest import insert_metrics
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    """Records executed statements per table; the metrics INSERT ... RETURNING
+    reports `inserted` as the keys the database actually wrote."""
+
+    def __init__(self, inserted=()):
+        self.inserted = list(inserted)
+        self.executed: list[str] = []
+        self.commits = 0
+
+    async def execute(self, statement):
+        self.executed.append(statement.table.name)
+        if statement.table.name != "metrics":
+            return FakeResult([])
+        inserted, self.inserted = self.inserted, []
+        return FakeResult(inserted)
+
+    async def commit(self):
+        self.commits += 1
+
+
+def row(host, timestamp, samples=()):
+    return {"host": host, "timestamp": timestamp, "cpu_percent": 1.0, "samples": list(samples)}
+
+
+def test_only_new_rows_are_returned():
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    later = now + timedelta(seconds=10)
+    rows = [
+        row("web-1", now),                          # already stored
+        row("web-2", now),
+        row("web-2", now),                          # repeated within the batch
+        row("web-1", later.replace(tzinfo=None)),   # naive, read as UTC
+    ]
+    session = FakeSession(inserted=[(now, "web-2"), (later, "web-1")])
+
+    new_rows = asyncio.run(insert_metrics(session, rows))
+
+    assert new_rows == [rows[1], rows[3]]
+    assert session.executed == ["metrics"]
+
+
+def test_rows_and_samples_are_inserted_in_chunks(monkeypatch):
+    # A metric row has 3 columns here and a sample 5, so 10 parameters fit
+    # three metric rows or two samples per statement.
+    monkeypatch.setattr(ingest, "MAX_INSERT_PARAMS", 10)
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    sample = {"name": "load.1m", "labels": {}, "value": 0.5}
+    rows = [row(f"web-{i}", now, [sample]) for i in range(5)]
+    session = FakeSession()
+
+    asyncio.run(insert_metrics(session, rows))
+
+    assert session.executed == ["metrics"] * 2 + ["metric_samples"] * 3
+
+
+def test_batch_body_size_is_bounded(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from api import main
+
+    monkeypatch.setattr(main, "INGEST_MAX_BODY_BYTES", 64)
+    client = TestClient(main.app)
+    body = b"[" + b" " * 100 + b"]"
+
+    response = client.post("/metrics/batch", content=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == 413
+
+    # Without a Content-Length the body is counted as it streams in.
+    response = client.post(
+        "/metrics/batch",
+        content=iter([body[:50], body[50:]]),
+        headers={"Content-Type": "application/json"},
+    )
+    assert response.status_code == 413
+
+
+class StubStore:
+    """Stands in for the session factory, write_metrics and publish_metrics."""
+
+    def __init__(self, monkeypatch):
+        self.writes: list[list[dict]] = []
+        self.published: list[list[dict]] = []
+        self.error = None
+        monkeypatch.setattr(ingest, "AsyncSessionLocal", self.session)
+        monkeypatch.setattr(ingest, "write_metrics", self.write_metrics)
+        monkeypatch.setattr(ingest, "publish_metrics", self.publish_metrics)
+
+    def session(self):
+        store = self
+
+        class Session:
+            async def __aenter__(self):
+                return store
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Session()
+
+    async def write_metrics(self, session, rows):
+        if self.error:
+            raise self.error
+        self.writes.append(rows)
+        return rows
+
+    async def publish_metrics(self, rows):
+        self.published.append(rows)
+
+
+def test_write_buffer_coalesces_concurrent_adds(monkeypatch):
+    store = StubStore(monkeypatch)
+    committed = []
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    async def run():
+        buffer = ingest.WriteBuffer(max_rows=100, max_delay_ms=10, on_commit=committed.append)
+        await asyncio.gather(*(buffer.add(row(f"web-{i}", now)) for i in range(3)))
+        await buffer.close()
+
+    asyncio.run(run())
+
+    assert [len(rows) for rows in store.writes] == [3]
+    assert store.published == store.writes == committed
+
+
+def test_write_buffer_flushes_at_max_rows_without_waiting(monkeypatch):
+    store = StubStore(monkeypatch)
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    async def run():
+        buffer = ingest.WriteBuffer(max_rows=2, max_delay_ms=60000)
+        await asyncio.wait_for(
+            asyncio.gather(*(buffer.add(row(f"web-{i}", now)) for i in range(4))),
+            timeout=1,
+        )
+        await buffer.close()
+
+    asyncio.run(run())
+
+    assert [len(rows) for rows in store.writes] == [2, 2]
+
+
+def test_write_buffer_flushes_after_max_delay(monkeypatch):
+    store = StubStore(monkeypatch)
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    async def run():
+        buffer = ingest.WriteBuffer(max_rows=100, max_delay_ms=20)
+        await asyncio.wait_for(buffer.add(row("web-1", now)), timeout=1)
+        return buffer.pending
+
+    assert asyncio.run(run()) == 0
+    assert [len(rows) for rows in store.writes] == [1]
+
+
+def test_write_buffer_failure_reaches_every_waiter(monkeypatch):
+    store = StubStore(monkeypatch)
+    store.error = ConnectionRefusedError("database unavailable")
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    async def run():
+        buffer = ingest.WriteBuffer(max_rows=2, max_delay_ms=60000)
+        return await asyncio.gather(
+            buffer.add(row("web-1", now)), buffer.add(row("web-2", now)), return_exceptions=True,
+        )
+
+    results = asyncio.run(run())
+
+    assert [type(result) for result in results] == [ConnectionRefusedError] * 2
+    assert store.published == []
+
+
+def test_write_buffer_close_drains_pending_rows(monkeypatch):
+    store = StubStore(monkeypatch)
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    async def run():
+        buffer = ingest.WriteBuffer(max_rows=100, max_delay_ms=60000)
+        adding = asyncio.create_task(buffer.add(row("web-1", now)))
+        await asyncio.sleep(0)
+        await buffer.close()
+        await adding
+        try:
+            await buffer.add(row("web-2", now))
+        except RuntimeError:
+            return True
+        return False
+
+    assert asyncio.run(run())
+    assert [len(rows) for rows in store.writes] == [1]
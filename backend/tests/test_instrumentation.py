@@ -0,0 +1,29 @@
+import os
+
+from shared import metrics_core
+from shared.metrics_core import Counter, Histogram, register_callback, render
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_agent_copy_matches():
+    with open(metrics_core.__file__, "rb") as f:
+        backend = f.read()
+    with open(os.path.join(ROOT, "agent", "metrics_core.py"), "rb") as f:
+        agent = f.read()
+    assert agent == backend, "agent/metrics_core.py must be a verbatim copy of backend/shared/metrics_core.py"
+
+
+def test_render():
+    requests = Counter("test_requests_total", "Requests", ("code",))
+    requests.labels("200").inc(3)
+    latency = Histogram("test_latency_seconds", "Latency", buckets=(0.1, 1.0))
+    latency.observe(0.5)
+    register_callback("test_queue", "Queue size", lambda: 7)
+
+    text = render()
+    assert 'test_requests_total{code="200"} 3' in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 0' in text
+    assert 'test_latency_seconds_bucket{le="1"} 1' in text
+    assert "test_latency_seconds_count 1" in text
+    assert "test_queue 7" in text
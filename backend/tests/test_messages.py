@@ -0,0 +1,44 @@
+import struct
+from datetime import datetime, timezone
+
+import pytest
+
+from shared.messages import FLOAT_FIELDS, INT_FIELDS, decode_metrics, encode_metrics
+
+
+def full_row(version: int) -> dict:
+    row = {"timestamp": datetime(2026, 1, 1, 12, 0, 0, 123456, tzinfo=timezone.utc), "host": "wéb-1"}
+    for i, name in enumerate(FLOAT_FIELDS[version]):
+        row[name] = i + 0.5
+    for i, name in enumerate(INT_FIELDS[version]):
+        row[name] = 2 ** 40 + i
+    return row
+
+
+@pytest.mark.parametrize("version", [2, 3])
+def test_round_trip(version):
+    sparse = {"timestamp": datetime(2026, 1, 1), "host": "db-1", "cpu_percent": 10.0}
+    rows = decode_metrics(encode_metrics([full_row(version), sparse], version))
+
+    assert rows[0] == full_row(version)
+    # Missing columns come back as None and naive timestamps as UTC.
+    assert rows[1]["timestamp"] == datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert rows[1]["cpu_percent"] == 10.0
+    assert rows[1]["network_in"] is None
+    assert set(rows[1]) == {"timestamp", "host", *FLOAT_FIELDS[version], *INT_FIELDS[version]}
+
+
+def test_empty_message():
+    assert decode_metrics(encode_metrics([])) == []
+
+
+def test_unknown_version_is_rejected():
+    with pytest.raises(ValueError, match="version"):
+        decode_metrics(struct.pack("<BI", 9, 0))
+
+
+@pytest.mark.parametrize("cut", [0, 3, 20, -2])
+def test_truncated_message_raises_value_error(cut):
+    body = encode_metrics([full_row(3)])
+    with pytest.raises(ValueError, match="Truncated"):
+        decode_metrics(body[:cut])
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from worker import model_registry
+from worker.model_registry import ModelRegistry
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(model_registry, "time", clock)
+    return clock
+
+
+def fitted(nbytes: int):
+    """Stand-in for a fitted ensemble of `nbytes` bytes."""
+    return SimpleNamespace(estimators_features_=[np.zeros(nbytes, dtype=np.uint8)])
+
+
+def detector(key: str):
+    return SimpleNamespace(key=key, model=None, training=False)
+
+
+def registry(max_bytes: int = 1000, ttl: float = 60) -> ModelRegistry:
+    return ModelRegistry(detector, max_bytes=max_bytes, ttl_seconds=ttl)
+
+
+def install(reg: ModelRegistry, key: str, nbytes: int):
+    reg.get(key).model = fitted(nbytes)
+    reg.resize(key)
+
+
+def test_hits_and_loads_are_counted(clock):
+    reg = registry()
+    first = reg.get("web-1")
+    assert reg.get("web-1") is first
+    reg.get("web-2")
+
+    stats = reg.stats()
+    assert (stats["hits"], stats["loads"], stats["resident"]) == (1, 2, 2)
+
+
+def test_least_recently_used_model_is_evicted_over_capacity(clock):
+    reg = registry(max_bytes=1000)
+    install(reg, "web-1", 400)
+    install(reg, "web-2", 400)
+    reg.get("web-1")  # web-2 is now the least recently used
+    install(reg, "web-3", 400)
+
+    assert sorted(reg._entries) == ["web-1", "web-3"]
+    assert reg.stats()["bytes"] == 800
+    assert reg.evictions == 1
+
+
+def test_a_detector_in_training_is_kept(clock):
+    reg = registry(max_bytes=1000)
+    install(reg, "web-1", 600)
+    reg.get("web-1").training = True
+    install(reg, "web-2", 600)
+
+    assert len(reg) == 2
+    assert reg.evictions == 0
+
+
+def test_idle_detectors_expire(clock):
+    reg = registry(ttl=60)
+    reg.get("web-1")
+    clock.now += 30
+    reg.get("web-2")
+    clock.now += 31
+    reg.get("web-3")
+
+    assert sorted(reg._entries) == ["web-2", "web-3"]
+
+    # An evicted key is rebuilt on the next request.
+    reg.get("web-1")
+    assert reg.stats()["loads"] == 4
@@ -0,0 +1,176 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from worker.notifier import NotificationDispatcher, TokenBucket, retry_after
+
+
+class StubWebhook:
+    """Local Slack stand-in: records payloads and answers with queued responses."""
+
+    def __init__(self):
+        self.payloads: list[dict] = []
+        # (status, headers); once empty every request gets a 200.
+        self.responses: list[tuple[int, dict]] = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                stub.payloads.append(json.loads(body))
+                status, headers = stub.responses.pop(0) if stub.responses else (200, {})
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"ok")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/hook"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def webhook():
+    stub = StubWebhook()
+    yield stub
+    stub.close()
+
+
+def make_dispatcher(url: str, **overrides) -> NotificationDispatcher:
+    options = dict(
+        max_queue=100,
+        rate=1000,
+        burst=100,
+        digest_window=0,
+        max_digests=10,
+        max_retries=3,
+        max_backoff=0.01,
+    )
+    options.update(overrides)
+    return NotificationDispatcher(url, **options)
+
+
+def alert(host: str, severity: str = "warning", message: str = "cpu_percent is 95.0%"):
+    return SimpleNamespace(host=host, severity=severity, message=message)
+
+
+def deliver(dispatcher: NotificationDispatcher, alerts: list):
+    async def run():
+        dispatcher.client = httpx.AsyncClient(timeout=5)
+        dispatcher.notify(alerts)
+        await dispatcher.close()
+
+    asyncio.run(run())
+
+
+def test_token_bucket_limits_rate():
+    async def run():
+        bucket = TokenBucket(rate=20, burst=2)
+        started = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # Two tokens up front, the other four at 20/s.
+    assert asyncio.run(run()) >= 0.18
+
+
+def test_digest_per_host_and_severity(webhook):
+    dispatcher = make_dispatcher(webhook.url)
+    deliver(dispatcher, [alert("web-1"), alert("web-1"), alert("web-1", "critical"), alert("web-2")])
+
+    titles = sorted(payload["attachments"][0]["title"] for payload in webhook.payloads)
+    assert titles == ["2 warning alerts on web-1", "Alert: CRITICAL", "Alert: WARNING"]
+    assert dispatcher.sent == 3
+
+
+def test_alert_storm_collapses_to_fleet_digests(webhook):
+    dispatcher = make_dispatcher(webhook.url, max_digests=2)
+    deliver(dispatcher, [alert(f"web-{i}") for i in range(5)])
+
+    assert len(webhook.payloads) == 1
+    assert webhook.payloads[0]["attachments"][0]["title"] == "5 warning alerts across the fleet"
+
+
+def test_429_honours_retry_after(webhook):
+    webhook.responses = [(429, {"Retry-After": "0"}), (429, {"Retry-After": "garbage"})]
+    dispatcher = make_dispatcher(webhook.url)
+    deliver(dispatcher, [alert("web-1")])
+
+    assert len(webhook.payloads) == 3
+    assert (dispatcher.sent, dispatcher.failed) == (1, 0)
+
+
+def test_5xx_is_retried_then_dropped(webhook):
+    webhook.responses = [(503, {})] * 4
+    dispatcher = make_dispatcher(webhook.url, max_retries=3)
+    deliver(dispatcher, [alert("web-1")])
+
+    assert len(webhook.payloads) == 4
+    assert (dispatcher.sent, dispatcher.failed) == (0, 1)
+
+
+def test_4xx_is_not_retried(webhook):
+    webhook.responses = [(400, {})]
+    dispatcher = make_dispatcher(webhook.url)
+    deliver(dispatcher, [alert("web-1")])
+
+    assert len(webhook.payloads) == 1
+    assert (dispatcher.sent, dispatcher.failed) == (0, 1)
+
+
+def test_run_survives_a_failing_digest(webhook):
+    async def run():
+        dispatcher = make_dispatcher(webhook.url)
+        task = asyncio.create_task(dispatcher.run())
+        await asyncio.sleep(0.05)
+        dispatcher.notify([alert("web-1", message=None)])  # breaks digest_payload's join
+        for _ in range(100):
+            if dispatcher.failed:
+                break
+            await asyncio.sleep(0.01)
+        dispatcher.notify([alert("web-2")])
+        for _ in range(100):
+            if webhook.payloads:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await dispatcher.client.aclose()
+        return dispatcher
+
+    dispatcher = asyncio.run(run())
+    assert dispatcher.failed == 1
+    assert len(webhook.payloads) == 1
+
+
+def test_retry_after_parsing():
+    assert retry_after("7", 1.0, 60) == 7.0
+    assert retry_after(None, 1.5, 60) == 1.5
+    assert retry_after("not a date", 2.0, 60) == 2.0
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < retry_after(later, 1.0, 60) <= 30
+    earlier = format_datetime(datetime.now(timezone.utc) - timedelta(seconds=30), usegmt=True)
+    assert retry_after(earlier, 1.0, 60) == 0.0
+
+
+def test_retry_after_is_capped():
+    assert retry_after("86400", 1.0, 60) == 60
+    far_future = format_datetime(datetime.now(timezone.utc) + timedelta(days=1), usegmt=True)
+    assert retry_after(far_future, 1.0, 60) == 60
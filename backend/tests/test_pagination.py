@@ -0,0 +1,27 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from api.pagination import decode_cursor, encode_cursor
+
+NOW = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+
+
+def test_round_trip():
+    assert decode_cursor(encode_cursor(NOW, 42), int) == (NOW, 42)
+    assert decode_cursor(encode_cursor(NOW, "web-1"), str) == (NOW, "web-1")
+
+
+@pytest.mark.parametrize("key, key_type", [("42", int), ([42], int), (True, int), (None, int), (42, str)])
+def test_wrong_key_type_is_a_400(key, key_type):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(encode_cursor(NOW, key), key_type)
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize("cursor", ["", "not-base64!", "WzFd", "eyJhIjoxfQ"])
+def test_malformed_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, int)
+    assert error.value.status_code == 400
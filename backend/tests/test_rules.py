@@ -0,0 +1,90 @@
+from worker.rules import CLEARED, BreachTracker, Rule, RuleSet
+
+KEY = ("web-1", "cpu_percent")
+
+
+def make_ruleset(rules: list[Rule]) -> RuleSet:
+    ruleset = RuleSet({"cpu_percent": Rule("cpu_percent", 70, 90), "disk_percent": Rule("disk_percent", 80, 95)})
+    ruleset.replace(rules)
+    return ruleset
+
+
+def observe_all(rule: Rule, values: list[float]) -> list[int]:
+    tracker = BreachTracker()
+    return [tracker.observe(KEY, rule, value) for value in values]
+
+
+def test_exact_host_beats_patterns_and_defaults():
+    exact = Rule("cpu_percent", 50, 60, pattern="db-1")
+    glob = Rule("cpu_percent", 40, 45, pattern="db-*")
+    ruleset = make_ruleset([glob, exact])
+
+    assert ruleset.for_host("db-1")["cpu_percent"] is exact
+    assert ruleset.for_host("db-2")["cpu_percent"] is glob
+    assert ruleset.for_host("web-1")["cpu_percent"] is ruleset.defaults["cpu_percent"]
+    # Other metric types keep their defaults.
+    assert ruleset.for_host("db-1")["disk_percent"] is ruleset.defaults["disk_percent"]
+
+
+def test_longest_glob_wins():
+    broad = Rule("cpu_percent", 40, 50, pattern="*")
+    narrow = Rule("cpu_percent", 60, 70, pattern="db-eu-*")
+    middle = Rule("cpu_percent", 50, 60, pattern="db-*")
+    ruleset = make_ruleset([broad, middle, narrow])
+
+    assert ruleset.for_host("db-eu-1")["cpu_percent"] is narrow
+    assert ruleset.for_host("db-us-1")["cpu_percent"] is middle
+    assert ruleset.for_host("web-1")["cpu_percent"] is broad
+
+
+def test_tables_are_rebuilt_when_rules_change():
+    ruleset = make_ruleset([])
+    assert ruleset.for_host("db-1")["cpu_percent"].warning == 70
+
+    ruleset.replace([Rule("cpu_percent", 50, 60, pattern="db-1")])
+    assert ruleset.for_host("db-1")["cpu_percent"].warning == 50
+
+    ruleset.set_default(Rule("cpu_percent", 75, 95))
+    assert ruleset.for_host("web-1")["cpu_percent"].warning == 75
+    assert len(ruleset) == 1
+
+
+def test_fires_after_for_windows_consecutive_breaches():
+    rule = Rule("cpu_percent", 70, 90, for_windows=3)
+    assert observe_all(rule, [80, 80, 50, 80, 80, 95]) == [0, 0, 0, 0, 0, 2]
+
+
+def test_fires_once_until_cleared():
+    rule = Rule("cpu_percent", 70, 90)
+    assert observe_all(rule, [75, 80, 95, 60, 75]) == [1, 0, 0, CLEARED, 1]
+
+
+def test_value_at_the_breach_level_keeps_firing():
+    rule = Rule("cpu_percent", 70, 90)
+    assert observe_all(rule, [70, 70, 70, 69.9]) == [1, 0, 0, CLEARED]
+
+
+def test_hysteresis_band_holds_the_alert():
+    rule = Rule("cpu_percent", 70, 90, clear=50)
+    assert observe_all(rule, [75, 60, 65, 55, 50]) == [1, 0, 0, 0, CLEARED]
+
+
+def test_clearing_needs_for_windows_consecutive_clear_rows():
+    rule = Rule("cpu_percent", 70, 90, clear=50, for_windows=2)
+    assert observe_all(rule, [75, 75, 40, 60, 40, 40]) == [0, 1, 0, 0, 0, CLEARED]
+
+
+def test_sync_follows_the_alert_index():
+    rule = Rule("cpu_percent", 70, 90)
+    tracker = BreachTracker()
+
+    # An alert left pending by a previous run is resolved once clear.
+    tracker.sync(KEY, True)
+    assert tracker.firing(KEY)
+    assert tracker.observe(KEY, rule, 10) == CLEARED
+
+    # An alert closed by hand lets the next breach raise a new one.
+    assert tracker.observe(KEY, rule, 80) == 1
+    tracker.sync(KEY, False)
+    assert tracker.observe(KEY, rule, 80) == 1
+    assert len(tracker) == 1
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from worker import streaming_detector
+from worker.streaming_detector import StreamingDetector
+
+FEATURES = ["cpu_percent", "memory_percent"]
+MONDAY_9AM = datetime(2026, 1, 5, 9, tzinfo=timezone.utc)
+
+
+def detector(**options) -> StreamingDetector:
+    return StreamingDetector(FEATURES, alpha=0.05, **options)
+
+
+def feed(det: StreamingDetector, host: str, start: datetime, values: list[tuple], step=timedelta(minutes=1)):
+    """Score `values` one row at a time; returns the z-scores."""
+    z = []
+    for i, row in enumerate(values):
+        scores, _ = det.score([host], [start + i * step], np.array([row], dtype=float))
+        z.append(scores[0])
+    return np.array(z)
+
+
+def noisy(n: int, level: float, seed: int = 0) -> list[tuple]:
+    rng = np.random.default_rng(seed)
+    return [(level + rng.normal(0, 2), level + rng.normal(0, 2)) for _ in range(n)]
+
+
+def test_hosts_are_not_scored_while_warming_up():
+    det = detector(seasonal=False, warmup=30)
+    z = feed(det, "web-1", MONDAY_9AM, noisy(40, 20))
+
+    assert np.isnan(z[:30]).all()
+    assert np.isfinite(z[30:]).all()
+
+
+def test_spike_scores_high_without_dragging_the_baseline():
+    det = detector(seasonal=False, warmup=30)
+    feed(det, "web-1", MONDAY_9AM, noisy(200, 20))
+    before = det.mean[det.index["web-1"]].copy()
+
+    [z] = feed(det, "web-1", MONDAY_9AM + timedelta(hours=4), [(95.0, 20.0)])
+
+    assert z[0] > 6
+    assert det.levels(z[None, :], 4, 6)[0].tolist() == [2, 0]
+    # Clipped to mean + 3 std before learning, so the baseline barely moves.
+    assert det.mean[det.index["web-1"], 0] - before[0] < 1.0
+
+
+def test_hosts_are_independent_within_a_batch():
+    det = detector(seasonal=False, warmup=1)
+    X = np.array([[10.0, 10.0], [50.0, 50.0], [12.0, 12.0]])
+    det.score(["a", "b", "a"], [MONDAY_9AM] * 3, X)
+
+    assert det.count[det.index["a"]] == 2
+    assert det.count[det.index["b"]] == 1
+    assert det.mean[det.index["b"]].tolist() == [50.0, 50.0]
+
+
+def test_a_busy_weekly_slot_is_learnt():
+    det = detector(seasonal=True, warmup=5, seasonal_warmup=5)
+    # Quiet at 20% except for a 70% hour every Monday at 9.
+    for week in range(8):
+        monday = MONDAY_9AM + timedelta(weeks=week)
+        feed(det, "web-1", monday - timedelta(hours=3), noisy(30, 20, seed=week), step=timedelta(minutes=6))
+        feed(det, "web-1", monday, noisy(2, 70, seed=100 + week), step=timedelta(minutes=20))
+
+    monday = MONDAY_9AM + timedelta(weeks=8)
+    [usual] = feed(det, "web-1", monday, [(70.0, 70.0)])
+    [unusual] = feed(det, "web-1", monday + timedelta(hours=5), [(70.0, 70.0)])
+
+    assert usual.max() < 4
+    assert unusual.max() > 6
+
+
+def test_checkpoint_round_trip(tmp_path, monkeypatch):
+    det = detector(seasonal=True, warmup=5)
+    feed(det, "web-1", MONDAY_9AM, noisy(50, 20))
+    feed(det, "web-2", MONDAY_9AM, noisy(50, 60, seed=1))
+
+    monkeypatch.setattr(streaming_detector, "MODEL_DIR", str(tmp_path))
+    streaming_detector.save_checkpoint({0: det.snapshot(["web-2"])})
+    with np.load(streaming_detector.checkpoint_path(0)) as state:
+        state = dict(state)
+
+    restored = detector(seasonal=True, warmup=5)
+    assert restored.restore(state) == 1
+    later = MONDAY_9AM + timedelta(hours=1)
+    row = np.array([[75.0, 75.0]])
+    z_original, _ = det.score(["web-2"], [later], row)
+    z_restored, _ = restored.score(["web-2"], [later], row)
+    assert z_restored == pytest.approx(z_original, rel=1e-5)
+
+
+def test_incompatible_checkpoint_is_ignored():
+    det = detector(seasonal=True)
+    feed(det, "web-1", MONDAY_9AM, noisy(5, 20))
+    state = det.snapshot()
+
+    assert detector(seasonal=False).restore(state) == 0
+    assert StreamingDetector(["cpu_percent"], alpha=0.05).restore(state) == 0
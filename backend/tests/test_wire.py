@@ -0,0 +1,66 @@
+import struct
+from datetime import datetime, timezone
+
+import msgpack
+import pytest
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.wire import WireError, decode_msgpack_batch
+
+
+def batch(fields: list, rows: list) -> bytes:
+    return msgpack.packb({"fields": fields, "rows": rows}, datetime=True)
+
+
+def test_decodes_rows_and_samples():
+    timestamp = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    body = batch(
+        ["host", "timestamp", "cpu_percent", "network_in", "samples"],
+        [["web-1", timestamp, 12, 2 ** 40, [["load.1m", {}, 0.5]]]],
+    )
+
+    [row] = decode_msgpack_batch(body)
+
+    assert (row["host"], row["timestamp"], row["cpu_percent"], row["network_in"]) == (
+        "web-1", timestamp, 12, 2 ** 40,
+    )
+    assert row["memory_percent"] is None
+    assert row["samples"] == [{"name": "load.1m", "labels": {}, "value": 0.5}]
+
+
+# Timestamp ext (-1) whose seconds are far outside datetime's range.
+FAR_TIMESTAMP = b"\xc7\x0c\xff" + struct.pack(">I", 0) + struct.pack(">q", 2 ** 62)
+
+
+@pytest.mark.parametrize("body", [
+    b"\xc1",                                                # not msgpack
+    msgpack.packb({"fields": ["host"], "rows": [["a"]]})[:-1],  # truncated
+    msgpack.packb([1, 2]),                                  # not a map
+    msgpack.packb({"fields": ["host"]}),                    # no rows
+    batch(["host", "bogus"], []),                           # unknown field
+    batch(["cpu_percent"], []),                             # no host
+    batch(["host", "host"], []),                            # duplicate field
+    batch(["host", "cpu_percent"], [["a"]]),                # short row
+    batch(["host"], [[None]]),                              # null host
+    batch(["host", "cpu_percent"], [["a", "high"]]),        # wrong type
+    batch(["host", "network_in"], [["a", 1.5]]),            # float counter
+    batch(["host", "cpu_percent"], [["a", True]]),          # bool is not a number
+    batch(["host", "samples"], [["a", [["n", {"k": 1}, 1]]]]),  # non-string label
+    b"\x82\xa6fields\x92\xa4host\xa9timestamp\xa4rows\x91\x92\xa1a" + FAR_TIMESTAMP,
+])
+def test_bad_payloads_raise_wire_error(body):
+    with pytest.raises(WireError):
+        decode_msgpack_batch(body)
+
+
+def test_bad_msgpack_batch_is_a_400():
+    client = TestClient(app)
+    response = client.post(
+        "/metrics/batch",
+        content=batch(["host", "cpu_percent"], [["web-1", "high"]]),
+        headers={"Content-Type": "application/msgpack"},
+    )
+
+    assert response.status_code == 400
+    assert response.json()["detail"][0]["loc"] == ["body", 0, "cpu_percent"]
@@ -0,0 +1,71 @@
+from typing import Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from shared import Alert
+
+
+class AlertIndex:
+    """In-memory index of pending alerts keyed by (host, metric_type).
+
+    Loaded from the database at startup and kept current from the alerts
+    this worker commits and from the API's alert events. Until the first
+    load succeeds `warm` is False and callers should ask the database.
+    Changes that arrive while a reload is querying are replayed onto its
+    result, so a refresh never undoes them.
+    """
+
+    def __init__(self):
+        self._open: set[tuple[str, str]] = set()
+        self.warm = False
+        # Changes applied while a load is running, replayed onto its result.
+        self._during_load: Optional[list[tuple[tuple[str, str], bool]]] = None
+
+    async def load(self, session: AsyncSession):
+        self._during_load = []
+        try:
+            result = await session.execute(
+                select(Alert.host, Alert.metric_type).where(Alert.status == "pending")
+            )
+            loaded = {tuple(row) for row in result.all()}
+            for key, pending in self._during_load:
+                _apply(loaded, key, pending)
+            self._open = loaded
+            self.warm = True
+        finally:
+            self._during_load = None
+
+    def reset(self, keys: Iterable[tuple[str, str]] = ()):
+        """Start from `keys` as the open set, without the database (e.g. replays)."""
+        self._open = set(keys)
+        self.warm = True
+
+    def is_open(self, host: str, metric_type: str) -> bool:
+        return (host, metric_type) in self._open
+
+    def add(self, alerts: list[Alert]):
+        """Apply alerts this worker raised or resolved."""
+        for alert in alerts:
+            self._change((alert.host, alert.metric_type), alert.status == "pending")
+
+    def apply_event(self, event: dict):
+        self._change((event["host"], event["metric_type"]), event["status"] == "pending")
+
+    def _change(self, key: tuple[str, str], pending: bool):
+        _apply(self._open, key, pending)
+        if self._during_load is not None:
+            self._during_load.append((key, pending))
+
+    def __len__(self) -> int:
+        return len(self._open)
+
+
+def _apply(keys: set[tuple[str, str]], key: tuple[str, str], pending: bool):
+    if pending:
+        keys.add(key)
+    else:
+        keys.discard(key)
+
+
+alert_index = AlertIndex()
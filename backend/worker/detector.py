@@ -1,9 +1,12 @@
 from datetime import datetime, timezone
-from sqlalchemy import select
+from sqlalchemy import select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from shared import Metric, Alert
-from .notifier import send_slack_alert
+from shared.instrumentation import Counter, register_callback
+from .alert_index import alert_index
+from .features import peak_values
+from .rules import CLEARED, Rule, RuleSet, BreachTracker
 
 THRESHOLDS = {
     "cpu_percent": {"warning": 70, "critical": 90},
@@ -11,42 +14,117 @@ THRESHOLDS = {
     "disk_percent": {"warning": 80, "critical": 95},
 }
 
+METRIC_TYPES = list(THRESHOLDS)
 
-async def check_thresholds(metric: Metric, session: AsyncSession) -> list[Alert]:
-    alerts = []
+INDEX_MISSES = Counter(
+    "nazar_threshold_index_misses_total",
+    "Threshold checks that queried the database because the alert index was cold",
+)
+SEVERITIES = (None, "warning", "critical")
 
-    for metric_type, levels in THRESHOLDS.items():
-        prefix = metric_type.split("_")[0]
-        value = getattr(metric, f"{prefix}_max", None) or getattr(metric, metric_type)
-        if value is None:
-            continue
-
-        severity = None
-        if value >= levels["critical"]:
-            severity = "critical"
-        elif value >= levels["warning"]:
-            severity = "warning"
-
-        if severity:
-            existing = await session.execute(
-                select(Alert)
-                .where(Alert.host == metric.host)
-                .where(Alert.metric_type == metric_type)
-                .where(Alert.status == "pending")
-            )
-            if existing.scalar():
-                continue
+# THRESHOLDS are the defaults; per-host overrides come from the
+# threshold_rules table and are reloaded by the worker.
+ruleset = RuleSet({
+    metric_type: Rule(metric_type, levels["warning"], levels["critical"])
+    for metric_type, levels in THRESHOLDS.items()
+})
+breaches = BreachTracker()
+
+register_callback("nazar_threshold_rules", "Threshold rules loaded from the database", lambda: len(ruleset))
+register_callback("nazar_threshold_breaches", "Host metrics breaching or firing a threshold rule", lambda: len(breaches))
+
+
+def set_threshold(metric_type: str, severity: str, value: float):
+    """Change one default threshold at runtime, e.g. when replaying with tuned values."""
+    THRESHOLDS[metric_type][severity] = value
+    levels = THRESHOLDS[metric_type]
+    ruleset.set_default(Rule(metric_type, levels["warning"], levels["critical"]))
 
-            message = f"{metric_type} is {value:.1f}% on {metric.host}"
-            alert = Alert(
-                timestamp=datetime.now(timezone.utc),
-                host=metric.host,
-                metric_type=metric_type,
-                severity=severity,
-                message=message,
-                status="pending",
-            )
-            alerts.append(alert)
-            await send_slack_alert(severity, message)
 
+async def open_alert_keys(keys: list[tuple[str, str]], session: AsyncSession) -> list[tuple[str, str]]:
+    """Return the (host, metric_type) keys that already have a pending alert."""
+    if alert_index.warm:
+        return [key for key in keys if alert_index.is_open(*key)]
+
+    INDEX_MISSES.inc()
+    existing = await session.execute(
+        select(Alert.host, Alert.metric_type)
+        .where(tuple_(Alert.host, Alert.metric_type).in_(keys))
+        .where(Alert.status == "pending")
+    )
+    return [tuple(key) for key in existing.all()]
+
+
+async def resolve_alerts(keys: list[tuple[str, str]], session: AsyncSession) -> list[Alert]:
+    """Mark the pending alerts for `keys` resolved; the caller commits."""
+    result = await session.execute(
+        select(Alert)
+        .where(tuple_(Alert.host, Alert.metric_type).in_(keys))
+        .where(Alert.status == "pending")
+    )
+    alerts = result.scalars().all()
+    now = datetime.now(timezone.utc)
+    for alert in alerts:
+        alert.status = "resolved"
+        alert.resolved_at = now
     return alerts
+
+
+async def check_thresholds(metric: Metric, session: AsyncSession) -> tuple[list[Alert], list[tuple[str, str]]]:
+    return await check_thresholds_batch([metric], session)
+
+
+async def check_thresholds_batch(
+    metrics: list[Metric],
+    session: AsyncSession,
+) -> tuple[list[Alert], list[tuple[str, str]]]:
+    """Evaluate the threshold rules over a batch.
+
+    Returns the new alerts, at most one per host and type, and the
+    (host, metric_type) keys whose firing rule cleared. `metrics` must be in
+    time order: every row advances the breach state, and the first row
+    that makes a rule fire wins.
+    """
+    values = peak_values(metrics, METRIC_TYPES)
+
+    if alert_index.warm:
+        for host in {metric.host for metric in metrics}:
+            for metric_type in METRIC_TYPES:
+                breaches.sync((host, metric_type), alert_index.is_open(host, metric_type))
+
+    fired: dict[tuple[str, str], tuple[int, int, int]] = {}
+    cleared: dict[tuple[str, str], None] = {}
+    for i, metric in enumerate(metrics):
+        table = ruleset.for_host(metric.host)
+        for j, metric_type in enumerate(METRIC_TYPES):
+            value = values[i, j]
+            if value != value:  # NaN: not reported
+                continue
+            key = (metric.host, metric_type)
+            level = breaches.observe(key, table[metric_type], value)
+            if level == CLEARED:
+                # Resolved within the batch: drop the alert before it is raised.
+                if fired.pop(key, None) is None:
+                    cleared[key] = None
+            elif level and key not in fired:
+                cleared.pop(key, None)
+                fired[key] = (i, j, level)
+    if fired:
+        for key in await open_alert_keys(list(fired), session):
+            fired.pop(key, None)
+
+    alerts = []
+    for (host, metric_type), (i, j, level) in fired.items():
+        severity = SEVERITIES[level]
+        message = f"{metric_type} is {values[i, j]:.1f}% on {host}"
+        alert = Alert(
+            timestamp=datetime.now(timezone.utc),
+            host=host,
+            metric_type=metric_type,
+            severity=severity,
+            message=message,
+            status="pending",
+        )
+        alerts.append(alert)
+
+    return alerts, list(cleared)
@@ -0,0 +1,19 @@
+import numpy as np
+
+from shared import Metric
+
+
+def peak_values(metrics: list[Metric], names: list[str]) -> np.ndarray:
+    """Return an (n_metrics, n_names) array of window peaks, NaN where missing.
+
+    Each column prefers the window maximum (e.g. `cpu_max`) and falls back to
+    the window average (`cpu_percent`) for agents that don't report min/max.
+    """
+    values = np.full((len(metrics), len(names)), np.nan)
+    for j, name in enumerate(names):
+        prefix = name.split("_")[0]
+        for i, metric in enumerate(metrics):
+            value = getattr(metric, f"{prefix}_max", None) or getattr(metric, name)
+            if value is not None:
+                values[i, j] = value
+    return values
@@ -1,65 +1,429 @@
 import asyncio
 import json
-from datetime import datetime
+import multiprocessing
+import multiprocessing.connection
+from datetime import datetime, timezone
+from typing import Optional
 from aio_pika import connect_robust
 from aio_pika.abc import AbstractIncomingMessage
-from sqlalchemy import select
+from sqlalchemy import String, bindparam, cast, delete, func, select, tuple_
+from sqlalchemy.dialects.postgresql import INTERVAL
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from shared import AsyncSessionLocal, Metric, QUEUE_NAME
-from shared.config import RABBITMQ_URL
-from .detector import check_thresholds
-from .ml_detector import check_ml_anomaly
+from shared import (
+    AsyncSessionLocal,
+    Metric,
+    Alert,
+    get_alerts_exchange,
+    publish_alert_event,
+    declare_metrics_queue,
+    shard_queue_name,
+)
+from shared.config import (
+    RABBITMQ_URL,
+    METRICS_SHARDS,
+    WORKER_SHARDS,
+    WORKER_PROCESSES,
+    WORKER_BATCH_SIZE,
+    WORKER_BATCH_WAIT_MS,
+    ALERT_INDEX_REFRESH_SECONDS,
+    THRESHOLD_RULES_REFRESH_SECONDS,
+    ALERTS_RESOLVED_RETENTION,
+    ALERTS_AGE_OUT_SECONDS,
+    ML_TRAINING_WORKERS,
+    WORKER_METRICS_PORT,
+    STREAM_DETECTOR,
+    STREAM_CHECKPOINT_SECONDS,
+)
+from shared.instrumentation import Counter, Histogram, start_metrics_server
+from shared.messages import METRICS_CONTENT_TYPE, decode_metrics
+from .alert_index import alert_index
+from .detector import check_thresholds_batch, resolve_alerts, ruleset
+from .ml_detector import check_ml_anomalies
+from .notifier import dispatcher
+from .streaming_detector import (
+    check_streaming_anomalies,
+    load_checkpoints,
+    save_checkpoint,
+    snapshot_shards,
+)
+from .trainer import ModelTrainer
+
+MESSAGES = Counter("nazar_worker_messages_total", "Queue messages processed, by outcome", ("result",))
+MESSAGES_OK = MESSAGES.labels("ok")
+MESSAGES_FAILED = MESSAGES.labels("failed")
+METRICS_PROCESSED = Counter("nazar_worker_metrics_total", "Metric rows run through detection")
+ALERTS_RAISED = Counter("nazar_alerts_raised_total", "Alerts committed by the worker", ("metric_type", "severity"))
+ALERTS_RESOLVED = Counter("nazar_alerts_resolved_total", "Alerts the worker resolved automatically", ("metric_type",))
+ALERTS_AGED_OUT = Counter("nazar_alerts_aged_out_total", "Closed alerts deleted after ALERTS_RESOLVED_RETENTION")
+STAGE_SECONDS = Histogram("nazar_worker_stage_seconds", "Time per detection batch stage", ("stage",))
+DECODE_SECONDS = STAGE_SECONDS.labels("decode")
+THRESHOLDS_SECONDS = STAGE_SECONDS.labels("thresholds")
+STREAMING_SECONDS = STAGE_SECONDS.labels("streaming")
+ML_SECONDS = STAGE_SECONDS.labels("ml")
+COMMIT_SECONDS = STAGE_SECONDS.labels("commit")
+LAG_SECONDS = Histogram(
+    "nazar_worker_lag_seconds",
+    "Time from a metric's timestamp to the end of its detection batch",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether a failure came from the database or network rather than the message."""
+    if isinstance(error, (OSError, asyncio.TimeoutError, OperationalError, InterfaceError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
 
 
 async def process_message(message: AbstractIncomingMessage):
-    async with message.process():
-        data = json.loads(message.body.decode())
-        host = data["host"]
-        timestamp = datetime.fromisoformat(data["timestamp"])
-
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Metric)
-                .where(Metric.host == host)
-                .where(Metric.timestamp == timestamp)
-            )
-            metric = result.scalar()
-
-            if not metric:
-                print(f"Metric not found: {host} @ {timestamp}")
-                return
+    try:
+        await process_batch([message])
+    except Exception as e:
+        MESSAGES_FAILED.inc()
+        # Requeue a transient failure once; a second failure, or a bad
+        # message, is dropped so it cannot block the queue.
+        requeue = is_transient(e) and not message.redelivered
+        print(f"Failed to process message ({'requeued' if requeue else 'dropped'}): {e}")
+        await message.nack(requeue=requeue)
+        return
 
-            alerts = await check_thresholds(metric, session)
-            for alert in alerts:
-                session.add(alert)
-                print(f"[ALERT] {alert.severity}: {alert.message}")
+    await message.ack()
+    MESSAGES_OK.inc()
 
-            ml_alert = await check_ml_anomaly(metric, session)
-            if ml_alert:
-                session.add(ml_alert)
-                print(f"[ML-ALERT] {ml_alert.severity}: {ml_alert.message}")
 
+async def process_batch(messages: list[AbstractIncomingMessage]):
+    """Run detection for several messages in one session and one commit."""
+    async with AsyncSessionLocal() as session:
+        metrics = []
+        with DECODE_SECONDS.time():
+            for message in messages:
+                metrics.extend(await decode_message(message, session))
+        metrics.sort(key=lambda metric: metric.timestamp)
+
+        alerts, resolved = await detect(metrics, session)
+        with COMMIT_SECONDS.time():
             await session.commit()
 
+    now = datetime.now(timezone.utc)
+    for metric in metrics:
+        LAG_SECONDS.observe((now - metric.timestamp).total_seconds())
+    METRICS_PROCESSED.inc(len(metrics))
+    for alert in alerts:
+        ALERTS_RAISED.labels(alert.metric_type, alert.severity).inc()
+    for alert in resolved:
+        ALERTS_RESOLVED.labels(alert.metric_type).inc()
+
+    alert_index.add(alerts + resolved)
+    # Only committed alerts are notified, and never inline.
+    dispatcher.notify(alerts)
+    if resolved:
+        await announce_resolved(resolved)
+
+
+async def announce_resolved(alerts: list[Alert]):
+    """Tell the API and other workers; the batch is committed either way."""
+    try:
+        for alert in alerts:
+            await publish_alert_event(alert.id, alert.host, alert.metric_type, alert.status)
+    except Exception as e:
+        print(f"Failed to publish alert events: {e}")
+
+
+class BatchConsumer:
+    """Collects deliveries and processes them as one batch.
+
+    A batch is flushed when `max_messages` deliveries are waiting or
+    `max_wait_ms` after the first one arrived. Batches run one at a time, in
+    delivery order, and are acked together once their commit succeeds; a
+    batch that fails is retried message by message.
+    """
+
+    def __init__(self, max_messages: int, max_wait_ms: int):
+        self.max_messages = max_messages
+        self.max_wait = max_wait_ms / 1000
+        self._pending: list[AbstractIncomingMessage] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lock = asyncio.Lock()
+        self._flushes: set[asyncio.Task] = set()
+
+    async def __call__(self, message: AbstractIncomingMessage):
+        self._pending.append(message)
+        if len(self._pending) >= self.max_messages:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._start_flush)
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        messages, self._pending = self._pending, []
+        task = asyncio.create_task(self._flush(messages))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, messages: list[AbstractIncomingMessage]):
+        async with self._lock:
+            try:
+                await process_batch(messages)
+            except Exception as e:
+                # Retry one by one so only the messages that fail are dropped.
+                print(f"Failed to process batch of {len(messages)} messages, retrying singly: {e}")
+                for message in messages:
+                    await process_message(message)
+                return
+
+            await messages[-1].ack(multiple=True)
+            MESSAGES_OK.inc(len(messages))
+
+    async def close(self):
+        """Flush what is pending and wait for running batches to finish."""
+        self._start_flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+
+async def decode_message(message: AbstractIncomingMessage, session: AsyncSession) -> list[Metric]:
+    if message.content_type == METRICS_CONTENT_TYPE:
+        return [Metric(**row) for row in decode_metrics(message.body)]
+    return await load_metrics(message.body, session)
+
+
+async def load_metrics(body: bytes, session: AsyncSession) -> list[Metric]:
+    """Read back the rows referenced by a key-only (JSON) message."""
+    data = json.loads(body.decode())
+    # Batched publishes carry {"metrics": [...]}, single ones a bare key.
+    keys = [
+        (item["host"], datetime.fromisoformat(item["timestamp"]))
+        for item in data.get("metrics", [data])
+    ]
+
+    result = await session.execute(
+        select(Metric)
+        .where(tuple_(Metric.host, Metric.timestamp).in_(keys))
+    )
+    metrics = result.scalars().all()
+
+    if len(metrics) < len(keys):
+        print(f"Metrics not found: {len(keys) - len(metrics)} of {len(keys)}")
+    return metrics
 
-async def run():
-    print("Starting Analysis Worker...")
+
+async def detect(metrics: list[Metric], session: AsyncSession) -> tuple[list[Alert], list[Alert]]:
+    """Run the detectors; returns the alerts raised and the alerts auto-resolved."""
+    with THRESHOLDS_SECONDS.time():
+        alerts, cleared = await check_thresholds_batch(metrics, session)
+        resolved = await resolve_alerts(cleared, session) if cleared else []
+    for alert in alerts:
+        session.add(alert)
+        print(f"[ALERT] {alert.severity}: {alert.message}")
+    for alert in resolved:
+        print(f"[RESOLVED] {alert.metric_type} on {alert.host}")
+
+    stat_alerts = []
+    if STREAM_DETECTOR:
+        with STREAMING_SECONDS.time():
+            stat_alerts, stat_cleared = await check_streaming_anomalies(metrics, session)
+            stat_resolved = await resolve_alerts(stat_cleared, session) if stat_cleared else []
+        for stat_alert in stat_alerts:
+            session.add(stat_alert)
+            print(f"[STAT-ALERT] {stat_alert.severity}: {stat_alert.message}")
+        for alert in stat_resolved:
+            print(f"[RESOLVED] {alert.metric_type} on {alert.host}")
+        resolved += stat_resolved
+
+    with ML_SECONDS.time():
+        ml_alerts = await check_ml_anomalies(metrics, session)
+    for ml_alert in ml_alerts:
+        session.add(ml_alert)
+        print(f"[ML-ALERT] {ml_alert.severity}: {ml_alert.message}")
+
+    return alerts + stat_alerts + ml_alerts, resolved
+
+
+async def process_alert_event(message: AbstractIncomingMessage):
+    alert_index.apply_event(json.loads(message.body.decode()))
+
+
+async def refresh_alert_index():
+    """Periodically reload the index in case alert events were missed."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                await alert_index.load(session)
+        except Exception as e:
+            print(f"Failed to load alert index: {e}")
+        await asyncio.sleep(ALERT_INDEX_REFRESH_SECONDS)
+
+
+async def refresh_rules():
+    """Poll the threshold_rules table and recompile when it changes."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                if await ruleset.load(session):
+                    print(f"Loaded {len(ruleset)} threshold rule(s)")
+        except Exception as e:
+            print(f"Failed to load threshold rules: {e}")
+        await asyncio.sleep(THRESHOLD_RULES_REFRESH_SECONDS)
+
+
+async def age_out_alerts():
+    """Periodically delete alerts closed more than ALERTS_RESOLVED_RETENTION ago.
+
+    Keeps the alerts table, and with it the API's alert queries, bounded as
+    history accumulates; pending alerts are never touched.
+    """
+    # Bound as text and cast server-side, so the setting is never spliced into SQL.
+    retention = bindparam("retention", ALERTS_RESOLVED_RETENTION, type_=String)
+    cutoff = func.now() - cast(retention, INTERVAL)
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                while True:
+                    stale = (
+                        select(Alert.id)
+                        .where(Alert.status != "pending", Alert.resolved_at < cutoff)
+                        .limit(10000)
+                    )
+                    result = await session.execute(delete(Alert).where(Alert.id.in_(stale)))
+                    await session.commit()
+                    ALERTS_AGED_OUT.inc(result.rowcount)
+                    if result.rowcount < 10000:
+                        break
+        except Exception as e:
+            print(f"Failed to age out alerts: {e}")
+        await asyncio.sleep(ALERTS_AGE_OUT_SECONDS)
+
+
+async def checkpoint_streaming(shards: list[int]):
+    """Periodically persist the streaming baselines of this worker's shards."""
+    while True:
+        await asyncio.sleep(STREAM_CHECKPOINT_SECONDS)
+        try:
+            # Copy on the loop so scoring cannot change state mid-write.
+            await asyncio.to_thread(save_checkpoint, snapshot_shards(shards))
+        except Exception as e:
+            print(f"Failed to checkpoint streaming baselines: {e}")
+
+
+def assigned_shards() -> list[int]:
+    if not WORKER_SHARDS:
+        return list(range(METRICS_SHARDS))
+    shards = sorted({int(shard) for shard in WORKER_SHARDS.split(",") if shard.strip()})
+    invalid = [shard for shard in shards if not 0 <= shard < METRICS_SHARDS]
+    if invalid:
+        raise ValueError(f"WORKER_SHARDS {invalid} outside 0..{METRICS_SHARDS - 1}")
+    return shards
+
+
+async def run(shards: list[int], metrics_port: int = WORKER_METRICS_PORT):
+    print(f"Starting Analysis Worker (shards {shards})...")
+    await start_metrics_server(metrics_port)
+    trainer = ModelTrainer(ML_TRAINING_WORKERS)
+    background = [
+        asyncio.create_task(trainer.run()),
+        asyncio.create_task(dispatcher.run()),
+    ]
+    if STREAM_DETECTOR:
+        print(f"Restored streaming baselines for {load_checkpoints(shards)} host(s)")
+        background.append(asyncio.create_task(checkpoint_streaming(shards)))
     connection = await connect_robust(RABBITMQ_URL)
 
     async with connection:
         channel = await connection.channel()
-        await channel.set_qos(prefetch_count=10)
 
-        queue = await channel.declare_queue(QUEUE_NAME, durable=True)
-        print(f"Listening on queue: {QUEUE_NAME}")
+        # Subscribe before loading so no status change falls in between.
+        alerts_exchange = await get_alerts_exchange(channel)
+        alert_events = await channel.declare_queue(exclusive=True)
+        await alert_events.bind(alerts_exchange)
+        await alert_events.consume(process_alert_event, no_ack=True)
+        background.append(asyncio.create_task(refresh_alert_index()))
+        background.append(asyncio.create_task(refresh_rules()))
+        # Any one process will do; the shard-0 owner exists exactly once.
+        if ALERTS_RESOLVED_RETENTION and 0 in shards:
+            background.append(asyncio.create_task(age_out_alerts()))
 
-        await queue.consume(process_message)
-        await asyncio.Future()
+        consumers: list[BatchConsumer] = []
+        if WORKER_BATCH_SIZE > 1:
+            print(f"Batch mode: up to {WORKER_BATCH_SIZE} messages / {WORKER_BATCH_WAIT_MS}ms")
+        for shard in shards:
+            # A channel per shard: batches ack with multiple=True, which
+            # must never cover another shard's unprocessed deliveries.
+            shard_channel = await connection.channel()
+            await shard_channel.set_qos(prefetch_count=max(10, WORKER_BATCH_SIZE))
+            queue = await declare_metrics_queue(shard_channel, shard)
+            print(f"Listening on queue: {shard_queue_name(shard)}")
+            # One consumer per shard: batches of a shard run in order, while
+            # different shards (and so different hosts) may interleave.
+            if WORKER_BATCH_SIZE > 1:
+                consumer = BatchConsumer(WORKER_BATCH_SIZE, WORKER_BATCH_WAIT_MS)
+                consumers.append(consumer)
+                await queue.consume(consumer)
+            else:
+                await queue.consume(process_message)
+
+        try:
+            await asyncio.Future()
+        finally:
+            # Finish in-flight batches while the channels can still ack them.
+            for consumer in consumers:
+                await consumer.close()
+            for task in background:
+                task.cancel()
+            await asyncio.gather(*background, return_exceptions=True)
+            trainer.shutdown()
+            await dispatcher.close()
+            if STREAM_DETECTOR:
+                save_checkpoint(snapshot_shards(shards))
+
+
+def run_process(shards: list[int], metrics_port: int = WORKER_METRICS_PORT):
+    asyncio.run(run(shards, metrics_port))
 
 
 def main():
-    asyncio.run(run())
+    shards = assigned_shards()
+    processes = min(WORKER_PROCESSES, len(shards))
+    if processes <= 1:
+        run_process(shards)
+        return
+
+    # Scoring is CPU-bound, so shards are split across processes. Hosts map
+    # to a fixed shard, so each host's detector lives in exactly one of them.
+    context = multiprocessing.get_context("spawn")
+    children = [
+        context.Process(
+            target=run_process,
+            # Each process serves its own metrics, on consecutive ports.
+            args=(shards[i::processes], WORKER_METRICS_PORT + i if WORKER_METRICS_PORT else 0),
+            name=f"worker-{i}",
+        )
+        for i in range(processes)
+    ]
+    for child in children:
+        child.start()
+
+    try:
+        # Exit as soon as one child dies so a supervisor restarts the set.
+        by_sentinel = {child.sentinel: child for child in children}
+        dead = by_sentinel[multiprocessing.connection.wait(list(by_sentinel))[0]]
+        dead.join()
+        print(f"Worker process {dead.name} exited with code {dead.exitcode}")
+    finally:
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+        for child in children:
+            child.join()
+
+    raise SystemExit(dead.exitcode or 1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
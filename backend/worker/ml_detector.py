@@ -1,12 +1,56 @@
+import asyncio
 import numpy as np
+from fnmatch import fnmatchcase
 from datetime import datetime, timezone, timedelta
 from typing import Optional
 from sklearn.ensemble import IsolationForest
-from sqlalchemy import select
+from sqlalchemy import select, func, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from shared import Metric, Alert
-from .notifier import send_slack_alert
+from shared.config import (
+    ML_RETRAIN_SECONDS,
+    ML_TRAIN_RETRY_SECONDS,
+    ML_TRAINING_WINDOW_HOURS,
+    ML_MAX_TRAINING_SAMPLES,
+    ML_MODEL_GROUPS,
+    ML_REGISTRY_MAX_MB,
+    ML_REGISTRY_TTL_SECONDS,
+)
+from shared.instrumentation import Histogram, register_callback
+from .features import peak_values
+from .model_registry import ModelRegistry
+from .model_store import load_model
+
+# Model keys whose model is missing or stale, drained by the background trainer.
+training_queue: asyncio.Queue[str] = asyncio.Queue()
+
+GROUP_PREFIX = "group:"
+
+
+def _parse_groups(spec: str) -> dict[str, list[str]]:
+    """Parse "web-*=web,ci-*=ci" into {"web": ["web-*"], "ci": ["ci-*"]}."""
+    groups: dict[str, list[str]] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        pattern, _, name = item.partition("=")
+        groups.setdefault(name.strip(), []).append(pattern.strip())
+    return groups
+
+
+MODEL_GROUPS = _parse_groups(ML_MODEL_GROUPS)
+
+
+def model_key(host: str) -> str:
+    """Hosts matching an ML_MODEL_GROUPS pattern share that group's model."""
+    for name, patterns in MODEL_GROUPS.items():
+        if any(fnmatchcase(host, pattern) for pattern in patterns):
+            return f"{GROUP_PREFIX}{name}"
+    return host
+
+
+def _like(pattern: str) -> str:
+    escaped = pattern.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped.replace("*", "%").replace("?", "_")
 
 
 class AnomalyDetector:
@@ -17,58 +61,83 @@ class AnomalyDetector:
         self.contamination = contamination
         self.feature_names = ["cpu_percent", "memory_percent", "disk_percent"]
         self.last_trained: Optional[datetime] = None
+        self.last_attempt: Optional[datetime] = None
+        self.training = False
+        self.loading = False
         self.min_samples = 50
 
     def _extract_features(self, metric: Metric) -> Optional[np.ndarray]:
-        values = []
+        values = peak_values([metric], self.feature_names)[0]
+        if np.isnan(values).any():
+            return None
+        return values
+
+    def _feature_columns(self) -> list:
+        # SQL twin of peak_values: the window max unless it is NULL or 0.
+        columns = []
         for name in self.feature_names:
             prefix = name.split("_")[0]
-            val = getattr(metric, f"{prefix}_max", None) or getattr(metric, name)
-            if val is None:
-                return None
-            values.append(val)
-        return np.array(values)
-
-    async def train(self, session: AsyncSession, host: str) -> bool:
-        since = datetime.now(timezone.utc) - timedelta(hours=24)
-        result = await session.execute(
-            select(Metric)
-            .where(Metric.host == host)
+            peak = func.nullif(getattr(Metric, f"{prefix}_max"), 0)
+            columns.append(func.coalesce(peak, getattr(Metric, name)))
+        return columns
+
+    async def load_training_data(self, session: AsyncSession, key: str) -> np.ndarray:
+        """Fetch recent feature rows for a host or group as an (n, n_features) array."""
+        since = datetime.now(timezone.utc) - timedelta(hours=ML_TRAINING_WINDOW_HOURS)
+        columns = self._feature_columns()
+        if key.startswith(GROUP_PREFIX):
+            patterns = MODEL_GROUPS.get(key[len(GROUP_PREFIX):], [])
+            hosts = or_(*(Metric.host.like(_like(pattern)) for pattern in patterns))
+        else:
+            hosts = Metric.host == key
+        query = (
+            select(*columns)
+            .where(hosts)
             .where(Metric.timestamp >= since)
             .order_by(Metric.timestamp.desc())
+            .limit(ML_MAX_TRAINING_SAMPLES)
         )
-        metrics = result.scalars().all()
+        for column in columns:
+            query = query.where(column.isnot(None))
 
-        features = []
-        for metric in metrics:
-            feat = self._extract_features(metric)
-            if feat is not None:
-                features.append(feat)
+        result = await session.execute(query)
+        rows = result.all()
+        return np.array(rows, dtype=float).reshape(len(rows), len(columns))
 
-        if len(features) < self.min_samples:
+    def needs_training(self, now: datetime) -> bool:
+        if self.training or self.loading:
             return False
-
-        X = np.array(features)
-        self.model = IsolationForest(
-            contamination=self.contamination,
-            random_state=42,
-            n_estimators=100,
+        if self.last_attempt and now - self.last_attempt < timedelta(seconds=ML_TRAIN_RETRY_SECONDS):
+            return False
+        return (
+            self.last_trained is None or
+            now - self.last_trained > timedelta(seconds=ML_RETRAIN_SECONDS)
         )
-        self.model.fit(X)
-        self.last_trained = datetime.now(timezone.utc)
-        return True
 
-    def predict(self, metric: Metric) -> Optional[bool]:
+    def request_training(self, key: str, now: datetime):
+        self.training = True
+        self.last_attempt = now
+        training_queue.put_nowait(key)
+
+    def install(self, model: IsolationForest, trained_at: datetime):
+        self.model = model
+        self.last_trained = trained_at
+
+    def score_samples(self, X: np.ndarray) -> Optional[np.ndarray]:
+        """Score a feature matrix in one pass; lower is more anomalous."""
         if self.model is None:
             return None
+        return self.model.score_samples(X)
 
-        features = self._extract_features(metric)
-        if features is None:
-            return None
+    def is_anomalous(self, scores: np.ndarray) -> np.ndarray:
+        # Same cut-off IsolationForest.predict applies, without re-scoring.
+        return scores < self.model.offset_
 
-        X = features.reshape(1, -1)
-        prediction = self.model.predict(X)[0]
-        return prediction == -1
+    def predict(self, metric: Metric) -> Optional[bool]:
+        score = self.get_anomaly_score(metric)
+        if score is None:
+            return None
+        return bool(self.is_anomalous(np.array([score]))[0])
 
     def get_anomaly_score(self, metric: Metric) -> Optional[float]:
         if self.model is None:
@@ -78,37 +147,97 @@ class AnomalyDetector:
         if features is None:
             return None
 
-        X = features.reshape(1, -1)
-        return float(self.model.score_samples(X)[0])
+        return float(self.score_samples(features.reshape(1, -1))[0])
+
+
+# Persisted-model reads in flight, referenced so they are not collected.
+_loads: set[asyncio.Task] = set()
+
+
+def _load_detector(key: str) -> AnomalyDetector:
+    detector = AnomalyDetector()
+    # Pick up the model a previous run persisted. Unpickling it is too slow
+    # for the event loop, so the key scores nothing until the read lands.
+    detector.loading = True
+    task = asyncio.get_running_loop().create_task(_load_persisted(key, detector))
+    _loads.add(task)
+    task.add_done_callback(_loads.discard)
+    return detector
+
+
+async def _load_persisted(key: str, detector: AnomalyDetector):
+    try:
+        payload = await asyncio.to_thread(load_model, key)
+        # A fit may have finished while the file was being read.
+        if payload is not None and (detector.last_trained is None or payload["trained_at"] > detector.last_trained):
+            detector.install(payload["model"], payload["trained_at"])
+            registry.resize(key)
+    except Exception as e:
+        print(f"Failed to load model for {key}: {e}")
+    finally:
+        detector.loading = False
+
 
+registry: ModelRegistry[AnomalyDetector] = ModelRegistry(
+    _load_detector,
+    max_bytes=ML_REGISTRY_MAX_MB * 1024 * 1024,
+    ttl_seconds=ML_REGISTRY_TTL_SECONDS,
+)
 
-_detectors: dict[str, AnomalyDetector] = {}
 
+def get_detector(key: str) -> AnomalyDetector:
+    return registry.get(key)
 
-def get_detector(host: str) -> AnomalyDetector:
-    if host not in _detectors:
-        _detectors[host] = AnomalyDetector()
-    return _detectors[host]
+
+SCORE_SECONDS = Histogram("nazar_ml_score_seconds", "Time to score one model key's metrics in a batch")
+register_callback(
+    "nazar_ml_registry",
+    "Resident detectors, models, model bytes, and cumulative hits/loads/evictions",
+    lambda: {(name,): value for name, value in registry.stats().items()},
+    labelnames=("stat",),
+)
+register_callback("nazar_ml_training_queue", "Model keys waiting to be trained", training_queue.qsize)
 
 
 async def check_ml_anomaly(metric: Metric, session: AsyncSession) -> Optional[Alert]:
-    detector = get_detector(metric.host)
+    alerts = await check_ml_anomalies([metric], session)
+    return alerts[0] if alerts else None
 
-    should_train = (
-        detector.last_trained is None or
-        datetime.now(timezone.utc) - detector.last_trained > timedelta(hours=1)
-    )
 
-    if should_train:
-        trained = await detector.train(session, metric.host)
-        if not trained:
-            return None
+async def check_ml_anomalies(metrics: list[Metric], session: AsyncSession) -> list[Alert]:
+    """Score a batch with one score_samples call per host (or host group)."""
+    by_key: dict[str, list[Metric]] = {}
+    for metric in metrics:
+        by_key.setdefault(model_key(metric.host), []).append(metric)
+
+    now = datetime.now(timezone.utc)
+    alerts = []
+    for key, host_metrics in by_key.items():
+        detector = get_detector(key)
+
+        # Training happens in the background; score with whatever model exists.
+        if detector.needs_training(now):
+            detector.request_training(key, now)
+        if detector.model is None:
+            continue
 
-    is_anomaly = detector.predict(metric)
-    if not is_anomaly:
-        return None
+        X = peak_values(host_metrics, detector.feature_names)
+        complete = ~np.isnan(X).any(axis=1)
+        if not complete.any():
+            continue
 
-    score = detector.get_anomaly_score(metric)
+        candidates = [m for m, ok in zip(host_metrics, complete) if ok]
+        with SCORE_SECONDS.time():
+            scores = detector.score_samples(X[complete])
+        for metric, score in zip(candidates, scores):
+            if not detector.is_anomalous(score):
+                continue
+            alerts.append(_ml_alert(metric, float(score)))
+
+    return alerts
+
+
+def _ml_alert(metric: Metric, score: float) -> Alert:
     score_str = f" (score: {score:.3f})" if score else ""
 
     message = (
@@ -119,8 +248,6 @@ async def check_ml_anomaly(metric: Metric, session: AsyncSession) -> Optional[Al
         f"{score_str}"
     )
 
-    await send_slack_alert("warning", message)
-
     return Alert(
         timestamp=datetime.now(timezone.utc),
         host=metric.host,
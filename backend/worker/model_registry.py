@@ -0,0 +1,96 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+def model_nbytes(model) -> int:
+    """Approximate resident size of a fitted tree ensemble."""
+    if model is None:
+        return 0
+    total = 0
+    for estimator in getattr(model, "estimators_", ()):
+        state = estimator.tree_.__getstate__()
+        total += state["nodes"].nbytes + state["values"].nbytes
+    for features in getattr(model, "estimators_features_", ()):
+        total += features.nbytes
+    return total
+
+
+class ModelRegistry(Generic[T]):
+    """LRU cache of detectors bounded by model memory and idle time.
+
+    Entries are created on demand by `factory`, which is expected to pick up
+    a persisted model, so an evicted detector is rebuilt transparently the
+    next time its key is requested. Detectors with a fit in flight are
+    never evicted.
+    """
+
+    def __init__(self, factory: Callable[[str], T], max_bytes: int, ttl_seconds: float):
+        self.factory = factory
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self._entries: OrderedDict[str, T] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._last_used: dict[str, float] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> T:
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self.factory(key)
+            self._entries[key] = entry
+            self._last_used[key] = now
+            self.loads += 1
+            self.resize(key)
+            return entry
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self._last_used[key] = now
+        self._evict(now, keep=key)
+        return entry
+
+    def resize(self, key: str):
+        """Re-measure `key` after its model was replaced, evicting others if now over budget."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        size = model_nbytes(entry.model)
+        self.total_bytes += size - self._sizes.get(key, 0)
+        self._sizes[key] = size
+        self._evict(time.monotonic(), keep=key)
+
+    def _evict(self, now: float, keep: str):
+        expires = now - self.ttl
+        for key in list(self._entries):
+            if self.total_bytes <= self.max_bytes and self._last_used[key] > expires:
+                # Entries are in LRU order, so everything after this is newer.
+                break
+            if key == keep or self._entries[key].training:
+                continue
+            self._remove(key)
+
+    def _remove(self, key: str):
+        del self._entries[key]
+        del self._last_used[key]
+        self.total_bytes -= self._sizes.pop(key, 0)
+        self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "resident": len(self._entries),
+            "with_model": sum(1 for entry in self._entries.values() if entry.model is not None),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,59 @@
+import os
+import tempfile
+from datetime import datetime
+from typing import Optional
+from urllib.parse import quote
+
+import joblib
+import sklearn
+
+from shared.config import MODEL_DIR
+
+# Bump when the persisted payload layout changes; older files are ignored.
+MODEL_FORMAT_VERSION = 1
+
+
+def model_path(key: str) -> str:
+    return os.path.join(MODEL_DIR, f"{quote(key, safe='')}.joblib")
+
+
+def save_model(key: str, model, trained_at: datetime, feature_names: list[str]):
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    payload = {
+        "version": MODEL_FORMAT_VERSION,
+        "sklearn_version": sklearn.__version__,
+        "feature_names": feature_names,
+        "trained_at": trained_at,
+        "model": model,
+    }
+    path = model_path(key)
+    # Group models are fitted by every worker process, so concurrent saves
+    # of one key must not share a temp file.
+    fd, tmp_path = tempfile.mkstemp(dir=MODEL_DIR, prefix=os.path.basename(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            joblib.dump(payload, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_model(key: str) -> Optional[dict]:
+    """Return the persisted payload for `key`, or None if absent or stale."""
+    path = model_path(key)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        payload = joblib.load(path)
+    except Exception as e:
+        print(f"Failed to load model {path}: {e}")
+        return None
+
+    if payload.get("version") != MODEL_FORMAT_VERSION:
+        return None
+    if payload.get("sklearn_version") != sklearn.__version__:
+        # Pickled estimators are not portable across scikit-learn releases.
+        return None
+    return payload
@@ -1,24 +1,230 @@
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
 import httpx
-from shared.config import SLACK_WEBHOOK_URL
 
+from shared import Alert
+from shared.instrumentation import Histogram, register_callback
+from shared.config import (
+    SLACK_WEBHOOK_URL,
+    NOTIFY_QUEUE_SIZE,
+    NOTIFY_RATE_PER_SECOND,
+    NOTIFY_BURST,
+    NOTIFY_DIGEST_WINDOW_SECONDS,
+    NOTIFY_MAX_DIGESTS,
+    NOTIFY_MAX_RETRIES,
+    NOTIFY_MAX_BACKOFF_SECONDS,
+)
+
+POST_SECONDS = Histogram("nazar_notify_post_seconds", "Duration of one Slack webhook request")
+
+COLORS = {"critical": "#ff0000", "warning": "#ffcc00"}
+MAX_DIGEST_LINES = 20
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class NotificationDispatcher:
+    """Delivers alert notifications to Slack off the detection path.
+
+    `notify` only enqueues, so detection never waits on the webhook. A
+    background task collects alerts for `digest_window` seconds, merges
+    them into one digest per (host, severity), or per severity when a
+    window holds more than `max_digests` groups, and posts the digests
+    through one pooled client under a token-bucket rate limit. Failed
+    posts are retried with jittered exponential backoff; when the queue
+    is full new alerts are dropped and counted.
+    """
+
+    def __init__(
+        self,
+        webhook_url: str,
+        max_queue: int,
+        rate: float,
+        burst: int,
+        digest_window: float,
+        max_digests: int,
+        max_retries: int,
+        max_backoff: float,
+    ):
+        self.webhook_url = webhook_url
+        self.queue: asyncio.Queue[tuple[str, str, str]] = asyncio.Queue(maxsize=max_queue)
+        self.bucket = TokenBucket(rate, burst)
+        self.digest_window = digest_window
+        self.max_digests = max_digests
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.client: Optional[httpx.AsyncClient] = None
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def notify(self, alerts: list[Alert]):
+        if not self.webhook_url:
+            return
+        for alert in alerts:
+            try:
+                self.queue.put_nowait((alert.host, alert.severity, alert.message))
+            except asyncio.QueueFull:
+                self.dropped += 1
+                if self.dropped % 100 == 1:
+                    print(f"Notification queue full, {self.dropped} alert(s) dropped so far")
+
+    async def run(self):
+        if not self.webhook_url:
+            return
+        self.client = httpx.AsyncClient(timeout=10, limits=httpx.Limits(max_connections=2))
+        while True:
+            first = await self.queue.get()
+            await asyncio.sleep(self.digest_window)
+            items = [first, *self._drain()]
+            try:
+                await self._deliver(items)
+            except Exception as e:
+                # Never let one digest stop notifications for good.
+                self.failed += 1
+                print(f"Failed to deliver {len(items)} notification(s): {e}")
+
+    async def close(self, timeout: float = 5):
+        """Flush what is still queued, within `timeout`, and close the client."""
+        if self.client is None:
+            return
+        try:
+            await asyncio.wait_for(self._deliver(self._drain()), timeout)
+        except asyncio.TimeoutError:
+            print(f"Gave up flushing notifications after {timeout}s")
+        await self.client.aclose()
+        self.client = None
+
+    def _drain(self) -> list[tuple[str, str, str]]:
+        items = []
+        while not self.queue.empty():
+            items.append(self.queue.get_nowait())
+        return items
 
-async def send_slack_alert(severity: str, message: str):
-    if not SLACK_WEBHOOK_URL:
-        return
+    async def _deliver(self, items: list[tuple[str, str, str]]):
+        groups: dict[tuple[str, str], list[str]] = {}
+        for host, severity, message in items:
+            groups.setdefault((host, severity), []).append(message)
+        if len(groups) > self.max_digests:
+            # Alert storm: one fleet-wide digest per severity instead.
+            fleet: dict[tuple[str, str], list[str]] = {}
+            for (host, severity), messages in groups.items():
+                fleet.setdefault(("", severity), []).extend(messages)
+            groups = fleet
 
-    color = "#ff0000" if severity == "critical" else "#ffcc00"
-    payload = {
+        for (host, severity), messages in groups.items():
+            await self.bucket.acquire()
+            await self._post(digest_payload(host, severity, messages))
+
+    async def _post(self, payload: dict):
+        for attempt in range(self.max_retries + 1):
+            delay = random.uniform(0, min(self.max_backoff, 2 ** attempt))
+            try:
+                with POST_SECONDS.time():
+                    response = await self.client.post(self.webhook_url, json=payload)
+                if response.status_code == 429:
+                    delay = retry_after(response.headers.get("retry-after"), delay, self.max_backoff)
+                elif response.status_code < 500:
+                    response.raise_for_status()
+                    self.sent += 1
+                    return
+                error = f"server error {response.status_code}"
+            except httpx.HTTPStatusError as e:
+                # Other 4xx: retrying the same payload will not help.
+                print(f"Slack rejected notification: {e.response.status_code} {e.response.text[:200]}")
+                self.failed += 1
+                return
+            except httpx.RequestError as e:
+                error = str(e) or type(e).__name__
+
+            if attempt < self.max_retries:
+                print(f"Failed to send Slack notification ({error}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+        print(f"Dropping Slack notification after {self.max_retries + 1} attempts")
+        self.failed += 1
+
+
+def retry_after(value: Optional[str], default: float, ceiling: float) -> float:
+    """Seconds to wait from a Retry-After header: delta-seconds or an HTTP-date.
+
+    Capped at `ceiling`, so a bogus header cannot stall the dispatcher.
+    """
+    if not value:
+        return default
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return default
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        seconds = (when - datetime.now(timezone.utc)).total_seconds()
+    return min(max(0.0, seconds), ceiling)
+
+
+def digest_payload(host: str, severity: str, messages: list[str]) -> dict:
+    if len(messages) == 1:
+        title = f"Alert: {severity.upper()}"
+    elif host:
+        title = f"{len(messages)} {severity} alerts on {host}"
+    else:
+        title = f"{len(messages)} {severity} alerts across the fleet"
+
+    lines = messages[:MAX_DIGEST_LINES]
+    if len(messages) > MAX_DIGEST_LINES:
+        lines.append(f"... and {len(messages) - MAX_DIGEST_LINES} more")
+
+    return {
         "attachments": [
             {
-                "color": color,
-                "title": f"Alert: {severity.upper()}",
-                "text": message,
+                "color": COLORS.get(severity, COLORS["warning"]),
+                "title": title,
+                "text": "\n".join(lines),
             }
         ]
     }
 
-    async with httpx.AsyncClient() as client:
-        try:
-            await client.post(SLACK_WEBHOOK_URL, json=payload)
-        except Exception as e:
-            print(f"Failed to send Slack notification: {e}")
\ No newline at end of file
+
+dispatcher = NotificationDispatcher(
+    SLACK_WEBHOOK_URL,
+    max_queue=NOTIFY_QUEUE_SIZE,
+    rate=NOTIFY_RATE_PER_SECOND,
+    burst=NOTIFY_BURST,
+    digest_window=NOTIFY_DIGEST_WINDOW_SECONDS,
+    max_digests=NOTIFY_MAX_DIGESTS,
+    max_retries=NOTIFY_MAX_RETRIES,
+    max_backoff=NOTIFY_MAX_BACKOFF_SECONDS,
+)
+
+register_callback(
+    "nazar_notifications_total",
+    "Slack notifications by outcome (digests sent/failed, alerts dropped)",
+    lambda: {("sent",): dispatcher.sent, ("failed",): dispatcher.failed, ("dropped",): dispatcher.dropped},
+    kind="counter",
+    labelnames=("result",),
+)
+register_callback("nazar_notify_queue", "Alerts waiting to be notified", dispatcher.queue.qsize)
@@ -0,0 +1,379 @@
+"""Replay historical metrics through the detectors, offline and faster than real time.
+
+Rows are read in chunks, in time order, from the metrics table or from a
+CSV/Parquet export, and run through the same detector functions the
+worker uses, in worker-sized batches. Nothing is written and RabbitMQ is
+not involved: pending alerts are tracked in memory. Threshold and
+stat_anomaly alerts auto-resolve when they clear, as in the worker; any
+alert still pending after --reopen-after seconds of replay time is
+closed. Isolation Forest models are fitted inline on the replayed
+history, on the worker's training window and retrain schedule, so
+--contamination can be tuned.
+
+    python -m worker.replay --since 2024-05-01 --until 2024-05-08
+    python -m worker.replay --file export.csv --detectors thresholds,ml --contamination 0.02
+    python -m worker.replay --file export.parquet --threshold cpu_percent.warning=80 --json
+
+Exports need the metrics table's column names and must be sorted by
+timestamp; Parquet needs pyarrow.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import sys
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional
+
+import numpy as np
+from sqlalchemy import select, tuple_
+
+from shared import AsyncSessionLocal, Metric, Alert
+from shared.config import (
+    ML_RETRAIN_SECONDS,
+    ML_TRAINING_WINDOW_HOURS,
+    ML_MAX_TRAINING_SAMPLES,
+    WORKER_BATCH_SIZE,
+)
+from .alert_index import alert_index
+from .detector import THRESHOLDS, check_thresholds_batch, ruleset, set_threshold
+from .features import peak_values
+from .ml_detector import AnomalyDetector, model_key, _ml_alert
+from .streaming_detector import check_streaming_anomalies
+from .trainer import fit_model
+
+DETECTORS = ("thresholds", "streaming", "ml")
+COLUMNS = {column.name: column.type.python_type for column in Metric.__table__.columns}
+
+
+async def db_chunks(
+    since: Optional[datetime],
+    until: Optional[datetime],
+    hosts: Optional[list[str]],
+    chunk_size: int,
+) -> AsyncIterator[list[Metric]]:
+    """Page through the metrics table in (timestamp, host) order."""
+    after = None
+    while True:
+        query = select(Metric).order_by(Metric.timestamp, Metric.host).limit(chunk_size)
+        if since:
+            query = query.where(Metric.timestamp >= since)
+        if until:
+            query = query.where(Metric.timestamp < until)
+        if hosts:
+            query = query.where(Metric.host.in_(hosts))
+        if after:
+            query = query.where(tuple_(Metric.timestamp, Metric.host) > after)
+
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(query)
+            metrics = result.scalars().all()
+        if not metrics:
+            return
+        yield metrics
+        after = (metrics[-1].timestamp, metrics[-1].host)
+
+
+async def file_chunks(
+    path: str,
+    chunk_size: int,
+    since: Optional[datetime],
+    until: Optional[datetime],
+    hosts: Optional[list[str]],
+) -> AsyncIterator[list[Metric]]:
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Reading Parquet needs pyarrow: pip install pyarrow")
+        batches = (batch.to_pylist() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size))
+        for batch in batches:
+            yield _metrics(batch, since, until, hosts)
+        return
+
+    with open(path, newline="") as f:
+        chunk = []
+        for row in csv.DictReader(f):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield _metrics(chunk, since, until, hosts)
+                chunk = []
+        if chunk:
+            yield _metrics(chunk, since, until, hosts)
+
+
+def _metrics(
+    rows: list[dict],
+    since: Optional[datetime],
+    until: Optional[datetime],
+    hosts: Optional[list[str]],
+) -> list[Metric]:
+    metrics = []
+    for row in rows:
+        if hosts and row["host"] not in hosts:
+            continue
+        values = {name: _convert(name, row[name]) for name in COLUMNS if name in row}
+        if (since and values["timestamp"] < since) or (until and values["timestamp"] >= until):
+            continue
+        metrics.append(Metric(**values))
+    metrics.sort(key=lambda metric: metric.timestamp)
+    return metrics
+
+
+def _convert(name: str, value):
+    if value is None or value == "":
+        return None
+    if name == "timestamp":
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if COLUMNS[name] is int and isinstance(value, (str, float)):
+        # CSV writers may render counters as "1.2e+09".
+        return int(float(value))
+    return COLUMNS[name](value)
+
+
+class ReplayModels:
+    """Isolation Forest models fitted on the replayed history itself.
+
+    Mirrors the worker's schedule in replay time: a model key is refitted
+    on its last ML_TRAINING_WINDOW_HOURS of rows once ML_RETRAIN_SECONDS
+    have passed. Fits run inline and are timed apart from scoring.
+    """
+
+    def __init__(self, contamination: float):
+        self.contamination = contamination
+        self.detectors: dict[str, AnomalyDetector] = {}
+        self.history: dict[str, deque] = {}
+        self.fits = 0
+        self.fit_seconds = 0.0
+
+    def check(self, metrics: list[Metric]) -> list[Alert]:
+        by_key: dict[str, list[Metric]] = {}
+        for metric in metrics:
+            by_key.setdefault(model_key(metric.host), []).append(metric)
+
+        alerts = []
+        for key, key_metrics in by_key.items():
+            detector = self.detectors.get(key)
+            if detector is None:
+                detector = self.detectors[key] = AnomalyDetector(self.contamination)
+                self.history[key] = deque(maxlen=ML_MAX_TRAINING_SAMPLES)
+            history = self.history[key]
+            now = key_metrics[-1].timestamp
+            self._maybe_fit(detector, history, now)
+
+            X = peak_values(key_metrics, detector.feature_names)
+            complete = ~np.isnan(X).any(axis=1)
+            candidates = [m for m, ok in zip(key_metrics, complete) if ok]
+            if detector.model is not None and candidates:
+                scores = detector.score_samples(X[complete])
+                for metric, score in zip(candidates, scores):
+                    if detector.is_anomalous(score):
+                        alerts.append(_ml_alert(metric, float(score)))
+            history.extend(zip((m.timestamp for m in candidates), X[complete]))
+        return alerts
+
+    def _maybe_fit(self, detector: AnomalyDetector, history: deque, now: datetime):
+        if detector.last_trained and now - detector.last_trained <= timedelta(seconds=ML_RETRAIN_SECONDS):
+            return
+        since = now - timedelta(hours=ML_TRAINING_WINDOW_HOURS)
+        while history and history[0][0] < since:
+            history.popleft()
+        if len(history) < detector.min_samples:
+            return
+        started = time.perf_counter()
+        model = fit_model(np.array([features for _, features in history]), detector.contamination)
+        self.fit_seconds += time.perf_counter() - started
+        self.fits += 1
+        detector.install(model, now)
+
+
+class Replay:
+    def __init__(self, detectors: list[str], contamination: float, reopen_after: float):
+        self.detectors = detectors
+        self.models = ReplayModels(contamination)
+        self.reopen_after = timedelta(seconds=reopen_after)
+        self.opened: dict[tuple[str, str], datetime] = {}
+        self.batch_seconds: dict[str, list[float]] = {name: [] for name in detectors}
+        self.alerts: list[Alert] = []
+        self.resolved = 0
+        self.rows = 0
+        self.hosts: set[str] = set()
+        self.first: Optional[datetime] = None
+        self.last: Optional[datetime] = None
+        # Start with nothing pending; alerts are tracked in memory from here.
+        alert_index.reset()
+
+    async def run_batch(self, metrics: list[Metric]):
+        now = metrics[-1].timestamp
+        self._reopen(now)
+        for name in self.detectors:
+            started = time.perf_counter()
+            fitting = self.models.fit_seconds
+            cleared = []
+            if name == "thresholds":
+                alerts, cleared = await check_thresholds_batch(metrics, None)
+            elif name == "streaming":
+                alerts, cleared = await check_streaming_anomalies(metrics, None)
+            else:
+                alerts = self.models.check(metrics)
+            for key in cleared:
+                self.resolved += key in self.opened
+                self._resolve(key)
+            # Fits are reported on their own; the worker runs them off the hot path.
+            fitted = self.models.fit_seconds - fitting
+            self.batch_seconds[name].append(time.perf_counter() - started - fitted)
+
+            for alert in alerts:
+                # Stamped with replay time rather than the wall clock.
+                alert.timestamp = now
+                self.opened[(alert.host, alert.metric_type)] = now
+            alert_index.add(alerts)
+            self.alerts.extend(alerts)
+
+        self.rows += len(metrics)
+        self.hosts.update(metric.host for metric in metrics)
+        self.first = self.first or metrics[0].timestamp
+        self.last = now
+
+    def _reopen(self, now: datetime):
+        expired = [key for key, opened in self.opened.items() if now - opened >= self.reopen_after]
+        for key in expired:
+            self._resolve(key)
+
+    def _resolve(self, key: tuple[str, str]):
+        self.opened.pop(key, None)
+        host, metric_type = key
+        alert_index.apply_event({"host": host, "metric_type": metric_type, "status": "resolved"})
+
+    def summary(self, wall_seconds: float, read_seconds: float) -> dict:
+        span = (self.last - self.first).total_seconds() if self.rows else 0.0
+        detectors = {}
+        for name, seconds in self.batch_seconds.items():
+            total = sum(seconds)
+            detectors[name] = {
+                "seconds": round(total, 4),
+                "us_per_metric": round(total / max(self.rows, 1) * 1e6, 3),
+                "batch_p50_ms": round(float(np.percentile(seconds, 50)) * 1000, 3) if seconds else None,
+                "batch_p99_ms": round(float(np.percentile(seconds, 99)) * 1000, 3) if seconds else None,
+            }
+        if "ml" in self.detectors:
+            detectors["ml"]["fits"] = self.models.fits
+            detectors["ml"]["fit_seconds"] = round(self.models.fit_seconds, 4)
+
+        counts = Counter((alert.metric_type, alert.severity) for alert in self.alerts)
+        return {
+            "metrics": self.rows,
+            "hosts": len(self.hosts),
+            "from": self.first.isoformat() if self.first else None,
+            "to": self.last.isoformat() if self.last else None,
+            "wall_seconds": round(wall_seconds, 3),
+            "read_seconds": round(read_seconds, 3),
+            "metrics_per_second": round(self.rows / wall_seconds) if wall_seconds else 0,
+            "speedup": round(span / wall_seconds) if wall_seconds else 0,
+            "detectors": detectors,
+            "alerts": {f"{metric_type}/{severity}": count for (metric_type, severity), count in sorted(counts.items())},
+            "auto_resolved": self.resolved,
+        }
+
+
+def print_summary(summary: dict):
+    print(
+        f"Replayed {summary['metrics']:,} metrics for {summary['hosts']} hosts "
+        f"({summary['from']} to {summary['to']}) in {summary['wall_seconds']:.1f}s: "
+        f"{summary['metrics_per_second']:,} metrics/s, {summary['speedup']:,}x real time"
+    )
+    print(f"  {'read':<11} {summary['read_seconds']:8.2f}s")
+    for name, stats in summary["detectors"].items():
+        line = (
+            f"  {name:<11} {stats['seconds']:8.2f}s {stats['us_per_metric']:9.2f} us/metric, "
+            f"batch p50 {stats['batch_p50_ms']} ms, p99 {stats['batch_p99_ms']} ms"
+        )
+        if "fits" in stats:
+            line += f", {stats['fits']} fits in {stats['fit_seconds']:.2f}s"
+        print(line)
+    print("Alerts:")
+    for kind, count in summary["alerts"].items() or [("none", 0)]:
+        print(f"  {kind:<28} {count:,}")
+    print(f"Auto-resolved alerts: {summary['auto_resolved']:,}")
+
+
+def _threshold(spec: str) -> tuple[str, str, float]:
+    name, _, value = spec.partition("=")
+    metric_type, _, severity = name.partition(".")
+    if metric_type not in THRESHOLDS or severity not in ("warning", "critical") or not value:
+        raise argparse.ArgumentTypeError(f"expected e.g. cpu_percent.warning=80, got {spec!r}")
+    return metric_type, severity, float(value)
+
+
+def _timestamp(value: str) -> datetime:
+    timestamp = datetime.fromisoformat(value)
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--file", help="CSV or Parquet export to replay instead of the database")
+    parser.add_argument("--since", type=_timestamp)
+    parser.add_argument("--until", type=_timestamp)
+    parser.add_argument("--hosts", nargs="+")
+    parser.add_argument("--detectors", default=",".join(DETECTORS), help=f"comma-separated, from {DETECTORS}")
+    parser.add_argument("--chunk-size", type=int, default=20000, help="rows per read")
+    parser.add_argument("--batch-size", type=int, default=WORKER_BATCH_SIZE, help="rows per detector batch")
+    parser.add_argument("--contamination", type=float, default=AnomalyDetector().contamination)
+    parser.add_argument("--threshold", type=_threshold, action="append", default=[], metavar="TYPE.SEVERITY=VALUE")
+    parser.add_argument("--db-rules", action="store_true", help="apply the threshold_rules overrides too")
+    parser.add_argument("--reopen-after", type=float, default=3600, help="replay seconds before an alert can repeat")
+    parser.add_argument("--alerts-out", help="write the alerts produced to this JSON Lines file")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    detectors = [name.strip() for name in args.detectors.split(",") if name.strip()]
+    unknown = set(detectors) - set(DETECTORS)
+    if unknown:
+        parser.error(f"unknown detector(s): {', '.join(sorted(unknown))}")
+    for metric_type, severity, value in args.threshold:
+        set_threshold(metric_type, severity, value)
+    if args.db_rules:
+        async with AsyncSessionLocal() as session:
+            await ruleset.load(session)
+
+    if args.file:
+        chunks = file_chunks(args.file, args.chunk_size, args.since, args.until, args.hosts)
+    else:
+        chunks = db_chunks(args.since, args.until, args.hosts, args.chunk_size)
+
+    replay = Replay(detectors, args.contamination, args.reopen_after)
+    started = read_started = time.perf_counter()
+    read_seconds = 0.0
+    async for chunk in chunks:
+        read_seconds += time.perf_counter() - read_started
+        for i in range(0, len(chunk), args.batch_size):
+            await replay.run_batch(chunk[i:i + args.batch_size])
+        read_started = time.perf_counter()
+    read_seconds += time.perf_counter() - read_started
+    summary = replay.summary(time.perf_counter() - started, read_seconds)
+
+    if args.alerts_out:
+        with open(args.alerts_out, "w") as f:
+            for alert in replay.alerts:
+                f.write(json.dumps({
+                    "timestamp": alert.timestamp.isoformat(),
+                    "host": alert.host,
+                    "metric_type": alert.metric_type,
+                    "severity": alert.severity,
+                    "message": alert.message,
+                }) + "\n")
+
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    else:
+        print_summary(summary)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,188 @@
+from fnmatch import fnmatchcase
+from typing import Optional
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from shared import ThresholdRule
+
+
+class Rule:
+    """Compiled threshold for one metric type.
+
+    `clear` is the hysteresis level: once a rule fires it stays firing until
+    the value is below every breach level and at or below `clear` (default:
+    the lowest breach level, so a value exactly at it still fires). The
+    severity is fixed when the rule fires; a warning that worsens to
+    critical stays one warning alert until it clears.
+    """
+
+    def __init__(
+        self,
+        metric_type: str,
+        warning: Optional[float],
+        critical: Optional[float],
+        clear: Optional[float] = None,
+        for_windows: int = 1,
+        pattern: str = "*",
+        clear_windows: Optional[int] = None,
+    ):
+        self.metric_type = metric_type
+        self.warning = warning
+        self.critical = critical
+        levels = [level for level in (warning, critical) if level is not None]
+        self.clear = clear if clear is not None else min(levels, default=None)
+        self.for_windows = max(1, for_windows)
+        # Consecutive clear rows needed to resolve; defaults to for_windows.
+        self.clear_windows = max(1, clear_windows or for_windows)
+        self.pattern = pattern
+
+    def level(self, value: float) -> int:
+        """Index into SEVERITIES: 0 below warning, 1 warning, 2 critical."""
+        if self.critical is not None and value >= self.critical:
+            return 2
+        if self.warning is not None and value >= self.warning:
+            return 1
+        return 0
+
+
+class RuleSet:
+    """Threshold rules compiled into per-host lookup tables.
+
+    A host's table ({metric_type: Rule}) is resolved the first time the
+    host is seen: per metric, a rule naming the host exactly wins, then
+    the matching glob pattern with the most literal characters, then the
+    defaults. Tables are cached until the rules change, so evaluating a
+    row is one dict lookup and a few comparisons.
+    """
+
+    def __init__(self, defaults: dict[str, Rule]):
+        self.defaults = defaults
+        self.version: Optional[tuple] = None
+        self._exact: dict[str, list[Rule]] = {}
+        self._patterns: list[Rule] = []
+        self._tables: dict[str, dict[str, Rule]] = {}
+
+    def __len__(self) -> int:
+        return len(self._patterns) + sum(len(rules) for rules in self._exact.values())
+
+    def replace(self, rules: list[Rule]):
+        exact: dict[str, list[Rule]] = {}
+        patterns = []
+        for rule in rules:
+            if any(char in rule.pattern for char in "*?["):
+                patterns.append(rule)
+            else:
+                exact.setdefault(rule.pattern, []).append(rule)
+        patterns.sort(key=lambda rule: len(rule.pattern.replace("*", "").replace("?", "")), reverse=True)
+        self._exact, self._patterns = exact, patterns
+        self._tables = {}
+
+    def set_default(self, rule: Rule):
+        self.defaults[rule.metric_type] = rule
+        self._tables = {}
+
+    def for_host(self, host: str) -> dict[str, Rule]:
+        table = self._tables.get(host)
+        if table is None:
+            table = self._tables[host] = self._compile(host)
+        return table
+
+    def _compile(self, host: str) -> dict[str, Rule]:
+        table = dict(self.defaults)
+        matched = set()
+        for rule in self._exact.get(host, []):
+            table[rule.metric_type] = rule
+            matched.add(rule.metric_type)
+        for rule in self._patterns:
+            if rule.metric_type not in matched and fnmatchcase(host, rule.pattern):
+                table[rule.metric_type] = rule
+                matched.add(rule.metric_type)
+        return table
+
+    async def load(self, session: AsyncSession) -> bool:
+        """Reload the enabled rules if the table changed; returns whether it did."""
+        result = await session.execute(select(func.count(), func.max(ThresholdRule.updated_at)))
+        version = tuple(result.one())
+        if version == self.version:
+            return False
+
+        result = await session.execute(select(ThresholdRule).where(ThresholdRule.enabled))
+        self.replace([
+            Rule(
+                row.metric_type,
+                row.warning,
+                row.critical,
+                clear=row.clear,
+                for_windows=row.for_windows,
+                pattern=row.host_pattern,
+            )
+            for row in result.scalars().all()
+        ])
+        self.version = version
+        return True
+
+
+# Returned by BreachTracker.observe when a firing rule has cleared.
+CLEARED = -1
+
+
+class BreachTracker:
+    """Alert state per (host, metric_type): ok -> breaching -> firing -> ok.
+
+    A rule fires after `for_windows` consecutive breaching rows and resolves
+    after `clear_windows` consecutive clear rows (see Rule). Kept in
+    worker memory, so neither transition queries the database. Hosts map
+    to one shard and so to one worker process, which sees all of a host's
+    rows in order.
+    """
+
+    def __init__(self):
+        # key -> [consecutive rows towards the next transition, firing]
+        self._state: dict[tuple[str, str], list] = {}
+
+    def observe(self, key: tuple[str, str], rule: Rule, value: float) -> int:
+        """Fold in one value; returns the level to alert at, CLEARED, or 0."""
+        level = rule.level(value)
+        state = self._state.get(key)
+        if state is None:
+            if not level:
+                return 0
+            state = self._state[key] = [0, False]
+
+        if not state[1]:
+            if not level:
+                del self._state[key]
+                return 0
+            state[0] += 1
+            if state[0] >= rule.for_windows:
+                state[:] = [0, True]
+                return level
+            return 0
+
+        if level or (rule.clear is not None and value > rule.clear):
+            state[0] = 0
+            return 0
+        state[0] += 1
+        if state[0] >= rule.clear_windows:
+            del self._state[key]
+            return CLEARED
+        return 0
+
+    def sync(self, key: tuple[str, str], firing: bool):
+        """Align the firing state with whether an alert is actually pending.
+
+        Covers alerts raised before a restart and alerts closed by hand.
+        """
+        state = self._state.get(key)
+        if firing and (state is None or not state[1]):
+            self._state[key] = [0, True]
+        elif not firing and state is not None and state[1]:
+            del self._state[key]
+
+    def firing(self, key: tuple[str, str]) -> bool:
+        state = self._state.get(key)
+        return state is not None and state[1]
+
+    def __len__(self) -> int:
+        return len(self._state)
@@ -0,0 +1,326 @@
+import os
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from shared import Metric, Alert, host_shard
+from shared.config import (
+    MODEL_DIR,
+    STREAM_ALPHA,
+    STREAM_Z_WARNING,
+    STREAM_Z_CRITICAL,
+    STREAM_SEASONAL,
+    STREAM_MIN_STD,
+    STREAM_CLEAR_WINDOWS,
+)
+from shared.instrumentation import register_callback
+from shared.messages import as_utc
+from .alert_index import alert_index
+from .detector import SEVERITIES, open_alert_keys
+from .rules import CLEARED, BreachTracker, Rule
+from .features import peak_values
+
+FEATURE_NAMES = ["cpu_percent", "memory_percent", "disk_percent"]
+METRIC_TYPE = "stat_anomaly"
+SLOTS_PER_WEEK = 7 * 24
+
+# Bump when the checkpoint layout changes; older files are ignored.
+CHECKPOINT_VERSION = 1
+
+
+class StreamingDetector:
+    """Per-host adaptive baselines updated in O(1) per point, no training.
+
+    Each host keeps an exponentially weighted mean and variance per
+    feature and, with `seasonal`, the same per hour-of-week slot. A point
+    scores its z-score against the overall baseline, or the smaller of the
+    overall and seasonal z-scores once its slot has `seasonal_warmup`
+    samples, so a host that is busy every Monday morning stops alerting
+    for it. Only upward deviations count, like THRESHOLDS.
+
+    State lives in arrays indexed by a host -> row map, so a batch is
+    scored and folded in with a few vectorized operations. Until a host
+    has `warmup` samples it is learnt but never scored. Points far outside
+    a baseline are clipped before being folded into it, so a spike does not
+    drag the baseline up with it.
+    """
+
+    def __init__(
+        self,
+        feature_names: list[str],
+        alpha: float,
+        seasonal: bool = True,
+        seasonal_alpha: float = 0.01,
+        warmup: int = 30,
+        seasonal_warmup: int = 360,
+        min_std: float = 1.0,
+        clip: float = 3.0,
+    ):
+        self.feature_names = feature_names
+        self.alpha = alpha
+        self.seasonal = seasonal
+        self.seasonal_alpha = seasonal_alpha
+        self.warmup = warmup
+        self.seasonal_warmup = seasonal_warmup
+        self.min_std = min_std
+        self.clip = clip
+        self.index: dict[str, int] = {}
+        self.hosts: list[str] = []
+        self._allocate(0)
+
+    def _allocate(self, capacity: int):
+        n = len(self.feature_names)
+        slots = SLOTS_PER_WEEK if self.seasonal else 0
+        self.count = np.zeros(capacity, np.int64)
+        self.mean = np.zeros((capacity, n))
+        self.var = np.zeros((capacity, n))
+        # float32 keeps a host's week of slots at ~4 KB.
+        self.slot_count = np.zeros((capacity, slots), np.int32)
+        self.slot_mean = np.zeros((capacity, slots, n), np.float32)
+        self.slot_var = np.zeros((capacity, slots, n), np.float32)
+
+    def _grow(self, needed: int):
+        capacity = len(self.count)
+        if needed <= capacity:
+            return
+        old = (self.count, self.mean, self.var, self.slot_count, self.slot_mean, self.slot_var)
+        self._allocate(max(needed, capacity * 2, 64))
+        for new, current in zip(
+            (self.count, self.mean, self.var, self.slot_count, self.slot_mean, self.slot_var), old
+        ):
+            new[:capacity] = current
+
+    def rows(self, hosts: list[str]) -> np.ndarray:
+        for host in hosts:
+            if host not in self.index:
+                self.index[host] = len(self.hosts)
+                self.hosts.append(host)
+        self._grow(len(self.hosts))
+        return np.fromiter((self.index[host] for host in hosts), np.int64, len(hosts))
+
+    def score(self, hosts: list[str], timestamps: list[datetime], X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Score each row of X against its host's baseline, then learn it.
+
+        Rows must be in time order. Returns (z, expected): z-scores, NaN
+        while a host is warming up, and the baseline each was scored against.
+        """
+        rows = self.rows(hosts)
+        slots = np.fromiter((t.weekday() * 24 + t.hour for t in timestamps), np.int64, len(timestamps))
+        z = np.full(X.shape, np.nan)
+        expected = np.full(X.shape, np.nan)
+
+        # A batch usually holds one row per host; repeats go in later rounds
+        # so each host's rows are folded in one after another.
+        ranks = np.zeros(len(rows), np.int64)
+        seen: dict[int, int] = {}
+        for i, row in enumerate(rows.tolist()):
+            ranks[i] = seen.get(row, 0)
+            seen[row] = ranks[i] + 1
+        for rank in range(int(ranks.max(initial=-1)) + 1):
+            selected = ranks == rank
+            z[selected], expected[selected] = self._step(rows[selected], slots[selected], X[selected])
+        return z, expected
+
+    def _step(self, rows: np.ndarray, slots: np.ndarray, x: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        count = self.count[rows]
+        mean = self.mean[rows]
+        std = np.maximum(np.sqrt(self.var[rows]), self.min_std)
+        warm = (count >= self.warmup)[:, None]
+        with np.errstate(invalid="ignore"):
+            z = np.where(warm, (x - mean) / std, np.nan)
+        expected = mean.copy()
+
+        if self.seasonal:
+            slot_count = self.slot_count[rows, slots]
+            slot_mean = self.slot_mean[rows, slots].astype(float)
+            slot_std = np.maximum(np.sqrt(self.slot_var[rows, slots]), self.min_std)
+            slot_warm = (slot_count >= self.seasonal_warmup)[:, None]
+            seasonal_warm = slot_warm & warm
+            with np.errstate(invalid="ignore"):
+                z = np.where(seasonal_warm, np.fmin(z, (x - slot_mean) / slot_std), z)
+            expected = np.where(seasonal_warm, slot_mean, expected)
+
+        # Winsorize against the baseline before learning the point.
+        learn = np.where(warm, np.clip(x, mean - self.clip * std, mean + self.clip * std), x)
+        self.mean[rows], self.var[rows] = _ewm_update(mean, self.var[rows], learn, count, self.alpha)
+        self.count[rows] = count + 1
+        if self.seasonal:
+            # A slot is winsorized against its own baseline: clipped to the
+            # overall one, a regularly busy hour could never be learnt.
+            slot_learn = np.where(
+                slot_warm, np.clip(x, slot_mean - self.clip * slot_std, slot_mean + self.clip * slot_std), x
+            )
+            slot_mean, slot_var = _ewm_update(
+                self.slot_mean[rows, slots], self.slot_var[rows, slots], slot_learn, slot_count, self.seasonal_alpha
+            )
+            self.slot_mean[rows, slots] = slot_mean
+            self.slot_var[rows, slots] = slot_var
+            self.slot_count[rows, slots] = slot_count + 1
+        return z, expected
+
+    def levels(self, z: np.ndarray, warning: float, critical: float) -> np.ndarray:
+        with np.errstate(invalid="ignore"):
+            return (z >= warning).astype(np.int8) + (z >= critical)
+
+    def snapshot(self, hosts: Optional[list[str]] = None) -> dict[str, np.ndarray]:
+        """Copy the state of `hosts` (default all) into a dict of arrays."""
+        names = self.hosts if hosts is None else hosts
+        rows = np.fromiter((self.index[host] for host in names), np.int64, len(names))
+        return {
+            "version": np.array(CHECKPOINT_VERSION),
+            "seasonal": np.array(self.seasonal),
+            "feature_names": np.array(self.feature_names),
+            "hosts": np.array(names, dtype=str),
+            "count": self.count[rows],
+            "mean": self.mean[rows],
+            "var": self.var[rows],
+            "slot_count": self.slot_count[rows],
+            "slot_mean": self.slot_mean[rows],
+            "slot_var": self.slot_var[rows],
+        }
+
+    def restore(self, state: dict[str, np.ndarray]) -> int:
+        """Load a snapshot; returns the number of hosts restored, 0 if incompatible."""
+        if (
+            int(state["version"]) != CHECKPOINT_VERSION
+            or bool(state["seasonal"]) != self.seasonal
+            or list(state["feature_names"]) != self.feature_names
+        ):
+            return 0
+        hosts = [str(host) for host in state["hosts"]]
+        rows = self.rows(hosts)
+        self.count[rows] = state["count"]
+        self.mean[rows] = state["mean"]
+        self.var[rows] = state["var"]
+        self.slot_count[rows] = state["slot_count"]
+        self.slot_mean[rows] = state["slot_mean"]
+        self.slot_var[rows] = state["slot_var"]
+        return len(hosts)
+
+
+def _ewm_update(mean, var, x, count, alpha):
+    """One step of the exponentially weighted mean/variance recurrence.
+
+    The weight starts at 1/(n+1), an exact running mean and variance,
+    and settles at `alpha` once a baseline has 1/alpha samples. Missing
+    features (NaN) leave their baseline unchanged.
+    """
+    weight = np.maximum(alpha, 1.0 / (count + 1))[:, None]
+    present = ~np.isnan(x)
+    diff = np.where(present, x - mean, 0.0)
+    increment = weight * diff
+    return mean + increment, np.where(present, (1 - weight) * (var + diff * increment), var)
+
+
+def checkpoint_path(shard: int) -> str:
+    return os.path.join(MODEL_DIR, f"streaming-shard-{shard}.npz")
+
+
+def save_checkpoint(states: dict[int, dict[str, np.ndarray]]):
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    for shard, state in states.items():
+        path = checkpoint_path(shard)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **state)
+        os.replace(tmp_path, path)
+
+
+def snapshot_shards(shards: list[int]) -> dict[int, dict[str, np.ndarray]]:
+    """Per-shard copies of the state, cheap enough to take on the event loop.
+
+    Checkpoints are kept per shard rather than per process so they still
+    apply when WORKER_SHARDS or WORKER_PROCESSES change.
+    """
+    by_shard: dict[int, list[str]] = {shard: [] for shard in shards}
+    for host in baselines.hosts:
+        by_shard.setdefault(host_shard(host), []).append(host)
+    return {shard: baselines.snapshot(hosts) for shard, hosts in by_shard.items() if shard in shards}
+
+
+def load_checkpoints(shards: list[int]) -> int:
+    restored = 0
+    for shard in shards:
+        path = checkpoint_path(shard)
+        if not os.path.exists(path):
+            continue
+        try:
+            with np.load(path) as state:
+                restored += baselines.restore(dict(state))
+        except Exception as e:
+            print(f"Failed to load streaming checkpoint {path}: {e}")
+    return restored
+
+
+baselines = StreamingDetector(
+    FEATURE_NAMES,
+    alpha=STREAM_ALPHA,
+    seasonal=STREAM_SEASONAL,
+    min_std=STREAM_MIN_STD,
+)
+register_callback("nazar_streaming_hosts", "Hosts with a streaming baseline", lambda: len(baselines.hosts))
+
+
+# A stat_anomaly fires on the first anomalous row and resolves once every
+# feature has stayed below the warning z-score for STREAM_CLEAR_WINDOWS rows.
+stat_rule = Rule(METRIC_TYPE, STREAM_Z_WARNING, STREAM_Z_CRITICAL, clear_windows=STREAM_CLEAR_WINDOWS)
+stat_breaches = BreachTracker()
+
+
+async def check_streaming_anomalies(
+    metrics: list[Metric],
+    session: AsyncSession,
+) -> tuple[list[Alert], list[tuple[str, str]]]:
+    """Score a time-ordered batch, raising at most one alert per host.
+
+    Also returns the (host, METRIC_TYPE) keys whose anomaly cleared.
+    """
+    if not metrics:
+        return [], []
+
+    X = peak_values(metrics, baselines.feature_names)
+    timestamps = [as_utc(metric.timestamp) for metric in metrics]
+    z, expected = baselines.score([metric.host for metric in metrics], timestamps, X)
+    levels = baselines.levels(z, STREAM_Z_WARNING, STREAM_Z_CRITICAL)
+    scored = ~np.isnan(z).all(axis=1)
+    peaks = np.where(np.isnan(z), -np.inf, z).max(axis=1)
+
+    if alert_index.warm:
+        for host in {metric.host for metric in metrics}:
+            stat_breaches.sync((host, METRIC_TYPE), alert_index.is_open(host, METRIC_TYPE))
+
+    breaches: dict[tuple[str, str], tuple[int, int]] = {}
+    cleared: dict[tuple[str, str], None] = {}
+    for i in np.flatnonzero(scored):
+        key = (metrics[i].host, METRIC_TYPE)
+        level = stat_breaches.observe(key, stat_rule, peaks[i])
+        if level == CLEARED:
+            if breaches.pop(key, None) is None:
+                cleared[key] = None
+        elif level and key not in breaches:
+            cleared.pop(key, None)
+            # The feature furthest above its baseline describes the alert.
+            breaches[key] = (i, int(np.nanargmax(z[i])))
+    if breaches:
+        for key in await open_alert_keys(list(breaches), session):
+            breaches.pop(key, None)
+
+    alerts = []
+    for (host, metric_type), (i, j) in breaches.items():
+        message = (
+            f"{baselines.feature_names[j]} is {X[i, j]:.1f}% on {host}, "
+            f"{z[i, j]:.1f} std devs above its baseline of {expected[i, j]:.1f}%"
+        )
+        alerts.append(
+            Alert(
+                timestamp=datetime.now(timezone.utc),
+                host=host,
+                metric_type=metric_type,
+                severity=SEVERITIES[levels[i].max()],
+                message=message,
+                status="pending",
+            )
+        )
+    return alerts, list(cleared)
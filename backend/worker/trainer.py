@@ -0,0 +1,95 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+
+from shared import AsyncSessionLocal
+from shared.instrumentation import Counter, Histogram
+from .ml_detector import get_detector, registry, training_queue
+from .model_store import save_model
+
+TRAIN_SECONDS = Histogram(
+    "nazar_ml_train_seconds",
+    "Time spent per model training phase",
+    ("phase",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+LOAD_SECONDS = TRAIN_SECONDS.labels("load")
+FIT_SECONDS = TRAIN_SECONDS.labels("fit")
+SAVE_SECONDS = TRAIN_SECONDS.labels("save")
+TRAININGS = Counter("nazar_ml_trainings_total", "Model training attempts by outcome", ("result",))
+
+
+def fit_model(X: np.ndarray, contamination: float) -> IsolationForest:
+    model = IsolationForest(
+        contamination=contamination,
+        random_state=42,
+        n_estimators=100,
+    )
+    model.fit(X)
+    return model
+
+
+class ModelTrainer:
+    """Fits Isolation Forest models in a process pool, off the consumer path.
+
+    Model keys land on `training_queue` when their model is missing or stale.
+    Fitted models are persisted first and then swapped into the detector,
+    so scoring keeps using the previous model until the new one is ready.
+    """
+
+    def __init__(self, max_workers: int):
+        self._executor = ProcessPoolExecutor(
+            max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self._slots = asyncio.Semaphore(max_workers)
+        self._tasks: set[asyncio.Task] = set()
+
+    async def run(self):
+        while True:
+            key = await training_queue.get()
+            await self._slots.acquire()
+            task = asyncio.create_task(self._train(key))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _train(self, key: str):
+        detector = get_detector(key)
+        try:
+            with LOAD_SECONDS.time():
+                async with AsyncSessionLocal() as session:
+                    X = await detector.load_training_data(session, key)
+            if len(X) < detector.min_samples:
+                TRAININGS.labels("insufficient_data").inc()
+                return
+
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            with FIT_SECONDS.time():
+                model = await loop.run_in_executor(self._executor, fit_model, X, detector.contamination)
+            trained_at = datetime.now(timezone.utc)
+            with SAVE_SECONDS.time():
+                await loop.run_in_executor(None, save_model, key, model, trained_at, detector.feature_names)
+
+            detector.install(model, trained_at)
+            registry.resize(key)
+            TRAININGS.labels("ok").inc()
+            stats = registry.stats()
+            print(
+                f"Trained model for {key} on {len(X)} samples in {time.perf_counter() - started:.1f}s "
+                f"({stats['resident']} resident, {stats['bytes'] / 2**20:.1f} MiB)"
+            )
+        except Exception as e:
+            TRAININGS.labels("error").inc()
+            print(f"Failed to train model for {key}: {e}")
+        finally:
+            detector.training = False
+            self._slots.release()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
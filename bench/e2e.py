@@ -0,0 +1,422 @@
+"""End-to-end load test: synthetic fleet -> API -> RabbitMQ -> worker -> alerts.
+
+Drives the real pipeline of a running stack (docker-compose infrastructure,
+API and worker per the README Quick Start) with a synthetic fleet from
+bench/fleet.py. Every host reports once per --interval through
+POST /metrics (or /metrics/batch with --batch-size), and a fraction of
+hosts play an anomaly profile partway through the run. Meanwhile it:
+
+- times every ingest request from its scheduled send time (so a slow API
+  cannot hide its own backlog) and from when it was actually sent
+- samples the metrics queue depth from the RabbitMQ management API
+- polls GET /alerts and measures detection lag from the first anomalous
+  report to the alert, per profile, plus alerts raised on normal hosts
+- keeps --stream-clients dashboards on GET /stream and measures fan-out
+  latency from send to receipt and the fraction of rows each receives
+
+Results are written as JSON (default bench/results/) and can be checked
+against an earlier run with --compare, which exits 1 on a regression:
+
+    python bench/e2e.py --hosts 1000 --interval 10 --duration 120 --stream-clients 10
+    python bench/e2e.py --hosts 1000 --interval 10 --duration 120 --compare bench/results/baseline.json
+
+Hosts are named e2e-<run id>-NNNNN, so a run never collides with a pending
+alert of an earlier one and its rows are easy to find and delete.
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import httpx
+
+from fleet import PROFILES, make_fleet, parse_anomalies
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# (result path, which direction is better) checked by --compare.
+REGRESSION_CHECKS = [
+    ("ingest.rows_per_second", "higher"),
+    ("ingest.latency_ms.p50", "lower"),
+    ("ingest.latency_ms.p99", "lower"),
+    ("queue.max_depth", "lower"),
+    ("detection.detected_ratio", "higher"),
+    ("detection.lag_seconds.p50", "lower"),
+    ("detection.lag_seconds.p95", "lower"),
+    ("stream.latency_ms.p50", "lower"),
+    ("stream.latency_ms.p99", "lower"),
+    ("stream.delivered_ratio", "higher"),
+]
+
+
+def percentiles(values: list[float], scale: float = 1.0) -> Optional[dict]:
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def at(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * scale, 3)
+
+    return {"p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "max": round(ordered[-1] * scale, 3)}
+
+
+def row_key(host: str, timestamp: str) -> tuple[str, float]:
+    return host, datetime.fromisoformat(timestamp).timestamp()
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.run_id = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+        self.prefix = f"e2e-{self.run_id}"
+        reports_per_host = max(1, int(args.duration / args.interval))
+        self.fleet = make_fleet(args.hosts, self.prefix, parse_anomalies(args.anomalies), reports_per_host, args.seed)
+        self.started_wall = time.time()
+
+        self.requests = 0
+        self.rows_sent = 0
+        self.errors: dict[str, int] = {}
+        self.latencies: list[float] = []
+        self.service_times: list[float] = []
+        self.send_seconds = 0.0
+
+        # (host, timestamp) -> monotonic send time, for stream latency.
+        self.sent_at: dict[tuple[str, float], float] = {}
+        self.stream_latencies: list[float] = []
+        self.stream_received: list[int] = [0] * args.stream_clients
+
+        self.injected: dict[str, tuple[float, str]] = {}
+        self.detected: dict[str, float] = {}
+        self.normal_host_alerts = 0
+        self.depths: list[int] = []
+        self.depth_available = True
+
+    async def run(self) -> dict:
+        args = self.args
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=args.api_url, timeout=30, limits=limits) as client:
+            (await client.get("/health")).raise_for_status()
+
+            streams = [asyncio.create_task(self.stream_client(i)) for i in range(args.stream_clients)]
+            await asyncio.sleep(1 if streams else 0)
+            sampler = asyncio.create_task(self.sample_queue())
+            poller = asyncio.create_task(self.poll_alerts(client))
+
+            print(
+                f"Run {self.run_id}: {args.hosts} hosts every {args.interval:g}s "
+                f"({args.hosts / args.interval:,.0f} rows/s offered) for {args.duration:g}s, "
+                f"{len(streams)} stream client(s)"
+            )
+            await self.send(client)
+            drain_seconds = await self.drain()
+
+            for task in (sampler, poller, *streams):
+                task.cancel()
+            await asyncio.gather(sampler, poller, *streams, return_exceptions=True)
+            # One last look so alerts committed during the drain are counted.
+            await self.fetch_alerts(client)
+
+        return self.results(drain_seconds)
+
+    async def send(self, client: httpx.AsyncClient):
+        args = self.args
+        slots = asyncio.Semaphore(args.concurrency)
+        tasks: set[asyncio.Task] = set()
+        started = time.monotonic()
+        end = started + args.duration
+        # Hosts report on a fixed grid, spread evenly over the interval.
+        due = [(started + args.interval * i / len(self.fleet), i) for i in range(len(self.fleet))]
+        heapq.heapify(due)
+
+        while due[0][0] < end:
+            delay = due[0][0] - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            batch = []
+            scheduled = due[0][0]
+            while due[0][0] <= time.monotonic() and len(batch) < args.batch_size:
+                _, i = heapq.heapreplace(due, (due[0][0] + args.interval, due[0][1]))
+                host = self.fleet[i]
+                if host.anomalous and host.name not in self.injected:
+                    self.injected[host.name] = (time.time(), host.profile)
+                batch.append(host.report())
+
+            await slots.acquire()
+            task = asyncio.create_task(self.post(client, batch, scheduled, slots))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        await asyncio.gather(*tasks)
+        self.send_seconds = time.monotonic() - started
+
+    async def post(self, client: httpx.AsyncClient, rows: list[dict], scheduled: float, slots: asyncio.Semaphore):
+        started = time.monotonic()
+        for row in rows:
+            self.sent_at[row_key(row["host"], row["timestamp"])] = started
+        try:
+            if self.args.batch_size > 1:
+                response = await client.post("/metrics/batch", json=rows)
+            else:
+                response = await client.post("/metrics", json=rows[0])
+            if response.status_code >= 400:
+                self.errors[str(response.status_code)] = self.errors.get(str(response.status_code), 0) + 1
+                return
+        except httpx.HTTPError as e:
+            self.errors[type(e).__name__] = self.errors.get(type(e).__name__, 0) + 1
+            return
+        finally:
+            slots.release()
+
+        finished = time.monotonic()
+        self.requests += 1
+        self.rows_sent += len(rows)
+        self.latencies.append(finished - scheduled)
+        self.service_times.append(finished - started)
+
+    async def stream_client(self, index: int):
+        async with httpx.AsyncClient(base_url=self.args.api_url, timeout=httpx.Timeout(10, read=None)) as client:
+            async with client.stream("GET", "/stream") as response:
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    received = time.monotonic()
+                    row = json.loads(line[6:])
+                    if not row["host"].startswith(self.prefix):
+                        continue
+                    self.stream_received[index] += 1
+                    sent = self.sent_at.get(row_key(row["host"], row["timestamp"]))
+                    if sent is not None:
+                        self.stream_latencies.append(received - sent)
+
+    async def queue_depth(self, client: httpx.AsyncClient) -> Optional[int]:
+        if not self.depth_available:
+            return None
+        try:
+            response = await client.get("/api/queues/%2F", params={"columns": "name,messages"})
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            print(f"Queue depth unavailable from {self.args.rabbitmq_api}: {e}")
+            self.depth_available = False
+            return None
+        return sum(
+            queue.get("messages") or 0
+            for queue in response.json()
+            if queue["name"] == "metrics" or queue["name"].startswith("metrics.")
+        )
+
+    async def sample_queue(self):
+        auth = tuple(self.args.rabbitmq_auth.split(":", 1))
+        async with httpx.AsyncClient(base_url=self.args.rabbitmq_api, auth=auth, timeout=5) as client:
+            while True:
+                depth = await self.queue_depth(client)
+                if depth is None:
+                    return
+                self.depths.append(depth)
+                await asyncio.sleep(1)
+
+    async def poll_alerts(self, client: httpx.AsyncClient):
+        while True:
+            await asyncio.sleep(1)
+            try:
+                await self.fetch_alerts(client)
+            except httpx.HTTPError as e:
+                print(f"Failed to poll alerts: {e}")
+
+    async def fetch_alerts(self, client: httpx.AsyncClient):
+        """Page back through alerts newer than the run, recording first alerts per host."""
+        cursor = None
+        normal = set()
+        while True:
+            params = {"limit": 1000, "fields": "host,metric_type"}
+            if cursor:
+                params["cursor"] = cursor
+            response = await client.get("/alerts", params=params)
+            response.raise_for_status()
+            alerts = response.json()
+            for alert in alerts:
+                timestamp = datetime.fromisoformat(alert["timestamp"]).timestamp()
+                if timestamp < self.started_wall:
+                    return self._count_normal(normal)
+                if not alert["host"].startswith(self.prefix):
+                    continue
+                if alert["host"] in self.injected:
+                    first = self.detected.get(alert["host"])
+                    self.detected[alert["host"]] = timestamp if first is None else min(first, timestamp)
+                else:
+                    normal.add((alert["host"], alert["metric_type"], timestamp))
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                return self._count_normal(normal)
+
+    def _count_normal(self, normal: set):
+        self.normal_host_alerts = max(self.normal_host_alerts, len(normal))
+
+    async def drain(self) -> Optional[float]:
+        """Wait for the queues to empty and the injected anomalies to alert."""
+        started = time.monotonic()
+        deadline = started + self.args.drain_timeout
+        while time.monotonic() < deadline:
+            depth = self.depths[-1] if self.depths else 0
+            pending = [host for host in self.injected if host not in self.detected]
+            if depth == 0 and not pending:
+                return round(time.monotonic() - started, 3)
+            print(f"  draining: queue depth {depth:,}, {len(pending)} anomalies not alerted yet")
+            await asyncio.sleep(1)
+        return None
+
+    def results(self, drain_seconds: Optional[float]) -> dict:
+        args = self.args
+        lags = {host: self.detected[host] - sent for host, (sent, _) in self.injected.items() if host in self.detected}
+        by_profile = {}
+        for profile in PROFILES:
+            hosts = [host for host, (_, name) in self.injected.items() if name == profile]
+            if hosts:
+                profile_lags = [lags[host] for host in hosts if host in lags]
+                by_profile[profile] = {
+                    "injected": len(hosts),
+                    "detected": len(profile_lags),
+                    "lag_seconds": percentiles(profile_lags),
+                }
+
+        expected = self.rows_sent * len(self.stream_received)
+        return {
+            "run": {
+                "id": self.run_id,
+                "started": datetime.fromtimestamp(self.started_wall, timezone.utc).isoformat(),
+                "commit": git_commit(),
+                "args": vars(args),
+            },
+            "ingest": {
+                "requests": self.requests,
+                "rows": self.rows_sent,
+                "errors": self.errors,
+                "seconds": round(self.send_seconds, 3),
+                "offered_rows_per_second": round(args.hosts / args.interval, 1),
+                "rows_per_second": round(self.rows_sent / self.send_seconds, 1) if self.send_seconds else 0,
+                "latency_ms": percentiles(self.latencies, 1000),
+                "service_ms": percentiles(self.service_times, 1000),
+            },
+            "queue": {
+                "max_depth": max(self.depths) if self.depths else None,
+                "mean_depth": round(sum(self.depths) / len(self.depths), 1) if self.depths else None,
+                "drain_seconds": drain_seconds,
+            },
+            "detection": {
+                "injected": len(self.injected),
+                "detected": len(lags),
+                "detected_ratio": round(len(lags) / len(self.injected), 4) if self.injected else None,
+                "lag_seconds": percentiles(list(lags.values())),
+                "by_profile": by_profile,
+                "alerts_on_normal_hosts": self.normal_host_alerts,
+            },
+            "stream": {
+                "clients": len(self.stream_received),
+                "delivered_ratio": round(sum(self.stream_received) / expected, 4) if expected else None,
+                "latency_ms": percentiles(self.stream_latencies, 1000),
+            },
+        }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def lookup(results: dict, path: str):
+    value = results
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """Print each checked metric against the baseline; False if any regressed."""
+    ok = True
+    print(f"\nAgainst {baseline['run']['id']} ({baseline['run'].get('commit')}), tolerance {tolerance:.0%}:")
+    for path, better in REGRESSION_CHECKS:
+        old, new = lookup(baseline, path), lookup(results, path)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        worse = change < -tolerance if better == "higher" else change > tolerance
+        ok = ok and not worse
+        print(f"  {path:<28} {old:>12,.3f} -> {new:>12,.3f}  {change:+7.1%}{'  REGRESSION' if worse else ''}")
+    return ok
+
+
+def print_results(results: dict):
+    ingest, queue, detection, stream = (results[k] for k in ("ingest", "queue", "detection", "stream"))
+    print(
+        f"\nIngest: {ingest['rows']:,} rows in {ingest['requests']:,} requests, "
+        f"{ingest['rows_per_second']:,.0f} rows/s sustained (offered {ingest['offered_rows_per_second']:,.0f}), "
+        f"errors {ingest['errors'] or 0}"
+    )
+    print(f"  latency from schedule (ms): {ingest['latency_ms']}")
+    print(f"  service time (ms):          {ingest['service_ms']}")
+    print(f"Queue: max depth {queue['max_depth']}, mean {queue['mean_depth']}, drained {queue['drain_seconds']}s after sending")
+    print(
+        f"Detection: {detection['detected']}/{detection['injected']} anomalies alerted, "
+        f"lag (s) {detection['lag_seconds']}, {detection['alerts_on_normal_hosts']} alerts on normal hosts"
+    )
+    for profile, stats in detection["by_profile"].items():
+        print(f"  {profile:<10} {stats['detected']}/{stats['injected']}, lag (s) {stats['lag_seconds']}")
+    if stream["clients"]:
+        print(
+            f"Stream: {stream['clients']} clients received {stream['delivered_ratio']:.1%} of rows, "
+            f"latency (ms) {stream['latency_ms']}"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--api-url", default="http://localhost:8000")
+    parser.add_argument("--rabbitmq-api", default="http://localhost:15672")
+    parser.add_argument("--rabbitmq-auth", default="nazar:nazar123", help="user:password for the management API")
+    parser.add_argument("--hosts", type=int, default=500)
+    parser.add_argument("--interval", type=float, default=10, help="seconds between a host's reports")
+    parser.add_argument("--duration", type=float, default=60, help="seconds to send for")
+    parser.add_argument("--anomalies", default="spike=0.02,leak=0.01,disk_fill=0.01", help="profile=fraction,...")
+    parser.add_argument("--batch-size", type=int, default=1, help=">1 sends due reports through /metrics/batch")
+    parser.add_argument("--concurrency", type=int, default=50, help="max requests in flight")
+    parser.add_argument("--stream-clients", type=int, default=5)
+    parser.add_argument("--drain-timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="results file (default bench/results/e2e-<run id>.json)")
+    parser.add_argument("--compare", help="earlier results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative change before a regression")
+    args = parser.parse_args()
+
+    test = LoadTest(args)
+    results = await test.run()
+    print_results(results)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"e2e-{test.run_id}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+"""Synthetic agent fleet: per-host baselines, noise and injected anomalies.
+
+Used by bench/e2e.py; can also print sample reports on its own:
+
+    python bench/fleet.py --hosts 5 --anomalies spike=0.4,leak=0.4 --reports 20
+"""
+import argparse
+import json
+import math
+import random
+from datetime import datetime, timezone
+from typing import Optional
+
+# Each profile pushes one metric past its critical threshold. `ramp` is the
+# number of reports taken to get there, `hold` how long it stays.
+PROFILES = {
+    "spike": {"metric": "cpu", "peak": 97.0, "ramp": 0, "hold": 6},
+    "leak": {"metric": "memory", "peak": 96.0, "ramp": 12, "hold": 6},
+    "disk_fill": {"metric": "disk", "peak": 97.0, "ramp": 6, "hold": 12},
+}
+
+
+def parse_anomalies(spec: str) -> dict[str, float]:
+    """Parse "spike=0.02,leak=0.01" into {profile: fraction of hosts}."""
+    mix = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, fraction = item.partition("=")
+        if name not in PROFILES:
+            raise ValueError(f"Unknown anomaly profile {name!r}, expected one of {', '.join(PROFILES)}")
+        mix[name] = float(fraction)
+    if sum(mix.values()) > 1:
+        raise ValueError("Anomaly fractions add up to more than 1")
+    return mix
+
+
+class SyntheticHost:
+    def __init__(self, name: str, rng: random.Random, profile: Optional[str] = None, start_at: int = 0):
+        self.name = name
+        self.rng = rng
+        self.profile = profile
+        # Report index at which the anomaly begins, when there is one.
+        self.start_at = start_at
+        self.reports = 0
+        self.base = {"cpu": rng.uniform(5, 45), "memory": rng.uniform(25, 60), "disk": rng.uniform(20, 65)}
+        self.amplitude = rng.uniform(2, 15)
+        self.phase = rng.uniform(0, 2 * math.pi)
+        self.network = [rng.randint(0, 10**12), rng.randint(0, 10**12)]
+
+    @property
+    def anomalous(self) -> bool:
+        """Whether the report about to be generated is part of the anomaly."""
+        if self.profile is None:
+            return False
+        spec = PROFILES[self.profile]
+        return self.start_at <= self.reports < self.start_at + spec["ramp"] + spec["hold"]
+
+    def report(self, timestamp: Optional[datetime] = None) -> dict:
+        values = {
+            "cpu": self.base["cpu"] + self.amplitude * math.sin(self.phase + self.reports / 30),
+            "memory": self.base["memory"],
+            "disk": self.base["disk"],
+        }
+        if self.anomalous:
+            spec = PROFILES[self.profile]
+            progress = min(1.0, (self.reports - self.start_at + 1) / (spec["ramp"] + 1))
+            metric = spec["metric"]
+            values[metric] += (spec["peak"] - values[metric]) * progress
+
+        row = {"host": self.name, "timestamp": (timestamp or datetime.now(timezone.utc)).isoformat()}
+        for prefix, value in values.items():
+            noise = 0.0 if self.anomalous and prefix == PROFILES[self.profile]["metric"] else 1.5
+            average = min(100.0, max(0.0, value + self.rng.gauss(0, noise)))
+            row[f"{prefix}_percent"] = round(average, 2)
+            row[f"{prefix}_min"] = round(max(0.0, average - self.rng.uniform(0, noise * 2)), 2)
+            row[f"{prefix}_max"] = round(min(100.0, average + self.rng.uniform(0, noise * 2)), 2)
+        self.network[0] += self.rng.randint(10**4, 10**7)
+        self.network[1] += self.rng.randint(10**4, 10**7)
+        row["network_in"], row["network_out"] = self.network
+
+        self.reports += 1
+        return row
+
+
+def make_fleet(
+    count: int,
+    prefix: str,
+    anomalies: dict[str, float],
+    reports_per_host: int,
+    seed: int = 0,
+) -> list[SyntheticHost]:
+    """`count` hosts; the anomalous ones start their anomaly in the middle half of the run."""
+    rng = random.Random(seed)
+    profiles: list[Optional[str]] = []
+    for name, fraction in anomalies.items():
+        profiles.extend([name] * round(count * fraction))
+    profiles.extend([None] * (count - len(profiles)))
+    rng.shuffle(profiles)
+
+    hosts = []
+    for i, profile in enumerate(profiles):
+        start_at = 0
+        if profile:
+            # Leave room for the whole ramp to play out before the run ends.
+            length = PROFILES[profile]["ramp"] + 1
+            low = reports_per_host // 4
+            start_at = rng.randint(low, max(low, min(reports_per_host * 3 // 4, reports_per_host - length)))
+        hosts.append(SyntheticHost(f"{prefix}-{i:05d}", random.Random(rng.random()), profile, start_at))
+    return hosts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=3)
+    parser.add_argument("--reports", type=int, default=10, help="reports per host")
+    parser.add_argument("--anomalies", default="spike=0.34", help="profile=fraction,...")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fleet = make_fleet(args.hosts, "fleet", parse_anomalies(args.anomalies), args.reports, args.seed)
+    for _ in range(args.reports):
+        for host in fleet:
+            print(json.dumps({"anomalous": host.anomalous, "profile": host.profile, **host.report()}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Compare ingest throughput of POST /metrics against POST /metrics/batch.
+
+Run against a live API (see README Quick Start):
+
+    python bench/ingest_batch.py --rows 20000 --batch-size 500
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+
+def synthetic_rows(count: int, hosts: int, prefix: str) -> list[dict]:
+    start = datetime.now(timezone.utc) - timedelta(seconds=count)
+    rows = []
+    for i in range(count):
+        cpu = random.uniform(5, 60)
+        mem = random.uniform(30, 70)
+        disk = random.uniform(40, 60)
+        rows.append({
+            "host": f"{prefix}-{i % hosts:04d}",
+            # Spread timestamps so every (host, timestamp) key is unique.
+            "timestamp": (start + timedelta(milliseconds=i)).isoformat(),
+            "cpu_percent": cpu, "cpu_min": cpu * 0.8, "cpu_max": cpu * 1.2,
+            "memory_percent": mem, "memory_min": mem - 1, "memory_max": mem + 1,
+            "disk_percent": disk, "disk_min": disk, "disk_max": disk,
+            "network_in": random.randint(0, 10**9),
+            "network_out": random.randint(0, 10**9),
+        })
+    return rows
+
+
+async def run_single(client: httpx.AsyncClient, rows: list[dict], concurrency: int) -> float:
+    queue = asyncio.Queue()
+    for row in rows:
+        queue.put_nowait(row)
+
+    async def worker():
+        while not queue.empty():
+            row = queue.get_nowait()
+            response = await client.post("/metrics", json=row)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started
+
+
+async def run_batch(client: httpx.AsyncClient, rows: list[dict], batch_size: int, ndjson: bool) -> float:
+    started = time.perf_counter()
+    for i in range(0, len(rows), batch_size):
+        chunk = rows[i:i + batch_size]
+        if ndjson:
+            response = await client.post(
+                "/metrics/batch",
+                content="\n".join(json.dumps(row) for row in chunk),
+                headers={"Content-Type": "application/x-ndjson"},
+            )
+        else:
+            response = await client.post("/metrics/batch", json=chunk)
+        response.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--api-url", default="http://localhost:8000")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--hosts", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--ndjson", action="store_true", help="send batches as NDJSON")
+    args = parser.parse_args()
+
+    async with httpx.AsyncClient(base_url=args.api_url, timeout=60) as client:
+        single = await run_single(client, synthetic_rows(args.rows, args.hosts, "bench-single"), args.concurrency)
+        batch = await run_batch(client, synthetic_rows(args.rows, args.hosts, "bench-batch"), args.batch_size, args.ndjson)
+
+    print(f"rows:        {args.rows} across {args.hosts} hosts")
+    print(f"single-row:  {args.rows / single:10.0f} rows/s  ({single:.2f}s, concurrency={args.concurrency})")
+    print(f"batch:       {args.rows / batch:10.0f} rows/s  ({batch:.2f}s, batch_size={args.batch_size})")
+    print(f"speedup:     {single / batch:10.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
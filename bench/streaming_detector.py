@@ -0,0 +1,217 @@
+"""Compare the streaming baselines with the Isolation Forest path on replayed data.
+
+Replays each host's history in time order, one row per host per step as
+the worker sees it, through both detectors:
+
+- streaming: StreamingDetector.score on every step, learning as it goes
+- isolation forest: fit_model on the preceding ML_TRAINING_WINDOW_HOURS,
+  refitted every --retrain-hours, then score_samples on each step
+
+Only the last --eval-days are scored for quality. By default the history
+is synthetic (daily and weekly cycles, noise, slow drifts) with labelled
+anomalies injected into the evaluation period, so precision and recall
+are known. With --from-db the given hosts' stored metrics are replayed
+instead; there are no labels then, so only cost and alert rates are shown.
+
+    python bench/streaming_detector.py --hosts 20 --days 14
+    cd backend && python ../bench/streaming_detector.py --from-db web-1 web-2 --days 14
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from shared.config import (  # noqa: E402
+    ML_TRAINING_WINDOW_HOURS,
+    ML_MAX_TRAINING_SAMPLES,
+    STREAM_ALPHA,
+    STREAM_Z_WARNING,
+    STREAM_Z_CRITICAL,
+    STREAM_SEASONAL,
+    STREAM_MIN_STD,
+)
+from worker.streaming_detector import FEATURE_NAMES, StreamingDetector  # noqa: E402
+from worker.trainer import fit_model  # noqa: E402
+
+SCORE_SAMPLES = 20
+
+
+def synthetic_history(hosts: int, steps: int, interval: float, eval_steps: int, seed: int):
+    """(timestamps, values (steps, hosts, features), labels (steps, hosts))."""
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    timestamps = [start + timedelta(seconds=interval * i) for i in range(steps)]
+    hours = np.arange(steps) * interval / 3600
+    weekday = (hours // 24) % 7 < 5
+
+    values = np.empty((steps, hosts, len(FEATURE_NAMES)))
+    for h in range(hosts):
+        base, amplitude = rng.uniform(10, 40), rng.uniform(5, 25)
+        daily = np.clip(np.sin((hours % 24 - 8) / 24 * 2 * np.pi), 0, None)
+        cpu = base + amplitude * daily * np.where(weekday, 1, 0.3) + rng.normal(0, 3, steps)
+        memory = rng.uniform(30, 60) + np.cumsum(rng.normal(0, 0.05, steps)) + rng.normal(0, 1, steps)
+        disk = rng.uniform(20, 60) + hours * rng.uniform(0, 0.02) + rng.normal(0, 0.2, steps)
+        values[:, h] = np.column_stack([cpu, memory, disk])
+
+    # Injected anomalies: a few runs of 3-15 steps per host, on one feature each.
+    labels = np.zeros((steps, hosts), bool)
+    for h in range(hosts):
+        for _ in range(rng.integers(3, 8)):
+            begin = rng.integers(steps - eval_steps, steps - 15)
+            length = rng.integers(3, 16)
+            feature = rng.integers(0, len(FEATURE_NAMES))
+            values[begin:begin + length, h, feature] += rng.uniform(20, 40)
+            labels[begin:begin + length, h] = True
+
+    return timestamps, np.clip(values, 0, 100), labels
+
+
+async def db_history(hosts: list[str], days: float, interval: float):
+    """Stored peak values resampled onto a common grid (NaN where missing)."""
+    from sqlalchemy import select
+    from shared import AsyncSessionLocal, Metric
+    from worker.features import peak_values
+
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    steps = int(days * 86400 / interval)
+    timestamps = [since + timedelta(seconds=interval * i) for i in range(steps)]
+    values = np.full((steps, len(hosts), len(FEATURE_NAMES)), np.nan)
+    async with AsyncSessionLocal() as session:
+        for h, host in enumerate(hosts):
+            result = await session.execute(
+                select(Metric).where(Metric.host == host, Metric.timestamp >= since).order_by(Metric.timestamp)
+            )
+            metrics = result.scalars().all()
+            if not metrics:
+                print(f"No metrics for {host} in the last {days:g} days")
+                continue
+            slots = [min(steps - 1, int((m.timestamp - since).total_seconds() // interval)) for m in metrics]
+            values[slots, h] = peak_values(metrics, FEATURE_NAMES)
+    return timestamps, values, None
+
+
+def run_streaming(timestamps, values, hosts: list[str]) -> tuple[np.ndarray, float]:
+    detector = StreamingDetector(FEATURE_NAMES, alpha=STREAM_ALPHA, seasonal=STREAM_SEASONAL, min_std=STREAM_MIN_STD)
+    flags = np.zeros(values.shape[:2], np.int8)
+    elapsed = 0.0
+    for step, timestamp in enumerate(timestamps):
+        present = ~np.isnan(values[step]).all(axis=1)
+        if not present.any():
+            continue
+        batch_hosts = [host for host, ok in zip(hosts, present) if ok]
+        started = time.perf_counter()
+        z, _ = detector.score(batch_hosts, [timestamp] * len(batch_hosts), values[step][present])
+        levels = detector.levels(z, STREAM_Z_WARNING, STREAM_Z_CRITICAL).max(axis=1)
+        elapsed += time.perf_counter() - started
+        flags[step, present] = levels
+    return flags, elapsed
+
+
+def run_isolation_forest(values, interval: float, eval_start: int, retrain_hours: float):
+    window = int(ML_TRAINING_WINDOW_HOURS * 3600 / interval)
+    retrain = max(1, int(retrain_hours * 3600 / interval))
+    flags = np.zeros(values.shape[:2], np.int8)
+    fit_seconds = score_seconds = 0.0
+    fits = scored = 0
+    for h in range(values.shape[1]):
+        for begin in range(eval_start, values.shape[0], retrain):
+            history = values[max(0, begin - window):begin, h]
+            history = history[~np.isnan(history).any(axis=1)][-ML_MAX_TRAINING_SAMPLES:]
+            if len(history) < 50:
+                continue
+            started = time.perf_counter()
+            model = fit_model(history, contamination=0.05)
+            fit_seconds += time.perf_counter() - started
+            fits += 1
+
+            X = values[begin:begin + retrain, h]
+            complete = ~np.isnan(X).any(axis=1)
+            flags[begin:begin + retrain, h][complete] = model.score_samples(X[complete]) < model.offset_
+
+            # A worker batch usually holds one row per host, so production
+            # scores one row per call; time a few calls that way.
+            for x in X[complete][:SCORE_SAMPLES]:
+                started = time.perf_counter()
+                model.score_samples(x.reshape(1, -1))
+                score_seconds += time.perf_counter() - started
+                scored += 1
+    return flags, fit_seconds, score_seconds / max(scored, 1), fits
+
+
+def quality(flags: np.ndarray, labels: Optional[np.ndarray], eval_start: int, interval: float) -> str:
+    flags, hosts = flags[eval_start:] > 0, flags.shape[1]
+    host_days = hosts * flags.shape[0] * interval / 86400
+    # An alert is a run of flagged steps; a pending alert would cover the rest of it.
+    alerts = int((flags[1:] & ~flags[:-1]).sum() + flags[0].sum())
+    line = f"{alerts / host_days:7.1f} alerts/host-day"
+    if labels is None:
+        return line
+
+    labels = labels[eval_start:]
+    starts = labels & ~np.vstack([np.zeros((1, hosts), bool), labels[:-1]])
+    events = detected = 0
+    for step, host in zip(*np.nonzero(starts)):
+        end = step
+        while end < len(labels) and labels[end, host]:
+            end += 1
+        events += 1
+        detected += bool(flags[step:end, host].any())
+    precision = (flags & labels).sum() / max(flags.sum(), 1)
+    false_flags = flags & ~labels
+    false_alerts = int((false_flags[1:] & ~false_flags[:-1]).sum() + false_flags[0].sum())
+    return (
+        f"{line}, point precision {precision:6.1%}, event recall {detected / max(events, 1):6.1%} "
+        f"({detected}/{events}), {false_alerts / host_days:.1f} false alerts/host-day"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--days", type=float, default=14)
+    parser.add_argument("--eval-days", type=float, default=7)
+    parser.add_argument("--interval", type=float, default=60, help="seconds between rows")
+    parser.add_argument("--retrain-hours", type=float, default=24, help="isolation forest refit period")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--from-db", nargs="+", metavar="HOST", help="replay these hosts' stored metrics")
+    args = parser.parse_args()
+
+    steps = int(args.days * 86400 / args.interval)
+    eval_steps = int(args.eval_days * 86400 / args.interval)
+    if args.from_db:
+        hosts = args.from_db
+        timestamps, values, labels = asyncio.run(db_history(hosts, args.days, args.interval))
+    else:
+        hosts = [f"host-{h:03d}" for h in range(args.hosts)]
+        timestamps, values, labels = synthetic_history(args.hosts, steps, args.interval, eval_steps, args.seed)
+    eval_start = len(timestamps) - eval_steps
+    points = int((~np.isnan(values).all(axis=2)).sum())
+    print(f"Replaying {points:,} rows for {len(hosts)} hosts, scoring the last {args.eval_days:g} days")
+
+    stream_flags, stream_seconds = run_streaming(timestamps, values, hosts)
+    print(
+        f"\nstreaming         {stream_seconds / points * 1e6:8.1f} µs/row (score + update), "
+        f"state {STREAM_SEASONAL and 'with' or 'without'} seasonal slots"
+    )
+    print(f"  {quality(stream_flags, labels, eval_start, args.interval)}")
+
+    forest_flags, fit_seconds, row_seconds, fits = run_isolation_forest(
+        values, args.interval, eval_start, args.retrain_hours
+    )
+    print(
+        f"\nisolation forest  {row_seconds * 1e6:8.1f} µs/row (score), "
+        f"{fit_seconds / max(fits, 1):.2f} s/fit over {fits} fits "
+        f"(= {fit_seconds / max(fits, 1) * 24 / args.retrain_hours:.1f} s/host/day refitting)"
+    )
+    print(f"  {quality(forest_flags, labels, eval_start, args.interval)}")
+
+
+if __name__ == "__main__":
+    main()
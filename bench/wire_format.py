@@ -0,0 +1,99 @@
+"""Compare API-side parse/validate cost of JSON and msgpack metric payloads.
+
+Runs in-process, no API or database needed. For each batch size, encodes
+agent-shaped reports the way the agent does and times what the API does
+with the body before it touches the database:
+
+    python bench/wire_format.py --sizes 1 10 100 1000
+"""
+import argparse
+import gzip
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+sys.path.insert(0, os.path.join(ROOT, "agent"))
+
+from api.main import parse_metric_batch  # noqa: E402
+from api.schemas import MetricCreate  # noqa: E402
+from wire import encode_json, encode_msgpack  # noqa: E402
+
+
+def synthetic_reports(count: int, samples: int) -> list[dict]:
+    start = datetime.now(timezone.utc) - timedelta(seconds=10 * count)
+    reports = []
+    for i in range(count):
+        report = {
+            "host": f"host-{i % 100:04d}",
+            "timestamp": (start + timedelta(seconds=10 * i)).isoformat(),
+            "network_in": random.randint(0, 10**12),
+            "network_out": random.randint(0, 10**12),
+            "network_in_rate": random.uniform(0, 10**7),
+            "network_out_rate": random.uniform(0, 10**7),
+        }
+        for prefix in ("cpu", "memory", "disk"):
+            value = random.uniform(0, 100)
+            report[f"{prefix}_percent"] = value
+            report[f"{prefix}_min"] = value * 0.9
+            report[f"{prefix}_max"] = value * 1.1
+            report[f"{prefix}_stddev"] = random.uniform(0, 5)
+            for q in (50, 95, 99):
+                report[f"{prefix}_p{q}"] = value
+        if samples:
+            report["samples"] = [
+                {"name": "cpu.core.percent", "labels": {"core": str(core)}, "value": random.uniform(0, 100)}
+                for core in range(samples)
+            ]
+        reports.append(report)
+    return reports
+
+
+def time_call(fn, min_seconds: float) -> float:
+    """Median seconds per call over repeated runs lasting at least `min_seconds`."""
+    timings = []
+    deadline = time.perf_counter() + min_seconds
+    while time.perf_counter() < deadline or len(timings) < 5:
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--samples", type=int, default=0, help="per-core samples per report")
+    parser.add_argument("--seconds", type=float, default=1.0, help="time spent per measurement")
+    args = parser.parse_args()
+
+    print(f"{'batch':>6} {'format':<22} {'bytes':>10} {'gzip':>10} {'us/batch':>10} {'us/row':>8} {'speedup':>8}")
+    for size in args.sizes:
+        reports = synthetic_reports(size, args.samples)
+        cases = []
+
+        if size == 1:
+            body, _ = encode_json(reports[0:1])
+            single = body[1:-1]  # the bare object POST /metrics receives
+            cases.append(("json POST /metrics", single, lambda: MetricCreate.model_validate_json(single)))
+
+        for name, encode in (("json /metrics/batch", encode_json), ("msgpack /metrics/batch", encode_msgpack)):
+            body, content_type = encode(reports)
+            cases.append((name, body, lambda body=body, ct=content_type: parse_metric_batch(body, ct)))
+
+        baseline = None
+        for name, body, fn in cases:
+            seconds = time_call(fn, args.seconds)
+            baseline = baseline or seconds
+            print(
+                f"{size:>6} {name:<22} {len(body):>10} {len(gzip.compress(body, 5)):>10} "
+                f"{seconds * 1e6:>10.1f} {seconds * 1e6 / size:>8.2f} {baseline / seconds:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
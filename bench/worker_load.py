@@ -0,0 +1,134 @@
+"""Load the detection worker(s) with synthetic metrics and measure throughput and lag.
+
+Publishes full-payload messages straight to the metrics queue(s), sharded
+the same way the API does, and interleaves "probe" rows whose CPU is high
+enough to raise an alert. A probe's end-to-end lag is the time from
+publishing it to its alert being committed. Throughput is the rows drained
+from the queues per second.
+
+Run with the worker(s) started and the same METRICS_SHARDS as the worker.
+Probe alerts are deleted afterwards; leave SLACK_WEBHOOK_URL unset on the
+worker so they are not posted to Slack:
+
+    cd backend && python ../bench/worker_load.py --rows 100000 --hosts 1000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from sqlalchemy import delete, select  # noqa: E402
+
+from shared import AsyncSessionLocal, Alert, get_channel, publish_metrics, shard_queue_name  # noqa: E402
+from shared.config import METRICS_SHARDS  # noqa: E402
+from shared.rabbitmq import close_connection  # noqa: E402
+
+
+def synthetic_row(host: str, cpu: float) -> dict:
+    mem = random.uniform(30, 60)
+    disk = random.uniform(40, 60)
+    return {
+        "host": host,
+        "timestamp": datetime.now(timezone.utc),
+        "cpu_percent": cpu, "cpu_min": cpu * 0.8, "cpu_max": cpu,
+        "memory_percent": mem, "memory_min": mem - 1, "memory_max": mem + 1,
+        "disk_percent": disk, "disk_min": disk, "disk_max": disk,
+        "network_in": random.randint(0, 10**9),
+        "network_out": random.randint(0, 10**9),
+    }
+
+
+async def queue_depth() -> int:
+    channel = await get_channel()
+    depth = 0
+    for shard in range(METRICS_SHARDS):
+        queue = await channel.declare_queue(shard_queue_name(shard), passive=True)
+        depth += queue.declaration_result.message_count
+    return depth
+
+
+async def publish(args, probes: dict[str, float]) -> float:
+    """Publish the synthetic load; returns when the last message was sent."""
+    prefix = f"loadgen-probe-{int(time.time())}"
+    next_probe = time.monotonic()
+    started = time.monotonic()
+
+    for i in range(0, args.rows, args.rows_per_message):
+        rows = [
+            synthetic_row(f"loadgen-{(i + j) % args.hosts:05d}", random.uniform(5, 60))
+            for j in range(min(args.rows_per_message, args.rows - i))
+        ]
+        now = time.monotonic()
+        if now >= next_probe:
+            host = f"{prefix}-{len(probes)}"
+            rows.append(synthetic_row(host, 99.0))
+            probes[host] = time.time()
+            next_probe = now + args.probe_interval
+
+        await publish_metrics(rows)
+        if args.rate:
+            await asyncio.sleep(max(0.0, started + (i + len(rows)) / args.rate - time.monotonic()))
+
+    return time.monotonic()
+
+
+async def probe_lags(probes: dict[str, float]) -> dict[str, float]:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(Alert.host, Alert.timestamp).where(Alert.host.in_(list(probes)))
+        )
+        return {host: timestamp.timestamp() - probes[host] for host, timestamp in result.all()}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--rows-per-message", type=int, default=10)
+    parser.add_argument("--hosts", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=0, help="rows/s to publish (0 = as fast as possible)")
+    parser.add_argument("--probe-interval", type=float, default=0.5, help="seconds between lag probes")
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    print(f"Publishing {args.rows:,} rows for {args.hosts} hosts over {METRICS_SHARDS} shard(s)...")
+    probes: dict[str, float] = {}
+    started = time.monotonic()
+    published = await publish(args, probes)
+    print(f"Published in {published - started:.1f}s ({args.rows / (published - started):,.0f} rows/s)")
+
+    lags: dict[str, float] = {}
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline:
+        depth = await queue_depth()
+        lags = await probe_lags(probes)
+        if depth == 0 and len(lags) == len(probes):
+            break
+        print(f"  backlog {depth:,} messages, {len(lags)}/{len(probes)} probes alerted")
+        await asyncio.sleep(1)
+    drained = time.monotonic()
+
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(Alert).where(Alert.host.in_(list(probes))))
+        await session.commit()
+    await close_connection()
+
+    print(f"\nDrained in {drained - started:.1f}s: {args.rows / (drained - started):,.0f} rows/s end to end")
+    if len(lags) < len(probes):
+        print(f"Timed out: only {len(lags)} of {len(probes)} probes raised an alert")
+    if lags:
+        values = sorted(lags.values())
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        print(
+            f"Lag over {len(values)} probes: p50 {statistics.median(values) * 1000:.0f} ms, "
+            f"p95 {p95 * 1000:.0f} ms, max {values[-1] * 1000:.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())